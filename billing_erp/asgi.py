@@ -3,6 +3,14 @@ ASGI config for billing_erp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The report views (statements, customer detail, customer list) are async and
+use the async ORM, so under an ASGI server one worker keeps serving while a
+long statement is waiting on the database:
+
+    gunicorn billing_erp.asgi:application -k uvicorn.workers.UvicornWorker -w 2
+
+Compare against the WSGI deployment with ``manage.py bench_concurrency``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -2,6 +2,7 @@
 Django settings for billing_erp project.
 """
 
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,8 +39,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bills.profiling.ProfilerMiddleware',     # staff only: ?_profile=1
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bills.replica.RecentWritesMiddleware',   # only active when a replica is configured
 ]
 
 # -----------------------------
@@ -75,10 +78,92 @@ WSGI_APPLICATION = 'billing_erp.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('BILLING_DB_PATH', BASE_DIR / 'db.sqlite3'),   # desktop.py sets this when packaged
     }
 }
 
+# Read replica for report views (bills/replica.py). Locally: a SQLite snapshot
+# refreshed by `manage.py refresh_replica`. With PostgreSQL/MySQL point this
+# alias at the standby instead.
+REPLICA_ALIAS = 'replica'
+if os.environ.get('BILLING_REPLICA_PATH'):
+    DATABASES[REPLICA_ALIAS] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['BILLING_REPLICA_PATH'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['bills.replica.ReplicaRouter']
+REPLICA_MAX_STALENESS = 15 * 60    # older than this: reports read the primary
+REPLICA_FRESHNESS_TTL = 1.0        # seconds a freshness reading is reused
+REPLICA_ASSUMED_LAG = 5            # engines without a lag query
+
+
+# -----------------------------
+# CACHE (statements / customer detail)
+# -----------------------------
+# locmem is per process; BILLING_CACHE=file shares entries between gunicorn workers.
+BILLING_CACHE = os.environ.get('BILLING_CACHE', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ledger': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'ledger',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    } if BILLING_CACHE == 'file' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ledger',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+LEDGER_CACHE_ALIAS = 'ledger'
+LEDGER_CACHE_TIMEOUT = 60 * 60
+
+# Row partials must render from prefetched data; in DEBUG a lazy query raises (bills/query_guard.py)
+TEMPLATE_QUERY_GUARD = DEBUG
+
+# Return (RK) lines per printed page on the side-by-side invoice view
+PRINT_RETURNS_PER_PAGE = 40
+
+# Bills per page on the bill register (keyset pages; any depth costs the same)
+REGISTER_PAGE_SIZE = 100
+
+
+# -----------------------------
+# BACKUPS (manage.py backup; bills/backup.py)
+# -----------------------------
+BACKUP_DIR = os.environ.get('BILLING_BACKUP_DIR', BASE_DIR / 'backups')
+BACKUP_COMPRESSION = 'auto'      # zstd if the zstandard package is installed, else gzip
+BACKUP_KEEP = 7                  # chains (full + its deltas) kept on disk
+BACKUP_FULL_EVERY = 24           # deltas before the next full snapshot
+BACKUP_PAGES_PER_STEP = 256      # pages copied per step; the source is unlocked between steps
+BACKUP_STEP_SLEEP = 0.005        # seconds between steps
+BACKUP_MAX_RESTARTS = 3          # then the copy finishes in one step
+
+
+# -----------------------------
+# OFFLINE POS SYNC (manage.py sync_terminal; bills/sync.py)
+# -----------------------------
+SYNC_TOKEN = os.environ.get('BILLING_SYNC_TOKEN', '')             # shared secret; blank = sync endpoints off
+SYNC_TERMINAL_ID = os.environ.get('BILLING_TERMINAL_ID', '')      # set on terminals only, e.g. 'counter-2'
+SYNC_SERVER_URL = os.environ.get('BILLING_SYNC_URL', '')          # central server, e.g. http://10.0.0.5:8000
+SYNC_BATCH = 2000                # change-log entries per pull/push request
+SYNC_BLOCK_SIZE = 500            # bill numbers reserved per block
+SYNC_BLOCK_LOW_WATER = 250       # reserve another block when fewer numbers are left
+SYNC_TIMEOUT = 60                # seconds per request
+
+
+# -----------------------------
+# REQUEST PROFILER (bills/profiling.py; staff add ?_profile=1 or an X-Profile: 1 header)
+# -----------------------------
+PROFILER_ENABLED = True
+PROFILER_INTERVAL = 0.005        # seconds between stack samples
+PROFILER_MAX_SECONDS = 60        # stop sampling a request after this long
+PROFILER_MAX_PER_MINUTE = 6      # profiled requests per process; the rest run unprofiled
+PROFILER_KEEP = 200              # newest profiles kept
+
 
 # -----------------------------
 # PASSWORD VALIDATION
@@ -119,3 +204,52 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = '/login/'                 # Redirect here if not logged in
 LOGIN_REDIRECT_URL = '/'              # After successful login
 LOGOUT_REDIRECT_URL = '/login/'       # After logout
+
+
+# -----------------------------
+# BACKGROUND JOBS (manage.py run_worker)
+# -----------------------------
+JOB_RESULTS_DIR = BASE_DIR / 'job_results'   # exported CSV / PDF files
+JOB_RETRY_BASE_SECONDS = 30                  # retry after 30s, 60s, 120s ...
+JOB_LOCK_TIMEOUT = 60 * 60                   # no heartbeat for this long = dead worker
+JOB_HEARTBEAT_SECONDS = 60                   # run_worker renews the locks of its running jobs
+
+
+# -----------------------------
+# PRODUCT LOOKUP (bills/catalog.py)
+# -----------------------------
+PRODUCT_INDEX_STAMP_TTL = 2                  # seconds between index version checks per worker
+
+
+# -----------------------------
+# GST (bills/gst.py)
+# -----------------------------
+GST_STATE_CODE = os.environ.get('BILLING_GST_STATE', '')   # seller's state, e.g. '08'; blank = all intra-state
+GST_B2CL_LIMIT = 100000                                     # unregistered inter-state invoices above this are B2CL
+GST_RATES = ('0', '0.1', '0.25', '1.5', '3', '5', '12', '18', '28', '40')   # percent; the only rates a bill line takes
+
+
+# -----------------------------
+# BANK / UPI RECONCILIATION (bills/reconcile.py)
+# -----------------------------
+BANK_MATCH_WINDOW_DAYS = 60                  # a credit may settle bills dated up to this many days before it
+
+
+# -----------------------------
+# THERMAL RECEIPTS (bills/receipt.py)
+# -----------------------------
+# A printer device (/dev/usb/lp0), a plain file (receipts are appended) or a
+# spool directory (one .bin file per receipt); blank = download only.
+RECEIPT_PRINTER = os.environ.get('BILLING_RECEIPT_PRINTER', '')
+RECEIPT_COLUMNS = 48                         # characters per line: 48 on 80 mm paper, 32 on 58 mm
+RECEIPT_COPIES = 2                           # estimate + customer copy, like the printed invoice
+RECEIPT_ENCODING = 'cp437'                   # printer code page; other characters print as '?'
+
+
+# -----------------------------
+# DATABASE MAINTENANCE (manage.py db_maintenance; bills/maintenance.py)
+# -----------------------------
+DB_MAINTENANCE_WINDOW = (1, 5)               # hours (local time) a scheduled run may start; outside = wait
+DB_MAINTENANCE_BUDGET = 15 * 60              # seconds; a step still running then is interrupted and rolled back
+DB_MAINTENANCE_VACUUM_PAGES = 2000           # free pages released per incremental_vacuum step
+DB_MAINTENANCE_STEP_SLEEP = 0.05             # seconds between steps, so billing writes get the lock
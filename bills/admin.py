@@ -1,3 +1,205 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.utils.functional import cached_property
 
-# Register your models here.
+from . import bulk
+from .integrity import refresh_customer_totals, resync_bills
+from .models import Bill, BillItem, BillReturn, BillingSettings, ChangeLog, Customer, Payment
+
+ESTIMATE_ABOVE = 10_000   # below this many rows an exact COUNT(*) is cheap enough
+
+
+# ---------------------------------------
+# Estimated counts for unfiltered change lists
+#
+# The admin counts every change list page with COUNT(*), a full scan on a
+# million-row table. Without filters or a search the planner's own row
+# estimate is used instead: sqlite_stat1 (kept fresh by db_maintenance's
+# ANALYZE), pg_class.reltuples or information_schema on MySQL. Filtered
+# lists, small tables and engines without statistics still count exactly.
+# ---------------------------------------
+def estimated_rows(model, using='default'):
+    conn = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'sqlite': ("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]),
+        'postgresql': ("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table]),
+        'mysql': ("SELECT table_rows FROM information_schema.tables "
+                  "WHERE table_schema = DATABASE() AND table_name = %s", [table]),
+    }
+    if conn.vendor not in queries:
+        return None
+    try:
+        with transaction.atomic(using=using), conn.cursor() as cursor:
+            cursor.execute(*queries[conn.vendor])
+            row = cursor.fetchone()
+    except DatabaseError:   # sqlite_stat1 does not exist until the first ANALYZE
+        return None
+    if row is None or row[0] is None:
+        return None
+    value = int(str(row[0]).split()[0])   # sqlite: "<rows> <rows per key> ..."
+    return value if value > 0 else None   # reltuples is -1 before the first ANALYZE
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = estimated_rows(qs.model, qs.db)
+            if estimate is not None and estimate > ESTIMATE_ABOVE:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False   # skips the second, unfiltered COUNT(*) next to search results
+    list_per_page = 50
+
+
+# ---------------------------------------
+# Customers
+# ---------------------------------------
+@admin.register(Customer)
+class CustomerAdmin(LargeTableAdmin):
+    list_display = ('name', 'phone', 'gstin', 'total_amount', 'paid_amount', 'remaining_amount', 'created_at')
+    search_fields = ('name', 'phone', 'gstin')   # also feeds the customer autocomplete on bills
+    readonly_fields = ('total_amount', 'paid_amount', 'remaining_amount', 'created_at')
+    actions = ('recompute_totals',)
+
+    @admin.action(description="Recompute totals from bills")
+    def recompute_totals(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        for start in range(0, len(ids), 900):
+            chunk = ids[start:start + 900]
+            with transaction.atomic():
+                refresh_customer_totals(chunk)
+                Customer.bump_ledger_version(*chunk)
+        self.message_user(request, f"Recomputed totals of {len(ids)} customer(s).")
+
+    def delete_queryset(self, request, queryset):
+        # Bills, journal entries and archived bills keep their rows (SET NULL), as Customer.delete() does
+        with transaction.atomic():
+            sync_ids = list(queryset.values_list('sync_id', flat=True))
+            queryset.delete()
+            ChangeLog.record_many(Customer, sync_ids, ChangeLog.DELETE)
+
+
+# ---------------------------------------
+# Bills with their items, payments and returns
+#
+# Inline rows are saved through the models (BillItem.save() re-totals the
+# bill and journals the change). The actions and "delete selected" go
+# through bills/bulk.py instead of one save() / delete() per row.
+# ---------------------------------------
+class BillItemInline(admin.TabularInline):
+    model = BillItem
+    extra = 0
+    fields = ('description', 'product', 'quantity', 'rate', 'total', 'hsn_code', 'gst_rate', 'cgst', 'sgst', 'igst')
+    # A product widget per row would query once per row; the product is set from the billing screen
+    readonly_fields = ('product', 'total', 'cgst', 'sgst', 'igst')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+
+class PaymentInline(admin.TabularInline):
+    model = Payment
+    extra = 0
+    fields = ('date', 'amount', 'note')
+
+
+class BillReturnInline(admin.TabularInline):
+    model = BillReturn
+    extra = 0
+    fields = ('date', 'amount', 'note')
+
+
+@admin.register(Bill)
+class BillAdmin(LargeTableAdmin):
+    list_display = ('bill_no', 'date', 'customer', 'customer_name', 'total_amount', 'returned_amount',
+                    'paid_amount', 'is_paid')
+    list_select_related = ('customer',)
+    list_filter = ('is_paid',)
+    search_fields = ('=bill_no', '^customer_name', '^phone')
+    date_hierarchy = 'date'
+    autocomplete_fields = ('customer',)
+    raw_id_fields = ('paid_by',)
+    readonly_fields = ('taxable_amount', 'cgst_amount', 'sgst_amount', 'igst_amount', 'total_amount',
+                       'returned_amount', 'paid_amount', 'is_paid', 'paid_date', 'paid_by')
+    inlines = (BillItemInline, PaymentInline, BillReturnInline)
+    actions = ('mark_paid', 'resync')
+
+    @admin.action(description="Mark selected bills paid")
+    def mark_paid(self, request, queryset):
+        summary = bulk.mark_paid_selection(queryset, user=request.user)
+        self.message_user(request, f"Marked {summary.bills} bill(s) paid (₹{summary.amount}); "
+                                   f"{summary.skipped} already paid.")
+
+    @admin.action(description="Recompute from items, payments and returns")
+    def resync(self, request, queryset):
+        with transaction.atomic():
+            changed = resync_bills(queryset.values_list('id', flat=True), "Recomputed (admin)", taxes=True)
+        self.message_user(request, f"{changed} bill(s) corrected and journalled.")
+
+    def delete_queryset(self, request, queryset):
+        summary = bulk.delete_bill_selection(queryset)
+        self.message_user(request, f"Reversed ₹{summary.amount} in the journal.", messages.INFO)
+
+
+class BillRowAdmin(LargeTableAdmin):
+    """Items, payments and returns: listed with their bill, deleted set-wise."""
+    list_select_related = ('bill',)
+    raw_id_fields = ('bill',)
+    search_fields = ('=bill__bill_no', '^bill__customer_name')
+
+    def delete_queryset(self, request, queryset):
+        bulk.delete_rows(queryset, f"{self.model._meta.verbose_name.capitalize()} deleted (admin)")
+
+
+@admin.register(BillItem)
+class BillItemAdmin(BillRowAdmin):
+    list_display = ('bill', 'description', 'quantity', 'rate', 'total', 'hsn_code', 'gst_rate')
+    raw_id_fields = ('bill', 'product')
+    readonly_fields = ('total', 'cgst', 'sgst', 'igst')
+
+
+@admin.register(Payment)
+class PaymentAdmin(BillRowAdmin):
+    list_display = ('bill', 'date', 'amount', 'note')
+    date_hierarchy = 'date'
+
+
+@admin.register(BillReturn)
+class BillReturnAdmin(BillRowAdmin):
+    list_display = ('bill', 'date', 'amount', 'note')
+
+
+# ---------------------------------------
+# Billing settings (one row)
+# ---------------------------------------
+class BillingSettingsForm(forms.ModelForm):
+    class Meta:
+        model = BillingSettings
+        fields = '__all__'
+
+    def clean(self):
+        data = super().clean()
+        for name in ('financial_year_start', 'financial_year_end', 'lock_date', 'system_date'):
+            try:
+                BillingSettings.parse(data.get(name) or '')
+            except ValueError:
+                self.add_error(name, "Use DD-MM-YYYY.")
+        return data
+
+
+@admin.register(BillingSettings)
+class BillingSettingsAdmin(admin.ModelAdmin):
+    form = BillingSettingsForm
+    list_display = ('__str__', 'lock_date', 'system_date')
+
+    def has_add_permission(self, request):
+        return not BillingSettings.objects.exists()
@@ -0,0 +1,138 @@
+import threading
+from collections import namedtuple
+
+from django.db.models import CharField, Max
+from django.db.models.functions import Cast
+
+from .models import Bill, Customer, LedgerEntry, Payment
+from .reports import fetch_raw, paise
+
+_lock = threading.Lock()
+_facts = None          # Facts for _stamp
+_stamp = None
+_results = {}          # limit -> summary() for _stamp
+
+Facts = namedtuple('Facts', 'bill_customer bill_day bill_net pay_customer pay_day pay_amount')
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+# ---------------------------------------
+# Columnar facts
+#
+# Every bill and payment as NumPy columns: customer id, day (datetime64[D])
+# and integer paise. The arrays are kept per process and reloaded only when
+# the journal moves (the newest LedgerEntry id changes on every bill, item,
+# payment and return write, including deletes).
+# ---------------------------------------
+def _iso(field):
+    # 'YYYY-MM-DD' text: NumPy parses these far faster than datetime.date objects
+    return Cast(field, CharField())
+
+
+def _days(np, values):
+    return np.array(values, dtype='datetime64[D]')
+
+
+def _load(np):
+    bills = fetch_raw(
+        Bill.objects.order_by().values_list('customer_id')
+        .annotate(day=_iso('date'), total=paise('total_amount'), returned=paise('returned_amount'))
+    )
+    payments = fetch_raw(
+        Payment.objects.filter(amount__gt=0).order_by()
+        .values_list('bill__customer_id').annotate(day=_iso('date'), amount=paise('amount'))
+    )
+    b_customer, b_day, b_total, b_returned = zip(*bills) if bills else ((), (), (), ())
+    p_customer, p_day, p_amount = zip(*payments) if payments else ((), (), ())
+
+    def ints(col):
+        return np.fromiter((v or 0 for v in col), dtype=np.int64, count=len(col))
+
+    return Facts(
+        bill_customer=ints(b_customer),
+        bill_day=_days(np, b_day),
+        bill_net=np.maximum(ints(b_total) - ints(b_returned), 0),
+        pay_customer=ints(p_customer),
+        pay_day=_days(np, p_day),
+        pay_amount=ints(p_amount),
+    )
+
+
+def facts():
+    global _facts, _stamp
+    import numpy as np
+
+    stamp = LedgerEntry.objects.aggregate(m=Max('id'))['m']
+    with _lock:
+        if _facts is None or stamp != _stamp:
+            _facts, _stamp = _load(np), stamp
+            _results.clear()
+        return _facts
+
+
+# ---------------------------------------
+# Vectorised group-bys
+# ---------------------------------------
+def _rupees(values):
+    return (values / 100).round(2).tolist()
+
+
+def monthly(np, f):
+    """Billed vs collected per calendar month and the collection ratio."""
+    bill_month = f.bill_day.astype('datetime64[M]')
+    pay_month = f.pay_day.astype('datetime64[M]')
+    months = np.union1d(bill_month, pay_month)
+    billed = np.bincount(np.searchsorted(months, bill_month), weights=f.bill_net, minlength=len(months))
+    collected = np.bincount(np.searchsorted(months, pay_month), weights=f.pay_amount, minlength=len(months))
+    efficiency = np.divide(collected, billed, out=np.zeros(len(months)), where=billed > 0)
+    return [
+        {'month': str(m), 'billed': b, 'collected': c, 'efficiency': round(e * 100, 1)}
+        for m, b, c, e in zip(months, _rupees(billed), _rupees(collected), efficiency.tolist())
+    ]
+
+
+def top_customers(np, f, limit=10):
+    ids = np.union1d(f.bill_customer, f.pay_customer)
+    ids = ids[ids > 0]
+    if not len(ids):
+        return []
+    billed = np.bincount(np.searchsorted(ids, f.bill_customer[f.bill_customer > 0]),
+                         weights=f.bill_net[f.bill_customer > 0], minlength=len(ids))
+    paid = np.bincount(np.searchsorted(ids, f.pay_customer[f.pay_customer > 0]),
+                       weights=f.pay_amount[f.pay_customer > 0], minlength=len(ids))
+    order = np.argsort(-billed, kind='stable')[:limit]
+    names = dict(Customer.objects.filter(id__in=ids[order].tolist()).values_list('id', 'name'))
+    return [
+        {'customer_id': cid, 'name': names.get(cid, ''), 'billed': b, 'paid': p,
+         'outstanding': round(max(b - p, 0), 2)}
+        for cid, b, p in zip(ids[order].tolist(), _rupees(billed[order]), _rupees(paid[order]))
+    ]
+
+
+def weekdays(np, f):
+    # 1970-01-01 was a Thursday; shift so Monday = 0
+    bill_wd = (f.bill_day.astype(np.int64) + 3) % 7
+    pay_wd = (f.pay_day.astype(np.int64) + 3) % 7
+    bills = np.bincount(bill_wd, minlength=7)
+    billed = np.bincount(bill_wd, weights=f.bill_net, minlength=7)
+    collected = np.bincount(pay_wd, weights=f.pay_amount, minlength=7)
+    return [
+        {'day': d, 'bills': int(n), 'billed': b, 'collected': c}
+        for d, n, b, c in zip(WEEKDAYS, bills, _rupees(billed), _rupees(collected))
+    ]
+
+
+def summary(limit=10):
+    import numpy as np
+
+    f = facts()
+    if limit not in _results:
+        _results[limit] = {
+            'bills': int(len(f.bill_day)),
+            'payments': int(len(f.pay_day)),
+            'monthly': monthly(np, f),
+            'top_customers': top_customers(np, f, limit),
+            'weekdays': weekdays(np, f),
+        }
+    return _results[limit]
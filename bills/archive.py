@@ -0,0 +1,150 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest
+
+from .models import (
+    ArchivedBill, ArchivedBillItem, ArchivedBillReturn, ArchivedPayment,
+    Bill, BillingSettings, BillItem, BillReturn, ChangeLog, Customer, LedgerEntry, Payment,
+)
+from .money import PaiseField
+
+# live model -> (archive model, columns copied as-is)
+MOVES = [
+    (Bill, ArchivedBill),
+    (BillItem, ArchivedBillItem),
+    (Payment, ArchivedPayment),
+    (BillReturn, ArchivedBillReturn),
+]
+
+
+def _columns(archive_model):
+    return [f.attname for f in archive_model._meta.concrete_fields if f.name != 'financial_year']
+
+
+def fy_label(start, end):
+    return f"{start.year}-{str(end.year)[-2:]}"
+
+
+def _next_year(day):
+    try:
+        return day.replace(year=day.year + 1)
+    except ValueError:          # 29 Feb
+        return day.replace(year=day.year + 1, day=28)
+
+
+# ---------------------------------------
+# Do reports need the archive tables?
+# ---------------------------------------
+def needs_archive(date_from):
+    """True when ``date_from`` (YYYY-MM-DD or empty) reaches before the current financial year."""
+    row = BillingSettings.objects.first()
+    if row is None or not ArchivedBill.objects.exists():
+        return False
+    return not date_from or str(date_from) < row.fy_start.isoformat()
+
+
+async def aneeds_archive(date_from):
+    row = await BillingSettings.objects.afirst()
+    if row is None or not await ArchivedBill.objects.aexists():
+        return False
+    return not date_from or str(date_from) < row.fy_start.isoformat()
+
+
+# ---------------------------------------
+# Financial-year close
+# ---------------------------------------
+def close_year(batch_size=2000, dry_run=False, log=print):
+    """
+    Archive every bill dated on or before BillingSettings.financial_year_end,
+    carry each customer's due (or advance) into an opening-balance bill dated
+    on the first day of the next year (walk-in bills: one per name), and roll
+    the settings forward.
+    """
+    settings_row = BillingSettings.objects.first()
+    if settings_row is None:
+        raise ValueError("BillingSettings are not configured.")
+
+    start, end = settings_row.fy_start, settings_row.fy_end
+    label = fy_label(start, end)
+    new_start, new_end = end + timedelta(days=1), _next_year(end)
+
+    closing = Bill.objects.filter(date__lte=end)
+    net = Greatest(F('total_amount') - F('returned_amount'), Value(0), output_field=PaiseField())
+    per_customer = list(
+        closing.order_by().values('customer_id')
+        .annotate(net=Sum(net), paid=Sum('paid_amount'))
+    )
+    # Walk-in / orphan bills have no customer to carry to: group them by name
+    per_name = list(
+        closing.filter(customer__isnull=True).order_by().values('customer_name')
+        .annotate(net=Sum(net), paid=Sum('paid_amount'))
+    )
+    bill_ids = list(closing.order_by('id').values_list('id', flat=True))
+
+    log(f"FY {label}: {len(bill_ids)} bill(s) to archive for {len(per_customer)} customer group(s)")
+    if dry_run or not bill_ids:
+        return {'bills': len(bill_ids), 'customers': len(per_customer), 'dry_run': dry_run}
+
+    with transaction.atomic():
+        for i in range(0, len(bill_ids), batch_size):
+            chunk = bill_ids[i:i + batch_size]
+            for live, archive in MOVES:
+                columns = _columns(archive)
+                key = 'id__in' if live is Bill else 'bill_id__in'
+                extra = {'financial_year': label} if archive is ArchivedBill else {}
+                rows = live.objects.filter(**{key: chunk}).values(*columns)
+                archive.objects.bulk_create([archive(**row, **extra) for row in rows], batch_size=1000)
+            # Cascades to items/payments/returns; journal rows keep their customer
+            sync_ids = list(Bill.objects.filter(id__in=chunk).values_list('sync_id', flat=True))
+            Bill.objects.filter(id__in=chunk).delete()
+            ChangeLog.record_many(Bill, sync_ids, ChangeLog.DELETE)
+            log(f"  archived {min(i + batch_size, len(bill_ids))}/{len(bill_ids)}")
+
+        # Take the archived amounts off each ledger in one entry per customer,
+        # dated with the opening-balance bill that replaces them
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(customer_id=row['customer_id'], kind=LedgerEntry.ADJUSTMENT, date=new_start,
+                        debit=-(row['net'] or 0), credit=-(row['paid'] or 0),
+                        note=f"FY {label} closed: bills archived")
+            for row in per_customer if row['net'] or row['paid']
+        ])
+
+        # Carry forward: what was still due (or paid in advance) opens the new year
+        def carry(row, customer=None, name=None):
+            due = (row['net'] or Decimal('0')) - (row['paid'] or Decimal('0'))
+            if not due:
+                return due
+            opening = Bill(customer=customer, customer_name=name, date=new_start, bill_no=0, carried_forward=True,
+                           extra_reason=f"Opening balance (FY {label})", extra_amount=max(due, Decimal('0')))
+            opening.save()
+            opening.update_total()
+            if due < 0:
+                Payment.objects.create(bill=opening, amount=-due, date=new_start,
+                                       note="Advance carried forward")
+            return due
+
+        carried = 0
+        customers = Customer.objects.in_bulk([r['customer_id'] for r in per_customer if r['customer_id']])
+        for row in per_customer:
+            customer = customers.get(row['customer_id'])
+            if customer is None:
+                continue        # carried per name below
+            carried += bool(carry(row, customer=customer))
+            customer.refresh_totals()
+        for row in per_name:
+            due = carry(row, name=row['customer_name'])
+            if due:
+                carried += 1
+                log(f"  carried {due} for {row['customer_name'] or 'walk-in'} (no customer record)")
+        Customer.bump_ledger_version(*customers)
+
+        settings_row.financial_year_start = BillingSettings.format(new_start)
+        settings_row.financial_year_end = BillingSettings.format(new_end)
+        settings_row.lock_date = BillingSettings.format(end)
+        settings_row.save()
+
+    log(f"Carried forward {carried} balance(s); new year {new_start} → {new_end}")
+    return {'bills': len(bill_ids), 'customers': len(per_customer), 'carried': carried}
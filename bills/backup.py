@@ -0,0 +1,370 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+DELTA_MAGIC = b'BKD1'
+NAME_RE = re.compile(r'^db-(\d{8}-\d{6}-\d{6})\.(full|delta)\.(gz|zst)$')
+
+
+class BackupError(Exception):
+    pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def database_path(alias='default'):
+    db = settings.DATABASES[alias]
+    if 'sqlite3' not in db['ENGINE']:
+        raise BackupError("Online backup is only implemented for SQLite.")
+    return Path(db['NAME'])
+
+
+def backup_dir(folder=None):
+    path = Path(folder or settings.BACKUP_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+# ---------------------------------------
+# Compression (zstandard when installed, gzip otherwise)
+# ---------------------------------------
+def _codec(name=None):
+    name = name or settings.BACKUP_COMPRESSION
+    if name in ('auto', 'zstd'):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            if name == 'zstd':
+                raise BackupError("zstd compression needs the 'zstandard' package.")
+            return 'gz'
+        return 'zst'
+    if name in ('gz', 'gzip'):
+        return 'gz'
+    raise BackupError(f"Unknown compression: {name}")
+
+
+def _writer(path, codec):
+    if codec == 'zst':
+        import zstandard
+        return zstandard.ZstdCompressor(level=10).stream_writer(open(path, 'wb'))
+    return gzip.open(path, 'wb', compresslevel=6)
+
+
+def _reader(path):
+    if path.suffix == '.zst':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+    return gzip.open(path, 'rb')
+
+
+def _read_exact(fh, size):
+    # zstd stream readers may return short reads
+    data = b''
+    while len(data) < size:
+        chunk = fh.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+# ---------------------------------------
+# Online copy: sqlite3 backup API in small steps
+#
+# Between steps the source is unlocked, so writers only ever wait for one
+# step. A write from another connection makes SQLite restart the copy from
+# page 1; after BACKUP_MAX_RESTARTS the rest is copied in a single step.
+# ---------------------------------------
+def online_copy(source, target, pages=None, sleep=None, max_restarts=None):
+    pages = pages or settings.BACKUP_PAGES_PER_STEP
+    sleep = settings.BACKUP_STEP_SLEEP if sleep is None else sleep
+    max_restarts = settings.BACKUP_MAX_RESTARTS if max_restarts is None else max_restarts
+    stats = {'steps': 0, 'restarts': 0, 'single_step': False}
+    last_remaining = [None]
+
+    def progress(status, remaining, total):
+        stats['steps'] += 1
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _TooManyRestarts
+        last_remaining[0] = remaining
+
+    src = sqlite3.connect(source, timeout=30)
+    dst = sqlite3.connect(target)
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+        except _TooManyRestarts:
+            stats['single_step'] = True
+            src.backup(dst, pages=-1)
+    finally:
+        dst.close()
+        src.close()
+    return stats
+
+
+def _page_size(path):
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    size = struct.unpack('>H', header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def _digests(path, page_size):
+    """8-byte blake2b digest of every page, concatenated."""
+    out = bytearray()
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            out += hashlib.blake2b(page, digest_size=8).digest()
+    return bytes(out)
+
+
+def _file_hash(path):
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def integrity_check(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+
+
+# ---------------------------------------
+# Snapshot chains
+#
+# A chain is one full snapshot followed by deltas. A delta holds only the
+# pages whose digest changed since the previous snapshot, plus the new page
+# count; restoring replays full + deltas in name (= time) order. The digests
+# of the newest snapshot are kept in state.json / state.pages.
+# ---------------------------------------
+def snapshots(folder):
+    """[(path, kind)] oldest first."""
+    found = []
+    for path in Path(folder).iterdir():
+        m = NAME_RE.match(path.name)
+        if m:
+            found.append((m.group(1), path, m.group(2)))
+    return [(path, kind) for _, path, kind in sorted(found)]
+
+
+def chains(folder):
+    result = []
+    for path, kind in snapshots(folder):
+        if kind == 'full' or not result:
+            result.append([])
+        result[-1].append(path)
+    return result
+
+
+def _chain_upto(path):
+    for chain in chains(path.parent):
+        if path in chain:
+            if NAME_RE.match(chain[0].name).group(2) != 'full':
+                raise BackupError(f"{path.name}: its full snapshot is missing.")
+            return chain[:chain.index(path) + 1]
+    raise BackupError(f"Not a snapshot: {path}")
+
+
+def restore(path, target):
+    """Rebuild the database file of snapshot ``path`` at ``target``."""
+    path, target = Path(path), Path(target)
+    chain = _chain_upto(path)
+    part = target.with_name(target.name + '.part')
+    with _reader(chain[0]) as src, open(part, 'wb') as out:
+        shutil.copyfileobj(src, out, 1 << 20)
+    for delta in chain[1:]:
+        with _reader(delta) as src, open(part, 'r+b') as out:
+            if _read_exact(src, 4) != DELTA_MAGIC:
+                raise BackupError(f"{delta.name}: not a delta file.")
+            page_size, page_count = struct.unpack('>II', _read_exact(src, 8))
+            while True:
+                head = _read_exact(src, 4)
+                if not head:
+                    break
+                out.seek(struct.unpack('>I', head)[0] * page_size)
+                out.write(_read_exact(src, page_size))
+            out.truncate(page_count * page_size)
+    os.replace(part, target)
+    return target
+
+
+def _load_state(folder):
+    state_file = folder / 'state.json'
+    if not state_file.exists():
+        return None
+    state = json.loads(state_file.read_text())
+    if not (folder / state['snapshot']).exists():
+        return None
+    state['digests'] = (folder / 'state.pages').read_bytes()
+    return state
+
+
+def _save_state(folder, snapshot, page_size, digests, deltas):
+    (folder / 'state.pages').write_bytes(digests)
+    (folder / 'state.json').write_text(json.dumps(
+        {'snapshot': snapshot.name, 'page_size': page_size, 'deltas': deltas}))
+
+
+def _write_full(copy, dest, codec):
+    with open(copy, 'rb') as src, _writer(dest, codec) as out:
+        shutil.copyfileobj(src, out, 1 << 20)
+
+
+def _write_delta(copy, dest, codec, page_size, digests, previous):
+    width = 8
+    count = len(digests) // width
+    changed = [
+        n for n in range(count)
+        if digests[n * width:(n + 1) * width] != previous[n * width:(n + 1) * width]
+    ]
+    with open(copy, 'rb') as src, _writer(dest, codec) as out:
+        out.write(DELTA_MAGIC + struct.pack('>II', page_size, count))
+        for n in changed:
+            src.seek(n * page_size)
+            out.write(struct.pack('>I', n) + src.read(page_size))
+    return len(changed)
+
+
+def rotate(folder, keep):
+    """Delete whole chains beyond the newest ``keep``."""
+    removed = 0
+    for chain in chains(folder)[:-keep] if keep > 0 else []:
+        for path in chain:
+            path.unlink()
+            removed += 1
+    return removed
+
+
+def run_backup(folder=None, full=False, keep=None, compression=None, pages=None, verify=True, log=None):
+    """
+    Take one snapshot of the live database into ``folder``. Returns a report
+    dict (sizes, throughput, steps/restarts, changed pages, verification).
+    """
+    log = log or (lambda msg: None)
+    source = database_path()
+    folder = backup_dir(folder)
+    codec = _codec(compression)
+    keep = settings.BACKUP_KEEP if keep is None else keep
+    stamp = timezone.localtime().strftime('%Y%m%d-%H%M%S-%f')
+    copy = folder / f'.copy-{stamp}.sqlite3'
+
+    try:
+        began = time.perf_counter()
+        stats = online_copy(str(source), str(copy), pages=pages)
+        copied_in = time.perf_counter() - began
+        size = copy.stat().st_size
+        log(f"copied {size / 1e6:.1f} MB in {copied_in:.2f}s "
+            f"({stats['steps']} steps, {stats['restarts']} restarts)")
+
+        page_size = _page_size(copy)
+        digests = _digests(copy, page_size)
+        state = _load_state(folder)
+        incremental = (
+            not full and state is not None and state['page_size'] == page_size
+            and state['deltas'] < settings.BACKUP_FULL_EVERY
+        )
+
+        kind = 'delta' if incremental else 'full'
+        dest = folder / f'db-{stamp}.{kind}.{codec}'
+        part = dest.with_name(dest.name + '.part')
+        if incremental:
+            changed = _write_delta(copy, part, codec, page_size, digests, state['digests'])
+        else:
+            _write_full(copy, part, codec)
+            changed = len(digests) // 8
+        os.replace(part, dest)
+
+        report = {
+            'file': dest.name, 'kind': kind, 'db_bytes': size, 'stored_bytes': dest.stat().st_size,
+            'changed_pages': changed, 'pages': len(digests) // 8, 'copy_seconds': round(copied_in, 3),
+            'mb_per_s': round(size / 1e6 / copied_in, 1) if copied_in else None, **stats,
+        }
+
+        if verify:
+            restored = restore(dest, folder / f'.verify-{stamp}.sqlite3')
+            try:
+                same = _file_hash(restored) == _file_hash(copy)
+                check = integrity_check(restored)
+            finally:
+                restored.unlink()
+            report['verified'] = same and check == 'ok'
+            if not report['verified']:
+                dest.unlink()
+                raise BackupError(f"Restore check failed (hash match={same}, integrity_check={check!r}).")
+
+        _save_state(folder, dest, page_size, digests, state['deltas'] + 1 if incremental else 0)
+        report['rotated'] = rotate(folder, keep)
+        report['seconds'] = round(time.perf_counter() - began, 3)
+        return report
+    finally:
+        if copy.exists():
+            copy.unlink()
+
+
+# ---------------------------------------
+# Writer latency probe
+# ---------------------------------------
+class WriterProbe(threading.Thread):
+    """
+    Commits a header-only write (PRAGMA user_version, unchanged value) every
+    ``interval`` seconds on its own connection and records each commit time.
+    """
+
+    def __init__(self, path, interval=0.05):
+        super().__init__(daemon=True)
+        self.path, self.interval = path, interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            while not self.stopped.is_set():
+                began = time.perf_counter()
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                conn.execute('COMMIT')
+                self.samples.append(time.perf_counter() - began)
+                self.stopped.wait(self.interval)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return latency_summary(self.samples)
+
+
+def latency_summary(samples):
+    if not samples:
+        return {'writes': 0}
+    ordered = sorted(samples)
+
+    def ms(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {'writes': len(ordered), 'p50_ms': ms(0.5), 'p95_ms': ms(0.95), 'max_ms': round(ordered[-1] * 1000, 2)}
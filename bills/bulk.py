@@ -0,0 +1,170 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .integrity import resync_bills
+from .models import ArchivedBill, Bill, BillItem, ChangeLog, Customer, LedgerEntry, Payment
+
+ZERO = Decimal('0.00')
+
+Summary = namedtuple('Summary', 'bills amount skipped')
+
+
+# ---------------------------------------
+# Bulk bill actions for one customer
+#
+# The per-bill views go through Payment.save()/Bill.delete(), each of which
+# rescans the customer. Here the selected bills are read once, payments,
+# journal entries and column updates are written set-wise, and the customer
+# totals are recomputed once at the end. The query count does not depend on
+# how many bills are selected.
+# ---------------------------------------
+def _selected(customer, bill_ids):
+    return list(
+        Bill.objects.select_for_update()
+        .filter(customer=customer, id__in=bill_ids)
+        .values('id', 'bill_no', 'sync_id', 'sync_version', *LedgerEntry.BILL_FIELDS)
+    )
+
+
+def _finish(customer):
+    if customer is None:   # bills without a customer have no totals to refresh
+        return
+    Customer.bump_ledger_version(customer.id)
+    customer.refresh_totals()
+
+
+def mark_paid(customer, bill_ids, user=None, on=None):
+    """Pay off the remaining (net of returns) amount of each selected bill, paid on ``on`` (default today)."""
+    on = on or timezone.localdate()
+    with transaction.atomic():
+        rows = _selected(customer, bill_ids)
+        due = []
+        for row in rows:
+            net, paid = LedgerEntry._amounts(row)
+            if net - paid > 0:
+                due.append((row, net - paid))
+        if due:
+            payments = Payment.objects.bulk_create([
+                Payment(bill_id=row['id'], amount=amount, date=on, note="Marked paid (bulk)")
+                for row, amount in due
+            ])
+            LedgerEntry.objects.bulk_create([
+                LedgerEntry(customer=customer, bill_id=row['id'], kind=LedgerEntry.PAYMENT, date=on,
+                            credit=amount, note=f"Bill #{row['bill_no']}")
+                for row, amount in due
+            ])
+            Bill.objects.filter(id__in=[row['id'] for row, _ in due]).update(
+                paid_amount=F('total_amount') - F('returned_amount'),
+                is_paid=True, paid_date=timezone.now(), paid_by=user,
+            )
+            ChangeLog.record_many(Payment, [p.sync_id for p in payments])
+            ChangeLog.record_many(Bill, [row['sync_id'] for row, _ in due])
+            _finish(customer)
+    return Summary(len(due), sum((amount for _, amount in due), ZERO), len(rows) - len(due))
+
+
+def delete_bills(customer, bill_ids):
+    """Delete the selected bills (items, payments and returns cascade)."""
+    today = timezone.localdate()
+    with transaction.atomic():
+        rows = _selected(customer, bill_ids)
+        reversals = []
+        for row in rows:
+            net, paid = LedgerEntry._amounts(row)
+            if net or paid:
+                reversals.append(LedgerEntry(customer=customer, bill_id=row['id'], kind=LedgerEntry.ADJUSTMENT,
+                                             date=today, debit=-net, credit=-paid,
+                                             note=f"Bill #{row['bill_no']} deleted"))
+        LedgerEntry.objects.bulk_create(reversals)
+        if rows:
+            Bill.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            ChangeLog.record_many(Bill, [row['sync_id'] for row in rows], ChangeLog.DELETE,
+                                  base_versions=[row['sync_version'] for row in rows])
+            _finish(customer)
+    return Summary(len(rows), -sum((e.debit for e in reversals), ZERO), 0)
+
+
+# ---------------------------------------
+# Admin actions over any selection (bills/admin.py)
+#
+# A selection of bills may span many customers: it is split per customer
+# and each part goes through mark_paid / delete_bills above. Items,
+# payments and returns are deleted set-wise; their bills are recomputed
+# from the remaining rows afterwards and every change is journalled, the
+# same way verify_ledger --fix does it.
+# ---------------------------------------
+def _by_customer(bills):
+    groups = {}
+    for customer_id, bill_id in bills.order_by().values_list('customer_id', 'id'):
+        groups.setdefault(customer_id, []).append(bill_id)
+    customers = Customer.objects.in_bulk([cid for cid in groups if cid])
+    return [(customers.get(cid), ids) for cid, ids in groups.items()]
+
+
+def _combine(summaries):
+    return Summary(sum(s.bills for s in summaries), sum((s.amount for s in summaries), ZERO),
+                   sum(s.skipped for s in summaries))
+
+
+def mark_paid_selection(bills, user=None, on=None):
+    return _combine([mark_paid(customer, ids, user, on) for customer, ids in _by_customer(bills)])
+
+
+def delete_bill_selection(bills):
+    return _combine([delete_bills(customer, ids) for customer, ids in _by_customer(bills)])
+
+
+def delete_rows(queryset, note):
+    """Delete BillItem / Payment / BillReturn rows and resync their bills; returns the count."""
+    model = queryset.model
+    with transaction.atomic():
+        rows = list(queryset.order_by().values_list('bill_id', 'sync_id'))
+        if not rows:
+            return 0
+        model.objects.filter(sync_id__in=[sync_id for _, sync_id in rows]).delete()
+        ChangeLog.record_many(model, [sync_id for _, sync_id in rows], ChangeLog.DELETE)
+        resync_bills({bill_id for bill_id, _ in rows}, note, taxes=model is BillItem)
+    return len(rows)
+
+
+# ---------------------------------------
+# Customer rename / phone edit -> older bills
+#
+# Bill.save() copies the customer's name and phone onto the bill, so an
+# edited customer leaves its existing (and archived) bills behind. They are
+# rewritten here in chunks of ``chunk_size`` rows, one transaction each.
+# Every chunk writes the customer's *current* values and only rows that
+# still differ are selected, so a retried or repeated run just carries on.
+# ---------------------------------------
+def propagate_customer(customer_id, chunk_size=2000, progress=None):
+    customer = Customer.objects.filter(id=customer_id).values('name', 'phone').first()
+    if customer is None:
+        return {'bills': 0, 'archived': 0}
+    name, phone = customer['name'], customer['phone']
+
+    def stale(model):
+        return model.objects.filter(customer_id=customer_id).exclude(customer_name=name, phone=phone).order_by('id')
+
+    total = stale(Bill).count() + stale(ArchivedBill).count()
+    done = {Bill: 0, ArchivedBill: 0}
+    for model in done:
+        while True:
+            with transaction.atomic():
+                rows = list(stale(model).values('id', *(['sync_id'] if model is Bill else []))[:chunk_size])
+                if not rows:
+                    break
+                model.objects.filter(id__in=[row['id'] for row in rows]).update(customer_name=name, phone=phone)
+                if model is Bill:
+                    ChangeLog.record_many(Bill, [row['sync_id'] for row in rows])
+            done[model] += len(rows)
+            if progress:
+                moved = sum(done.values())
+                progress(moved * 100 / max(total, moved), f"{moved}/{max(total, moved)} bills updated")
+
+    if done[Bill] or done[ArchivedBill]:
+        Customer.bump_ledger_version(customer_id)
+    return {'bills': done[Bill], 'archived': done[ArchivedBill]}
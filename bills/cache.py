@@ -0,0 +1,88 @@
+import hashlib
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max
+
+logger = logging.getLogger(__name__)
+
+# Per-process hit/miss counters, e.g. {"customer_detail.rows.hit": 12}
+STATS = Counter()
+
+
+# ---------------------------------------
+# Versioned report cache
+#
+# Keys embed Customer.ledger_version, which Bill.save()/delete() bump for
+# every bill, item, payment and return write. Nothing is ever invalidated:
+# a write moves the customer to a new version and the old entries expire.
+# ---------------------------------------
+def ledger_cache():
+    return caches[settings.LEDGER_CACHE_ALIAS]
+
+
+def make_key(kind, *parts):
+    raw = ":".join(str(p) for p in parts)
+    if len(raw) > 120:
+        raw = hashlib.sha1(raw.encode()).hexdigest()
+    return f"ledger:{kind}:{raw}"
+
+
+def _count(kind, hit):
+    STATS[f"{kind}.{'hit' if hit else 'miss'}"] += 1
+    logger.debug("ledger cache %s %s", kind, "hit" if hit else "miss")
+
+
+async def aget_or_build(kind, key, build):
+    """Return (value, hit). ``build`` is an async callable run on a miss."""
+    cache = ledger_cache()
+    value = await cache.aget(key)
+    if value is not None:
+        _count(kind, True)
+        return value, True
+
+    value = await build()
+    await cache.aset(key, value, settings.LEDGER_CACHE_TIMEOUT)
+    _count(kind, False)
+    return value, False
+
+
+def get_or_build(kind, key, build):
+    """Synchronous aget_or_build() for views and jobs that are not async."""
+    cache = ledger_cache()
+    value = cache.get(key)
+    if value is not None:
+        _count(kind, True)
+        return value, True
+
+    value = build()
+    cache.set(key, value, settings.LEDGER_CACHE_TIMEOUT)
+    _count(kind, False)
+    return value, False
+
+
+async def astatement_stamp(bills_qs):
+    """
+    Version stamp for a statement over ``bills_qs``: every matched customer's
+    ledger_version. Returns None when bills without a customer match, since
+    those have no version to key on (the caller then skips the cache).
+    """
+    stamp = []
+    rows = (bills_qs.order_by().values('customer_id')
+            .annotate(v=Max('customer__ledger_version')).order_by('customer_id'))
+    async for row in rows:
+        if row['customer_id'] is None:
+            return None
+        stamp.append(f"{row['customer_id']}.{row['v']}")
+    return hashlib.sha1(",".join(stamp).encode()).hexdigest()
+
+
+def stats():
+    data = dict(STATS)
+    kinds = {k.rsplit(".", 1)[0] for k in data}
+    for kind in kinds:
+        hits, misses = data.get(f"{kind}.hit", 0), data.get(f"{kind}.miss", 0)
+        data[f"{kind}.ratio"] = round(hits / (hits + misses), 3) if hits + misses else 0.0
+    return data
@@ -0,0 +1,93 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import Product
+
+_lock = threading.Lock()
+_index = None          # PrefixIndex for the current stamp
+_stamp = None          # (count, max updated_at) the index was built from
+_checked_at = 0.0      # monotonic time of the last stamp query
+
+
+# ---------------------------------------
+# Prefix index
+#
+# Sorted (key, product_id) pairs; a prefix match is a bisect to the first
+# key >= prefix and a walk while keys still start with it. Keys are the
+# lowercase code, the full name and every word of the name, so "bolt",
+# "ss b" and "m8" all find "SS Bolt M8".
+# ---------------------------------------
+class PrefixIndex:
+    def __init__(self, products):
+        self.products = {}
+        pairs = set()
+        for p in products:
+            self.products[p['id']] = p
+            name = p['name'].lower()
+            pairs.add((p['code'].lower(), p['id']))
+            pairs.add((name, p['id']))
+            for word in name.split():
+                pairs.add((word, p['id']))
+        pairs = sorted(pairs)
+        self.keys = [k for k, _ in pairs]
+        self.ids = [i for _, i in pairs]
+
+    def search(self, prefix, limit=10):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        found = []
+        pos = bisect_left(self.keys, prefix)
+        while pos < len(self.keys) and self.keys[pos].startswith(prefix):
+            pid = self.ids[pos]
+            if pid not in found:
+                found.append(pid)
+                if len(found) >= limit:
+                    break
+            pos += 1
+        # Exact code matches first, then by code
+        found.sort(key=lambda i: (self.products[i]['code'].lower() != prefix, self.products[i]['code']))
+        return [self.products[i] for i in found]
+
+
+def _current_stamp():
+    row = Product.objects.filter(active=True).aggregate(n=Count('id'), t=Max('updated_at'))
+    return row['n'], row['t']
+
+
+def _build():
+    rows = Product.objects.filter(active=True).values('id', 'code', 'name', 'default_rate', 'unit', 'hsn_code', 'gst_rate')
+    return PrefixIndex([dict(r, default_rate=str(r['default_rate']), gst_rate=str(r['gst_rate'])) for r in rows])
+
+
+def get_index():
+    """
+    Process-local index, rebuilt when the (count, max updated_at) stamp moves.
+    The stamp is re-read at most every PRODUCT_INDEX_STAMP_TTL seconds, so an
+    edit made in one gunicorn worker reaches the others within that window.
+    """
+    global _index, _stamp, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < settings.PRODUCT_INDEX_STAMP_TTL:
+        return _index
+
+    with _lock:
+        stamp = _current_stamp()
+        if _index is None or stamp != _stamp:
+            _index, _stamp = _build(), stamp
+        _checked_at = time.monotonic()
+        return _index
+
+
+def invalidate():
+    """Force the next lookup in this process to re-check the stamp."""
+    global _checked_at
+    _checked_at = 0.0
+
+
+def lookup(prefix, limit=10):
+    return get_index().search(prefix, limit)
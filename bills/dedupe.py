@@ -0,0 +1,331 @@
+import re
+from collections import Counter, defaultdict, namedtuple
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .integrity import refresh_customer_totals, update_rows
+from .models import ArchivedBill, Bill, ChangeLog, Customer, LedgerEntry, MergeProposal
+
+# Names below these similarities (0-1, difflib ratio) are not proposed
+PHONE_THRESHOLD = 0.6    # same phone number: only the spelling has to be close
+NAME_THRESHOLD = 0.85    # same phonetic key only
+MAX_BLOCK = 100          # larger blocks are too generic to compare pairwise (e.g. a shared shop phone)
+BATCH = 900              # ids per IN (...) clause
+
+HONORIFICS = {'mr', 'mrs', 'ms', 'miss', 'shri', 'sri', 'shree', 'smt', 'kumari', 'dr', 'messrs'}
+_FIRM = re.compile(r'\bm\s*/\s*s\b')
+_NON_WORD = re.compile(r'[\W_]+')
+_DIGRAPHS = (('ph', 'f'), ('bh', 'b'), ('dh', 'd'), ('th', 't'), ('kh', 'k'), ('gh', 'g'),
+             ('sh', 's'), ('ch', 'c'), ('ck', 'k'), ('ee', 'i'), ('oo', 'u'))
+_LETTERS = str.maketrans('qwzy', 'kvji')
+_VOWELS = set('aeiouh')
+
+Candidate = namedtuple('Candidate', 'id name phone key bills')
+
+
+# ---------------------------------------
+# Normalising names and phones
+#
+#   "Shri Ramesh Kumar "  -> "kumar ramesh"   (tokens sorted, honorifics dropped)
+#   "+91 98765-43210"     -> "9876543210"     (last 10 digits)
+#   phonetic key          -> "kmr rms"        (sorted token keys, see phonetic())
+# ---------------------------------------
+def name_tokens(name):
+    text = _FIRM.sub(' ', (name or '').lower())
+    return [t for t in _NON_WORD.split(text) if t and t not in HONORIFICS]
+
+
+def normalize_name(name):
+    return ' '.join(sorted(name_tokens(name)))
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] if len(digits) >= 7 else ''
+
+
+def phonetic(token):
+    """
+    A short sound-alike key for one name token, tuned to romanised Indian
+    names: aspirates fold into the plain consonant (bh -> b, sh -> s), vowels
+    after the first letter and repeated letters are dropped.
+    """
+    if token.isdigit():
+        return token
+    for pair, plain in _DIGRAPHS:
+        token = token.replace(pair, plain)
+    token = token.translate(_LETTERS)
+    key = 'a' if token[0] in _VOWELS else token[0]
+    for ch in token[1:]:
+        if ch not in _VOWELS and ch != key[-1]:
+            key += ch
+    return key[:6]
+
+
+def name_key(name):
+    return ' '.join(sorted(phonetic(t) for t in name_tokens(name)))
+
+
+def similarity(a, b):
+    """difflib ratio of two normalized names."""
+    if a == b:
+        return 1.0
+    matcher = SequenceMatcher(None, a, b)
+    return matcher.ratio() if matcher.real_quick_ratio() >= PHONE_THRESHOLD else 0.0
+
+
+def match(a, b):
+    """(score, reason) when ``a`` and ``b`` look like the same customer, else None."""
+    if a.phone and b.phone and a.phone != b.phone:
+        return None
+    score = similarity(a.name, b.name)
+    if score == 1.0:
+        return score, 'same name'
+    if a.phone and a.phone == b.phone and score >= PHONE_THRESHOLD:
+        return score, f'same phone {a.phone}'
+    if a.key == b.key and score >= NAME_THRESHOLD:
+        return score, 'similar name'
+    return None
+
+
+def _candidate(id, name, phone, bills):
+    return Candidate(id, normalize_name(name), normalize_phone(phone), name_key(name), bills)
+
+
+def _blocks(candidates):
+    """Candidates sharing a phone or a phonetic key; only pairs inside a block are compared."""
+    blocks = defaultdict(list)
+    for c in candidates:
+        if c.phone:
+            blocks['p', c.phone].append(c)
+        if c.key:
+            blocks['k', c.key].append(c)
+    return blocks
+
+
+# ---------------------------------------
+# Scan: replace the pending proposals
+# ---------------------------------------
+def _clusters(customers, log):
+    """Union-find over matching pairs -> [(members, [(score, reason), ...])]."""
+    parent = {c.id: c.id for c in customers}
+
+    def root(cid):
+        while parent[cid] != cid:
+            parent[cid] = parent[parent[cid]]
+            cid = parent[cid]
+        return cid
+
+    edges = defaultdict(list)
+    skipped = compared = 0
+    for key, block in _blocks(customers).items():
+        if len(block) > MAX_BLOCK:
+            skipped += 1
+            continue
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                compared += 1
+                found = match(a, b)
+                if found:
+                    edges[a.id, b.id].append(found)
+                    parent[root(a.id)] = root(b.id)
+
+    members = defaultdict(list)
+    for c in customers:
+        members[root(c.id)].append(c)
+    matches = defaultdict(list)
+    for (a, _), found in edges.items():
+        matches[root(a)].extend(found)
+    log(f"{len(customers)} customers: {compared} pairs compared, {skipped} oversized block(s) skipped")
+    return [(group, matches[r]) for r, group in members.items() if len(group) > 1]
+
+
+def _summary(found):
+    score = min(s for s, _ in found)
+    reasons = ', '.join(sorted({r for _, r in found}))
+    return score, reasons[:200]
+
+
+def scan(log=lambda msg: None):
+    """Propose customer merges and orphan-bill relinks; returns counts."""
+    bills = Counter(dict(Bill.objects.filter(customer__isnull=False).order_by()
+                         .values_list('customer_id').annotate(n=Count('id'))))
+    customers = [_candidate(cid, name, phone, bills[cid])
+                 for cid, name, phone in Customer.objects.order_by('id').values_list('id', 'name', 'phone')]
+    rejected = {
+        (kind, target, frozenset(sources or names))
+        for kind, target, sources, names in MergeProposal.objects.filter(status=MergeProposal.REJECTED)
+        .values_list('kind', 'target_id', 'sources', 'names')
+    }
+
+    # Merges: the customer with most bills (then the oldest) absorbs the rest
+    proposals, target_of = [], {}
+    for group, found in _clusters(customers, log):
+        target = max(group, key=lambda c: (c.bills, -c.id))
+        sources = sorted(c.id for c in group if c is not target)
+        for c in group:
+            target_of[c.id] = target.id
+        if (MergeProposal.MERGE, target.id, frozenset(sources)) in rejected:
+            continue
+        score, reason = _summary(found)
+        proposals.append(MergeProposal(kind=MergeProposal.MERGE, target_id=target.id, sources=sources,
+                                       bills=sum(c.bills for c in group if c is not target),
+                                       score=round(score, 3), reason=reason))
+
+    # Relinks: bills without a customer, one group per typed name
+    orphans = defaultdict(Counter)
+    for name, phone, n in (Bill.objects.filter(customer__isnull=True).exclude(customer_name__isnull=True)
+                           .exclude(customer_name='').order_by().values_list('customer_name', 'phone')
+                           .annotate(n=Count('id'))):
+        orphans[name][normalize_phone(phone)] += n
+    by_phone, by_key = defaultdict(list), defaultdict(list)
+    for c in customers:
+        if c.phone:
+            by_phone[c.phone].append(c)
+        by_key[c.key].append(c)
+
+    relinks = defaultdict(list)
+    for name, phones in orphans.items():
+        phone = max(phones, key=lambda p: (bool(p), phones[p]))
+        orphan = _candidate(None, name, phone, sum(phones.values()))
+        if not orphan.name:
+            continue
+        best = None
+        for c in by_phone.get(orphan.phone, []) + by_key.get(orphan.key, []):
+            found = match(orphan, c)
+            if found and (best is None or (found[0], c.bills) > (best[0][0], best[1].bills)):
+                best = found, c
+        if best:
+            target = target_of.get(best[1].id, best[1].id)
+            if (MergeProposal.RELINK, target, frozenset([name])) not in rejected:
+                relinks[target].append((name, orphan.bills, best[0]))
+    for target, rows in relinks.items():
+        score, reason = _summary([found for _, _, found in rows])
+        proposals.append(MergeProposal(kind=MergeProposal.RELINK, target_id=target,
+                                       names=sorted(name for name, _, _ in rows),
+                                       bills=sum(n for _, n, _ in rows), score=round(score, 3), reason=reason))
+
+    with transaction.atomic():
+        MergeProposal.objects.filter(status=MergeProposal.PENDING).delete()
+        MergeProposal.objects.bulk_create(proposals, batch_size=1000)
+    report = {
+        'merges': sum(p.kind == MergeProposal.MERGE for p in proposals),
+        'relinks': sum(p.kind == MergeProposal.RELINK for p in proposals),
+        'bills': sum(p.bills for p in proposals),
+    }
+    log(f"Proposed {report['merges']} merge(s) and {report['relinks']} relink(s) covering {report['bills']} bill(s)")
+    return report
+
+
+# ---------------------------------------
+# Apply: set-based moves, one recompute per target
+#
+# Bills move with one executemany UPDATE and are journalled as the usual
+# "moved out" / "moved in" adjustment pair (LedgerEntry.bill_change_entries),
+# so every ledger and bill still replays. Archived bills follow their
+# customer. Source customers are then deleted and each target's totals
+# recomputed once from its bills.
+# ---------------------------------------
+def _resolve(moved_to, cid):
+    seen = set()
+    while cid in moved_to and cid not in seen:
+        seen.add(cid)
+        cid = moved_to[cid]
+    return cid
+
+
+def _in_batches(values):
+    values = list(values)
+    for start in range(0, len(values), BATCH):
+        yield values[start:start + BATCH]
+
+
+def apply(proposals, user=None, log=lambda msg: None):
+    """Apply pending ``proposals`` (MergeProposal instances); returns counts."""
+    proposals = [p for p in proposals if p.status == MergeProposal.PENDING]
+    moved_to = {s: p.target_id for p in proposals if p.kind == MergeProposal.MERGE
+                for s in p.sources if s != p.target_id}
+    relink_to = {name: p.target_id for p in proposals if p.kind == MergeProposal.RELINK for name in p.names}
+
+    with transaction.atomic():
+        customers = Customer.objects.in_bulk(set(moved_to) | set(moved_to.values()) | set(relink_to.values()))
+        moved_to = {s: _resolve(moved_to, s) for s in moved_to if s in customers}
+        moved_to = {s: t for s, t in moved_to.items() if t in customers and t != s}
+        relink_to = {n: _resolve(moved_to, t) for n, t in relink_to.items()}
+        relink_to = {n: t for n, t in relink_to.items() if t in customers}
+        targets = {customers[t] for t in set(moved_to.values()) | set(relink_to.values())}
+
+        # Targets keep their own details and fill blanks from their sources (oldest first)
+        changed = defaultdict(list)
+        for source_id in sorted(moved_to):
+            source, target = customers[source_id], customers[moved_to[source_id]]
+            for field in ('phone', 'address', 'gstin', 'state_code'):
+                if not getattr(target, field) and getattr(source, field):
+                    setattr(target, field, getattr(source, field))
+                    changed[target].append(field)
+        for target, fields in changed.items():
+            target.save(update_fields=fields)
+
+        # Bills to move: (row, target id)
+        fields = ('id', 'sync_id', 'bill_no', 'customer_name', 'phone', *LedgerEntry.BILL_FIELDS)
+        moving = []
+        for chunk in _in_batches(moved_to):
+            moving += [(row, moved_to[row['customer_id']])
+                       for row in Bill.objects.filter(customer_id__in=chunk).values(*fields)]
+        for chunk in _in_batches(relink_to):
+            moving += [(row, relink_to[row['customer_name']])
+                       for row in Bill.objects.filter(customer__isnull=True, customer_name__in=chunk).values(*fields)]
+
+        entries, rows = [], []
+        for row, target_id in moving:
+            target = customers[target_id]
+            moved = Bill(id=row['id'], bill_no=row['bill_no'], customer_id=target_id, total_amount=row['total_amount'],
+                         returned_amount=row['returned_amount'], paid_amount=row['paid_amount'])
+            entries += LedgerEntry.bill_change_entries(moved, row)
+            rows.append((target_id, target.name, target.phone or row['phone'], row['id']))
+        update_rows(Bill, ('customer', 'customer_name', 'phone'), rows)
+        LedgerEntry.objects.bulk_create(entries, batch_size=2000)
+        ChangeLog.record_many(Bill, [row['sync_id'] for row, _ in moving])
+
+        # Closed years: no journal, the archived amounts are already off every ledger
+        archived = []
+        for chunk in _in_batches(moved_to):
+            archived += [(moved_to[cid], aid) for aid, cid in
+                         ArchivedBill.objects.filter(customer_id__in=chunk).values_list('id', 'customer_id')]
+        for chunk in _in_batches(relink_to):
+            archived += [(relink_to[name], aid) for aid, name in
+                         ArchivedBill.objects.filter(customer__isnull=True, customer_name__in=chunk)
+                         .values_list('id', 'customer_name')]
+        update_rows(ArchivedBill, ('customer', 'customer_name', 'phone'),
+                    [(t, customers[t].name, customers[t].phone, aid) for t, aid in archived])
+
+        # Sources are empty now; a queryset delete skips Customer.delete(), so log it here
+        for chunk in _in_batches(moved_to):
+            ChangeLog.record_many(Customer, [customers[s].sync_id for s in chunk], ChangeLog.DELETE)
+            Customer.objects.filter(id__in=chunk).delete()
+
+        target_ids = [t.id for t in targets]
+        for chunk in _in_batches(target_ids):
+            refresh_customer_totals(chunk)
+            Customer.bump_ledger_version(*chunk)
+        _decide(proposals, MergeProposal.APPLIED, user)
+
+    report = {'merged': len(moved_to), 'targets': len(target_ids), 'bills': len(moving), 'archived': len(archived)}
+    log(f"Merged {report['merged']} customer(s) into {report['targets']}, moved {report['bills']} bill(s)")
+    return report
+
+
+def reject(proposals, user=None):
+    """Rejected proposals are not proposed again by later scans."""
+    return _decide([p for p in proposals if p.status == MergeProposal.PENDING], MergeProposal.REJECTED, user)
+
+
+def _decide(proposals, status, user):
+    decided_by = user if user is not None and user.is_authenticated else None
+    return sum(
+        MergeProposal.objects.filter(id__in=chunk).update(status=status, decided_at=timezone.now(), decided_by=decided_by)
+        for chunk in _in_batches(p.id for p in proposals)
+    )
@@ -0,0 +1,169 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.conf import settings
+
+from .models import Bill, BillItem
+from .reports import fetch_raw, paise
+
+PAISA = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+# ---------------------------------------
+# Per-line tax (called from BillItem.save / Bill.update_total)
+# ---------------------------------------
+def split_tax(taxable, rate, inter_state):
+    """(cgst, sgst, igst) on ``taxable`` at ``rate`` percent, each rounded to the paisa."""
+    taxable, rate = Decimal(taxable or 0), Decimal(rate or 0)
+    if not rate:
+        return ZERO, ZERO, ZERO
+    if inter_state:
+        return ZERO, ZERO, (taxable * rate / 100).quantize(PAISA, ROUND_HALF_UP)
+    half = (taxable * rate / 200).quantize(PAISA, ROUND_HALF_UP)
+    return half, half, ZERO
+
+
+def parse_rate(value):
+    """A posted GST rate as Decimal percent (blank = 0); ValueError unless it is one of GST_RATES."""
+    try:
+        rate = Decimal(str(value).strip() if value not in (None, '') else 0)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"GST rate {value!r} is not a number.")
+    if rate not in {Decimal(r) for r in settings.GST_RATES}:
+        raise ValueError(f"GST rate {value!r} is not one of {', '.join(settings.GST_RATES)}.")
+    return rate
+
+
+def apply_line_taxes(item, inter_state):
+    """Set item.cgst/sgst/igst; True when any of them changed."""
+    taxes = split_tax(item.total, item.gst_rate, inter_state)
+    changed = taxes != (item.cgst, item.sgst, item.igst)
+    item.cgst, item.sgst, item.igst = taxes
+    return changed
+
+
+# ---------------------------------------
+# GSTR-1 style period export
+#
+# One query pulls every line of the period as integer paise together with
+# its bill's GSTIN, place of supply and invoice value; NumPy then classifies
+# the lines (B2B / B2CL / B2CS) and sums them per group. The B2CL/B2CS split
+# depends on the whole invoice value, which is what makes a plain SQL
+# GROUP BY awkward here.
+# ---------------------------------------
+MONEY_COLUMNS = ('taxable', 'cgst', 'sgst', 'igst')
+
+
+def _group(np, codes, mask, sums):
+    """
+    Group the rows selected by ``mask`` on the integer ``codes`` columns.
+    Returns (first row index of each group, {name: list of summed rupees}).
+    """
+    rows = np.flatnonzero(mask)
+    if not len(rows):
+        return [], {name: [] for name in sums}
+    dims = [int(c.max()) + 1 for c in codes]
+    key = np.ravel_multi_index([c[rows] for c in codes], dims)
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return rows[first].tolist(), {
+        name: (np.bincount(inverse, weights=values[rows]) / 100).round(2).tolist()
+        for name, values in sums.items()
+    }
+
+
+def gstr1(date_from, date_to):
+    """
+    GSTR-1 sections for bills dated in [date_from, date_to]. Amounts are
+    rupees as numbers (as in the portal JSON); rates are percentages.
+    """
+    import numpy as np
+
+    period = BillItem.objects.filter(bill__date__range=[date_from, date_to]).order_by()
+    lines = fetch_raw(
+        period.values_list('bill_id', 'bill__customer__gstin', 'bill__place_of_supply', 'hsn_code', 'quantity')
+        .annotate(rate=paise('gst_rate'), invoice=paise('bill__total_amount'), taxable=paise('total'),
+                  cgst_p=paise('cgst'), sgst_p=paise('sgst'), igst_p=paise('igst'))
+    )
+    report = {'period': [str(date_from), str(date_to)], 'b2b': [], 'b2cl': [], 'b2cs': [], 'hsn': []}
+    if not lines:
+        return report
+
+    (bill_col, gstin_col, pos_col, hsn_col, qty_col, rate_col,
+     invoice_col, taxable_col, cgst_col, sgst_col, igst_col) = zip(*lines)
+    n = len(lines)
+
+    def ints(col):
+        return np.fromiter((v or 0 for v in col), dtype=np.int64, count=n)
+
+    def factorize(col):
+        return np.unique(np.array([v or '' for v in col], dtype=object).astype(str), return_inverse=True)
+
+    money = {'taxable': ints(taxable_col), 'cgst': ints(cgst_col), 'sgst': ints(sgst_col), 'igst': ints(igst_col)}
+    invoice_value = ints(invoice_col)
+    bill_labels, bill_codes = np.unique(ints(bill_col), return_inverse=True)
+    rate_labels, rate_codes = np.unique(ints(rate_col), return_inverse=True)
+    pos_labels, pos_codes = factorize(pos_col)
+    hsn_labels, hsn_codes = factorize(hsn_col)
+    gstin_labels, gstin_codes = factorize(gstin_col)
+
+    # Classify every line by its invoice
+    pos = pos_labels[pos_codes]
+    registered = gstin_labels[gstin_codes] != ''
+    home = settings.GST_STATE_CODE
+    inter_state = (pos != '') & (pos != home) if home else np.zeros(n, dtype=bool)
+    large = inter_state & ~registered & (invoice_value > settings.GST_B2CL_LIMIT * 100)
+    small = ~registered & ~large
+
+    rates = (rate_labels / 100).round(2).tolist()
+    rate_of = rate_codes.tolist()
+    pos_of = pos.tolist()
+
+    def money_rows(keys, sums):
+        return [dict(row, **{name: sums[name][k] for name in MONEY_COLUMNS}) for k, row in enumerate(keys)]
+
+    # Invoice headers (no., date, name) for the period in one more query
+    headers = {
+        bill_id: (bill_no, str(day), name) for bill_id, bill_no, day, name in
+        fetch_raw(Bill.objects.filter(date__range=[date_from, date_to]).order_by()
+               .values_list('id', 'bill_no', 'date', 'customer_name'))
+    }
+    bill_of = bill_labels[bill_codes].tolist()
+    gstin_of = gstin_labels[gstin_codes].tolist()
+    invoice_of = (invoice_value / 100).round(2).tolist()
+
+    def invoice_rows(mask):
+        first, sums = _group(np, [bill_codes, rate_codes], mask, money)
+        keys = []
+        for i in first:
+            bill_no, day, name = headers[bill_of[i]]
+            keys.append({
+                'gstin': gstin_of[i], 'customer': name or '', 'invoice_no': bill_no, 'invoice_date': day,
+                'invoice_value': invoice_of[i], 'place_of_supply': pos_of[i], 'rate': rates[rate_of[i]],
+            })
+        return money_rows(keys, sums)
+
+    report['b2b'] = invoice_rows(registered)
+    report['b2cl'] = invoice_rows(large)
+
+    first, sums = _group(np, [pos_codes, rate_codes], small, money)
+    report['b2cs'] = money_rows([{'place_of_supply': pos_of[i], 'rate': rates[rate_of[i]]} for i in first], sums)
+
+    quantity = ints(qty_col)
+    first, sums = _group(np, [hsn_codes, rate_codes], np.ones(n, dtype=bool), dict(money, quantity=quantity * 100))
+    report['hsn'] = money_rows([
+        {'hsn': str(hsn_labels[hsn_codes[i]]), 'rate': rates[rate_of[i]], 'quantity': int(q)}
+        for i, q in zip(first, sums['quantity'])
+    ], sums)
+    return report
+
+
+SECTIONS = ('b2b', 'b2cl', 'b2cs', 'hsn')
+
+
+def section_rows(report, section):
+    """Header + rows of one report section, for CSV export."""
+    rows = report[section]
+    if not rows:
+        return []
+    header = list(rows[0])
+    return [header] + [[row[h] for h in header] for row in rows]
@@ -0,0 +1,274 @@
+from collections import namedtuple
+
+from django.db import connection, connections, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Bill, BillItem, BillReturn, ChangeLog, Customer, LedgerEntry, Payment
+from .money import rupees
+from .reports import fetch_raw, paise
+
+# Money is compared as integer paise throughout
+Amounts = namedtuple('Amounts', 'total returned paid is_paid')
+BillDrift = namedtuple('BillDrift', 'bill_id customer_id stored expected')
+CustomerDrift = namedtuple('CustomerDrift', 'customer_id stored expected')   # (total, paid, remaining)
+
+BILL_COLUMNS = ('total_amount', 'returned_amount', 'paid_amount', 'is_paid')
+CUSTOMER_COLUMNS = ('total_amount', 'paid_amount', 'remaining_amount')
+
+
+# ---------------------------------------
+# What a bill should hold, from its rows
+#
+#   total    = item totals + item GST + packing qty × rate + extra   (Bill.update_total)
+#   returned = sum of BillReturn amounts
+#   paid     = sum of positive payments (Bill.PAID_PAYMENTS)
+#   is_paid  = paid >= net total > 0                                 (Bill._refresh_paid_flag)
+#
+# Customer columns are then the sums over its bills (Customer.refresh_totals).
+# ---------------------------------------
+def _packing_paise():
+    return F('packing_qty') * paise('packing_rate')
+
+
+def _sums(qs, expression):
+    return dict(fetch_raw(qs.order_by().values_list('bill_id').annotate(s=Sum(expression))))
+
+
+def check_range(bounds):
+    """
+    Recompute bills with lo <= id <= hi. Returns (drifted bills, per-customer
+    expected {customer_id: [net, paid]}) so the caller can merge partitions.
+    """
+    lo, hi = bounds
+    # FK columns have no __range lookup
+    return _check({'id__range': (lo, hi)}, {'bill_id__gte': lo, 'bill_id__lte': hi})
+
+
+def check_ids(bill_ids):
+    """check_range for an explicit set of bills (keep it under ~900 ids on SQLite)."""
+    return _check({'id__in': bill_ids}, {'bill_id__in': bill_ids})
+
+
+def _check(bill_filter, row_filter):
+    items = _sums(BillItem.objects.filter(**row_filter),
+                  paise('total') + paise('cgst') + paise('sgst') + paise('igst'))
+    returns = _sums(BillReturn.objects.filter(**row_filter), paise('amount'))
+    payments = _sums(Payment.objects.filter(Bill.PAID_PAYMENTS, **row_filter), paise('amount'))
+    bills = fetch_raw(
+        Bill.objects.filter(**bill_filter).order_by()
+        .values_list('id', 'customer_id', 'is_paid')
+        .annotate(total=paise('total_amount'), returned=paise('returned_amount'), paid=paise('paid_amount'),
+                  packing=_packing_paise(), extra=paise('extra_amount'))
+    )
+
+    drift, per_customer = [], {}
+    for bill_id, customer_id, is_paid, total, returned, paid, packing, extra in bills:
+        e_total = items.get(bill_id, 0) + (packing or 0) + (extra or 0)
+        e_returned = returns.get(bill_id, 0)
+        e_paid = payments.get(bill_id, 0)
+        e_net = max(e_total - e_returned, 0)
+        expected = Amounts(e_total, e_returned, e_paid, e_paid >= e_net > 0)
+        stored = Amounts(total or 0, returned or 0, paid or 0, bool(is_paid))
+        if stored != expected:
+            drift.append(BillDrift(bill_id, customer_id, stored, expected))
+        if customer_id:
+            sums = per_customer.setdefault(customer_id, [0, 0])
+            sums[0] += e_net
+            sums[1] += e_paid
+    return drift, per_customer
+
+
+def partitions(chunk):
+    bounds = Bill.objects.order_by('id').values_list('id', flat=True)
+    lo, hi = bounds.first(), bounds.last()
+    if lo is None:
+        return []
+    return [(start, min(start + chunk - 1, hi)) for start in range(lo, hi + 1, chunk)]
+
+
+def _init_worker():
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def check_bills(workers=1, chunk=50_000):
+    """Run check_range over every partition, in a process pool when workers > 1."""
+    ranges = partitions(chunk)
+    drift, per_customer = [], {}
+
+    def merge(result):
+        bills, sums = result
+        drift.extend(bills)
+        for cid, (net, paid) in sums.items():
+            total = per_customer.setdefault(cid, [0, 0])
+            total[0] += net
+            total[1] += paid
+
+    if workers > 1 and len(ranges) > 1:
+        from multiprocessing import Pool
+
+        connections.close_all()   # forked children must not share the parent's connection
+        with Pool(workers, initializer=_init_worker) as pool:
+            for result in pool.imap_unordered(check_range, ranges):
+                merge(result)
+    else:
+        for bounds in ranges:
+            merge(check_range(bounds))
+    drift.sort()
+    return drift, per_customer
+
+
+def check_customers(per_customer):
+    """Customers whose stored totals differ from the sums of their recomputed bills."""
+    rows = fetch_raw(
+        Customer.objects.order_by('id').values_list('id')
+        .annotate(t=paise('total_amount'), p=paise('paid_amount'), r=paise('remaining_amount'))
+    )
+    drift = []
+    for customer_id, total, paid, remaining in rows:
+        net, e_paid = per_customer.get(customer_id, (0, 0))
+        expected = (net, e_paid, max(net - e_paid, 0))
+        stored = (total or 0, paid or 0, remaining or 0)
+        if stored != expected:
+            drift.append(CustomerDrift(customer_id, stored, expected))
+    return drift
+
+
+# ---------------------------------------
+# Report + repair
+# ---------------------------------------
+def csv_rows(bill_drift, customer_drift):
+    """Header + one row per differing column."""
+    yield ['scope', 'id', 'customer_id', 'column', 'stored', 'expected']
+    for d in bill_drift:
+        for column, stored, expected in zip(BILL_COLUMNS, d.stored, d.expected):
+            if stored != expected:
+                if column != 'is_paid':
+                    stored, expected = rupees(stored), rupees(expected)
+                yield ['bill', d.bill_id, d.customer_id or '', column, stored, expected]
+    for d in customer_drift:
+        for column, stored, expected in zip(CUSTOMER_COLUMNS, d.stored, d.expected):
+            if stored != expected:
+                yield ['customer', d.customer_id, d.customer_id, column, rupees(stored), rupees(expected)]
+
+
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def update_rows(model, columns, rows, key='id'):
+    """
+    UPDATE ... WHERE <key> = %s for every (values..., key) row, as one
+    executemany. bulk_update() builds a CASE WHEN per column instead, which
+    gets slow for hundreds of thousands of rows.
+    """
+    fields = [model._meta.get_field(c) for c in columns]
+    key_field = model._meta.get_field(key)
+    quote = connection.ops.quote_name
+    sql = "UPDATE {} SET {} WHERE {} = %s".format(
+        quote(model._meta.db_table), ", ".join(f"{quote(f.column)} = %s" for f in fields), quote(key_field.column),
+    )
+    params = [
+        [f.get_db_prep_save(v, connection) for f, v in zip(fields, row[:-1])]
+        + [key_field.get_db_prep_value(row[-1], connection)]
+        for row in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def refresh_customer_totals(customer_ids):
+    """Customer.refresh_totals() for many customers at once, summed in integer paise."""
+    if not customer_ids:
+        return
+    sums = {cid: (0, 0) for cid in customer_ids}
+    net = Greatest(paise('total_amount') - paise('returned_amount'), Value(0))
+    for cid, total, paid in fetch_raw(
+        Bill.objects.filter(customer_id__in=customer_ids).order_by().values_list('customer_id')
+        .annotate(t=Sum(net), p=Sum(paise('paid_amount')))
+    ):
+        sums[cid] = (total or 0, paid or 0)
+    update_rows(Customer, CUSTOMER_COLUMNS, [
+        (rupees(total), rupees(paid), rupees(max(total - paid, 0)), cid) for cid, (total, paid) in sums.items()
+    ])
+
+
+def repair(bill_drift, customer_drift, batch_size=1000, note="Ledger repair (verify_ledger)"):
+    """
+    Write the expected values back in batched updates. Every bill whose net
+    or paid amount moves gets an ADJUSTMENT journal entry for the difference,
+    so verify_journal still agrees afterwards.
+    """
+    today, now = timezone.localdate(), timezone.now()
+    touched = set()
+
+    for batch in _batches(bill_drift, batch_size):
+        with transaction.atomic():
+            update_rows(Bill, BILL_COLUMNS, [
+                (rupees(d.expected.total), rupees(d.expected.returned), rupees(d.expected.paid),
+                 d.expected.is_paid, d.bill_id)
+                for d in batch
+            ])
+            Bill.objects.filter(id__in=[d.bill_id for d in batch if d.expected.is_paid and not d.stored.is_paid],
+                                paid_date__isnull=True).update(paid_date=now)
+            Bill.objects.filter(id__in=[d.bill_id for d in batch if d.stored.is_paid and not d.expected.is_paid]
+                                ).update(paid_date=None)
+
+            entries = []
+            for d in batch:
+                debit = (max(d.expected.total - d.expected.returned, 0)
+                         - max(d.stored.total - d.stored.returned, 0))
+                credit = d.expected.paid - d.stored.paid
+                if debit or credit:
+                    entries.append(LedgerEntry(customer_id=d.customer_id, bill_id=d.bill_id,
+                                               kind=LedgerEntry.ADJUSTMENT, date=today,
+                                               debit=rupees(debit), credit=rupees(credit),
+                                               note=note))
+            LedgerEntry.objects.bulk_create(entries)
+            ChangeLog.record_many(Bill, list(Bill.objects.filter(id__in=[d.bill_id for d in batch])
+                                             .values_list('sync_id', flat=True)))
+            touched.update(d.customer_id for d in batch)
+
+    for batch in _batches(customer_drift, batch_size):
+        with transaction.atomic():
+            update_rows(Customer, CUSTOMER_COLUMNS, [
+                tuple(rupees(v) for v in d.expected) + (d.customer_id,) for d in batch
+            ])
+            touched.update(d.customer_id for d in batch)
+
+    touched.discard(None)
+    for ids in _batches(sorted(touched), batch_size):
+        Customer.bump_ledger_version(*ids)
+    return len(bill_drift), len(customer_drift)
+
+
+def resync_bills(bill_ids, note, taxes=False, batch_size=900):
+    """
+    Bring bills back in line with their rows after set-wise deletes of items,
+    payments or returns: repair() the drifted ones (journalled under ``note``),
+    then refresh their customers. ``taxes`` also re-sums the taxable and GST
+    columns, which only items feed.
+    """
+    drift, customers = [], set()
+    for batch in _batches(sorted(bill_ids), batch_size):
+        if taxes:
+            sums = {bill_id: rest for bill_id, *rest in fetch_raw(
+                BillItem.objects.filter(bill_id__in=batch).order_by().values_list('bill_id')
+                .annotate(t=Sum(paise('total')), c=Sum(paise('cgst')), s=Sum(paise('sgst')), i=Sum(paise('igst')))
+            )}
+            update_rows(Bill, ('taxable_amount', 'cgst_amount', 'sgst_amount', 'igst_amount'), [
+                tuple(rupees(v or 0) for v in sums.get(bill_id, (0, 0, 0, 0))) + (bill_id,) for bill_id in batch
+            ])
+        drift += check_ids(batch)[0]
+        customers.update(Bill.objects.filter(id__in=batch).values_list('customer_id', flat=True))
+    repair(drift, [], batch_size, note=note)
+
+    customers.discard(None)
+    for batch in _batches(sorted(customers), batch_size):
+        refresh_customer_totals(batch)
+        Customer.bump_ledger_version(*batch)
+    return len(drift)
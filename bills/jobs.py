@@ -0,0 +1,316 @@
+import csv
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Job
+
+# kind -> callable(ctx)
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register a function as the runner for jobs of ``kind``."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+# ---------------------------------------
+# Queue API
+# ---------------------------------------
+def enqueue(kind, payload=None, user=None, run_after=None, max_attempts=3):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        created_by=user if user is not None and user.is_authenticated else None,
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def claim_next(worker_id):
+    """Atomically move the oldest due job to RUNNING and return it (or None)."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'id')
+
+    if connection.features.has_select_for_update_skip_locked:
+        # PostgreSQL / MySQL 8: concurrent workers skip each other's rows
+        with transaction.atomic():
+            job = due.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = Job.RUNNING
+            job.locked_by = worker_id
+            job.locked_at = now
+            job.attempts += 1
+            job.save(update_fields=['status', 'locked_by', 'locked_at', 'attempts'])
+            return job
+
+    # SQLite: compare-and-set on status; the write lock serialises claimers
+    for job_id in due.values_list('id', flat=True)[:10]:
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def heartbeat(worker_id, job_ids=None):
+    """Refresh the lock of jobs ``worker_id`` is still running, so requeue_stale() leaves them alone."""
+    running = Job.objects.filter(status=Job.RUNNING, locked_by=worker_id)
+    if job_ids is not None:
+        running = running.filter(id__in=job_ids)
+    return running.update(locked_at=timezone.now())
+
+
+def requeue_stale():
+    """
+    Jobs whose worker died mid-run (no heartbeat for JOB_LOCK_TIMEOUT) go back
+    to the queue; those out of attempts fail, so a job that keeps killing its
+    worker is not retried forever.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT))
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now, locked_by=None, locked_at=None,
+        error="Worker stopped responding on the last attempt.",
+    )
+    return stale.update(status=Job.QUEUED, locked_by=None, locked_at=None)
+
+
+class JobContext:
+    def __init__(self, job):
+        self.job = job
+        self.payload = job.payload or {}
+
+    def progress(self, percent, note=''):
+        percent = max(0, min(100, int(percent)))
+        # Reporting progress also renews the lock (a heartbeat between the worker's own)
+        Job.objects.filter(id=self.job.id).update(progress=percent, progress_note=note[:200],
+                                                  locked_at=timezone.now())
+
+    def result_path(self, filename):
+        folder = Path(settings.JOB_RESULTS_DIR)
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder / f"{self.job.id}-{filename}"
+
+
+def execute(job_id):
+    """Run one claimed job; called from a worker thread or process."""
+    job = Job.objects.get(id=job_id)
+    try:
+        fn = HANDLERS[job.kind]
+        outcome = fn(JobContext(job))
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            # Exponential backoff: base, 2*base, 4*base ...
+            delay = settings.JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1))
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+        job.locked_by = None
+        job.locked_at = None
+        job.save(update_fields=['error', 'status', 'run_after', 'finished_at', 'locked_by', 'locked_at'])
+    else:
+        if isinstance(outcome, Path):
+            job.result_file = str(outcome)
+        elif outcome is not None:
+            job.result = outcome
+        job.status = Job.DONE
+        job.progress = 100
+        job.finished_at = timezone.now()
+        job.save(update_fields=['result', 'result_file', 'status', 'progress', 'finished_at'])
+    finally:
+        connection.close()
+    return job.status
+
+
+# ---------------------------------------
+# Built-in handlers
+# ---------------------------------------
+@handler('rebuild_ledger')
+def rebuild_ledger(ctx):
+    from .models import Customer
+
+    customers = Customer.objects.order_by('id')
+    if ctx.payload.get('customer_ids'):
+        customers = customers.filter(id__in=ctx.payload['customer_ids'])
+
+    total = customers.count() or 1
+    for n, customer in enumerate(customers.iterator(chunk_size=500), start=1):
+        customer.refresh_totals()
+        if n % 50 == 0:
+            ctx.progress(n * 100 / total, f"{n}/{total} customers")
+    return {'customers': total}
+
+
+@handler('ledger_snapshot')
+def ledger_snapshot(ctx):
+    from django.utils.dateparse import parse_date
+    from .ledger import take_snapshots
+
+    as_of = parse_date(ctx.payload['as_of']) if ctx.payload.get('as_of') else None
+    return {'snapshots': take_snapshots(as_of)}
+
+
+@handler('statement_csv')
+def statement_csv(ctx):
+    from itertools import chain
+    from .archive import needs_archive
+    from .reports import statement_queryset, statement_rows
+
+    p = ctx.payload
+    args = (p.get('customer_name', ''), p.get('from', ''), p.get('to', ''))
+    querysets = [statement_queryset(*args)]
+    if needs_archive(args[1]):
+        # Closed years follow the live rows (both newest first)
+        querysets.append(statement_queryset(*args, archived=True))
+    total = sum(qs.count() for qs in querysets) or 1
+    path = ctx.result_path('statement.csv')
+
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(['Date', 'Customer', 'Bill No', 'Return', 'Paid', 'Total Amount', 'Remaining'])
+        rows = chain.from_iterable(statement_rows(qs) for qs in querysets)
+        for n, b in enumerate(rows, start=1):
+            writer.writerow([b.date, b.customer_name, b.bill_no, b.returns_total,
+                             b.positive_paid, b.total_amount, b.remaining_amount])
+            if n % 2000 == 0:
+                ctx.progress(n * 100 / total, f"{n}/{total} bills")
+    return path
+
+
+@handler('backup')
+def backup_db(ctx):
+    from .backup import run_backup
+
+    p = ctx.payload
+    report = run_backup(folder=p.get('dir'), full=p.get('full', False))
+    if p.get('every'):
+        # Periodic mode: queue the next run before this one is marked done
+        enqueue('backup', p, run_after=timezone.now() + timedelta(seconds=p['every']))
+    return report
+
+
+@handler('refresh_replica')
+def refresh_replica(ctx):
+    from .replica import refresh_sqlite_replica
+
+    seconds = refresh_sqlite_replica()
+    if ctx.payload.get('every'):
+        enqueue('refresh_replica', ctx.payload, run_after=timezone.now() + timedelta(seconds=ctx.payload['every']))
+    return {'seconds': round(seconds, 3)}
+
+
+@handler('sync_terminal')
+def sync_terminal(ctx):
+    from .sync import run_sync
+
+    report = run_sync(server=ctx.payload.get('server'))
+    if ctx.payload.get('every'):
+        enqueue('sync_terminal', ctx.payload, run_after=timezone.now() + timedelta(seconds=ctx.payload['every']))
+    return report
+
+
+@handler('db_maintenance')
+def db_maintenance(ctx):
+    from .maintenance import in_window, next_window, run_maintenance, window_left
+
+    p = ctx.payload
+    if p.get('every') and not in_window():
+        # Never during billing hours: wait for the window to open
+        enqueue('db_maintenance', p, run_after=next_window())
+        return {'deferred_to': next_window().isoformat()}
+
+    budget = p.get('budget') or settings.DB_MAINTENANCE_BUDGET
+    if p.get('every'):
+        budget = min(budget, window_left())
+    report = run_maintenance(budget=budget, full=p.get('full', False), convert=p.get('convert', False),
+                             progress=ctx.progress)
+    if p.get('every'):
+        enqueue('db_maintenance', p, run_after=timezone.now() + timedelta(seconds=p['every']))
+    return report
+
+
+@handler('propagate_customer')
+def propagate_customer(ctx):
+    from .bulk import propagate_customer
+
+    return propagate_customer(ctx.payload['customer_id'], progress=ctx.progress)
+
+
+@handler('dedupe_scan')
+def dedupe_scan(ctx):
+    from .dedupe import scan
+
+    return scan(log=lambda note: ctx.progress(50, note))
+
+
+@handler('dedupe_apply')
+def dedupe_apply(ctx):
+    from .dedupe import apply
+    from .models import MergeProposal
+
+    proposals = MergeProposal.objects.filter(id__in=ctx.payload.get('proposal_ids', []))
+    return apply(proposals, user=ctx.job.created_by, log=lambda note: ctx.progress(90, note))
+
+
+@handler('bank_match')
+def bank_match(ctx):
+    from .models import BankStatement
+    from .reconcile import match_statement
+
+    statement = BankStatement.objects.get(id=ctx.payload['statement_id'])
+    return match_statement(statement, log=lambda note: ctx.progress(50, note))
+
+
+@handler('bank_post')
+def bank_post(ctx):
+    from .models import BankLine
+    from .reconcile import post_lines
+
+    p = ctx.payload
+    if p.get('statement_id'):
+        lines = BankLine.objects.filter(statement_id=p['statement_id'], status=BankLine.PROPOSED,
+                                        score__gte=p.get('min_score', 0))
+    else:
+        lines = BankLine.objects.filter(id__in=p.get('line_ids', []))
+    return post_lines(lines, log=lambda note: ctx.progress(90, note))
+
+
+@handler('bills_pdf')
+def bills_pdf(ctx):
+    # WeasyPrint is heavy; only the worker that renders PDFs pays for the import
+    from weasyprint import HTML
+    from .models import Bill
+    from .reports import invoice_context
+
+    bills = Bill.objects.filter(id__in=ctx.payload.get('bill_ids', [])).prefetch_related('items')
+    total = len(bills) or 1
+    documents = []
+    for n, bill in enumerate(bills, start=1):
+        context = invoice_context(bill, list(bill.items.all()))
+        context['remaining'] = bill.remaining
+        html = render_to_string('generate_bill.html', context)
+        documents.append(HTML(string=html, base_url=str(settings.BASE_DIR)).render())
+        ctx.progress(n * 90 / total, f"{n}/{total} bills rendered")
+
+    path = ctx.result_path('bills.pdf')
+    if documents:
+        pages = [page for doc in documents for page in doc.pages]
+        documents[0].copy(pages).write_pdf(path)
+    return path
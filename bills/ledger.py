@@ -0,0 +1,81 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from .models import Bill, Customer, LedgerEntry, LedgerSnapshot
+
+ZERO = Decimal('0.00')
+
+Balance = namedtuple('Balance', 'billed paid balance')
+
+
+# ---------------------------------------
+# Point-in-time balance: snapshot + bounded tail
+# ---------------------------------------
+def balance_on(customer, day):
+    """Customer balance counting every journal entry dated on or before ``day``."""
+    entries = LedgerEntry.objects.filter(customer=customer, date__lte=day)
+    billed = paid = ZERO
+
+    snap = (LedgerSnapshot.objects.filter(customer=customer, as_of__lte=day)
+            .order_by('-as_of', '-last_entry_id').first())
+    if snap:
+        billed, paid = snap.debit_total, snap.credit_total
+        # Only what the snapshot did not already include
+        entries = entries.filter(Q(id__gt=snap.last_entry_id) | Q(date__gt=snap.as_of))
+
+    tail = entries.aggregate(d=Sum('debit'), c=Sum('credit'))
+    billed += tail['d'] or ZERO
+    paid += tail['c'] or ZERO
+    return Balance(billed, paid, billed - paid)
+
+
+def take_snapshots(as_of=None):
+    """One grouped pass over the journal -> a snapshot row per customer."""
+    as_of = as_of or timezone.localdate()
+    last_id = LedgerEntry.objects.aggregate(m=Max('id'))['m']
+    if last_id is None:
+        return 0
+
+    totals = (LedgerEntry.objects.filter(id__lte=last_id, date__lte=as_of, customer__isnull=False)
+              .order_by().values('customer_id').annotate(d=Sum('debit'), c=Sum('credit')))
+    snapshots = [
+        LedgerSnapshot(customer_id=row['customer_id'], as_of=as_of, last_entry_id=last_id,
+                       debit_total=row['d'] or ZERO, credit_total=row['c'] or ZERO)
+        for row in totals.iterator(chunk_size=2000)
+    ]
+    LedgerSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
+
+# ---------------------------------------
+# Replay the journal against the stored columns
+# ---------------------------------------
+def replay_customers():
+    """Yield (customer_id, stored_total, stored_paid, journal_debit, journal_credit) for mismatches."""
+    journal = {
+        row['customer_id']: (row['d'] or ZERO, row['c'] or ZERO)
+        for row in LedgerEntry.objects.filter(customer__isnull=False).order_by()
+        .values('customer_id').annotate(d=Sum('debit'), c=Sum('credit'))
+    }
+    for c in Customer.objects.order_by('id').values('id', 'total_amount', 'paid_amount').iterator(chunk_size=2000):
+        debit, credit = journal.get(c['id'], (ZERO, ZERO))
+        if debit != c['total_amount'] or credit != c['paid_amount']:
+            yield c['id'], c['total_amount'], c['paid_amount'], debit, credit
+
+
+def replay_bills():
+    """Same check per bill: journal vs net_total / paid_amount."""
+    journal = {
+        row['bill_id']: (row['d'] or ZERO, row['c'] or ZERO)
+        for row in LedgerEntry.objects.filter(bill__isnull=False).order_by()
+        .values('bill_id').annotate(d=Sum('debit'), c=Sum('credit'))
+    }
+    fields = ('id', 'total_amount', 'returned_amount', 'paid_amount')
+    for b in Bill.objects.order_by('id').values(*fields).iterator(chunk_size=2000):
+        net = max((b['total_amount'] or ZERO) - (b['returned_amount'] or ZERO), ZERO)
+        debit, credit = journal.get(b['id'], (ZERO, ZERO))
+        if debit != net or credit != (b['paid_amount'] or ZERO):
+            yield b['id'], net, b['paid_amount'], debit, credit
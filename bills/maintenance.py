@@ -0,0 +1,208 @@
+import sqlite3
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .backup import database_path
+
+AUTO_VACUUM = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+class _Budget:
+    """Deadline for one run; SQLite's progress handler interrupts a statement that outlives it."""
+
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds
+
+    def expired(self):
+        return time.monotonic() > self.deadline
+
+
+def _connect(path, budget):
+    # Autocommit: VACUUM and the pragmas below refuse to run inside a transaction
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.set_progress_handler(budget.expired, 10_000)
+    return conn
+
+
+def _pragma(conn, name):
+    return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+# ---------------------------------------
+# Scheduling window
+# ---------------------------------------
+def in_window(now=None):
+    start, end = settings.DB_MAINTENANCE_WINDOW
+    hour = timezone.localtime(now).hour
+    return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+
+def window_left(now=None):
+    """Seconds until the window closes (0 outside it)."""
+    now = timezone.localtime(now)
+    if not in_window(now):
+        return 0
+    end = now.replace(hour=settings.DB_MAINTENANCE_WINDOW[1], minute=0, second=0, microsecond=0)
+    if end <= now:
+        end += timedelta(days=1)
+    return (end - now).total_seconds()
+
+
+def next_window(now=None):
+    now = timezone.localtime(now)
+    start = now.replace(hour=settings.DB_MAINTENANCE_WINDOW[0], minute=0, second=0, microsecond=0)
+    return start if start > now else start + timedelta(days=1)
+
+
+# ---------------------------------------
+# Steps
+#
+# The steps share one connection to the database file, with the budget's
+# deadline armed as a progress handler: a statement still running at the
+# deadline is interrupted and rolled back (ANALYZE, incremental_vacuum and
+# the checks are all safe to abandon). A step that would start after the deadline is
+# skipped and reported as such.
+# ---------------------------------------
+def _analyze(conn, full):
+    # PRAGMA optimize alone (before SQLite 3.46) only looks at tables this
+    # connection has queried, i.e. none; ANALYZE with an analysis_limit is
+    # what it would run, bounded to ~limit rows per index.
+    had_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    conn.execute(f'PRAGMA analysis_limit = {0 if full or not had_stats else 1000}')
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA optimize')
+    return 'analyzed' if full or not had_stats else 'analyzed (sampled)'
+
+
+def _vacuum(conn, budget, convert):
+    mode = AUTO_VACUUM[_pragma(conn, 'auto_vacuum')]
+    if mode != 'incremental':
+        if not convert:
+            return f"auto_vacuum={mode}; run with --convert while billing is closed to switch to incremental"
+        # The mode only takes effect after a full rewrite of the file. VACUUM
+        # copies tables page by page in single opcodes, so the deadline cannot
+        # stop it once started; that is why the switch is an explicit option.
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return f"converted auto_vacuum {mode} → incremental (full VACUUM)"
+
+    start = left = _pragma(conn, 'freelist_count')
+    while left and not budget.expired():
+        # One page is released per sqlite3_step; executescript steps to the end
+        # (conn.execute would stop after the first page).
+        conn.executescript(f'PRAGMA incremental_vacuum({settings.DB_MAINTENANCE_VACUUM_PAGES});')
+        left = _pragma(conn, 'freelist_count')
+        time.sleep(settings.DB_MAINTENANCE_STEP_SLEEP)
+    return f"released {start - left} free pages" + (f", {left} left for the next run" if left else "")
+
+
+def _check(conn, full):
+    rows = [r[0] for r in conn.execute('PRAGMA integrity_check' if full else 'PRAGMA quick_check')]
+    fk = conn.execute('PRAGMA foreign_key_check').fetchall()
+    problems = [] if rows == ['ok'] else rows[:20]
+    problems += [f"{table} rowid {rowid}: no {parent} row" for table, rowid, parent, _ in fk[:20]]
+    return 'ok' if not problems else problems
+
+
+def _checkpoint(conn):
+    busy, log, done = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    return f"checkpointed {done}/{log} WAL frames" + (" (readers kept part of it)" if busy else "")
+
+
+def sizes(conn):
+    """File level numbers plus rows/pages/bytes per table and pages/bytes per index."""
+    conn.set_progress_handler(None, 0)
+    page_size = _pragma(conn, 'page_size')
+    report = {
+        'page_size': page_size,
+        'pages': _pragma(conn, 'page_count'),
+        'free_pages': _pragma(conn, 'freelist_count'),
+        'auto_vacuum': AUTO_VACUUM[_pragma(conn, 'auto_vacuum')],
+        'journal_mode': _pragma(conn, 'journal_mode'),
+    }
+    try:
+        usage = {name: (pages, size) for name, pages, size in conn.execute(
+            'SELECT name, pageno, pgsize FROM dbstat WHERE aggregate = TRUE')}
+    except sqlite3.OperationalError:   # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+        usage = {}
+
+    objects = conn.execute(
+        "SELECT type, name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index') ORDER BY tbl_name, name"
+    ).fetchall()
+    tables, indexes = {}, []
+    for kind, name, table in objects:
+        pages, size = usage.get(name, (None, None))
+        if kind == 'table':
+            rows = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+            tables[name] = {'table': name, 'rows': rows, 'pages': pages, 'bytes': size,
+                            'index_pages': 0, 'index_bytes': 0, 'indexes': 0}
+        else:
+            indexes.append({'index': name, 'table': table, 'pages': pages, 'bytes': size})
+    for index in indexes:
+        table = tables.get(index['table'])
+        if table and index['pages'] is not None:
+            table['index_pages'] += index['pages']
+            table['index_bytes'] += index['bytes']
+            table['indexes'] += 1
+    report['tables'] = sorted(tables.values(), key=lambda t: -(t['pages'] or 0))
+    report['indexes'] = sorted(indexes, key=lambda i: -(i['pages'] or 0))
+    return report
+
+
+# ---------------------------------------
+# One maintenance run
+# ---------------------------------------
+def run_maintenance(budget=None, full=False, convert=False, progress=None):
+    """
+    ANALYZE, incremental vacuum (or the one-off switch to auto_vacuum=INCREMENTAL
+    with ``convert``), integrity check and a size report, all within ``budget``
+    seconds (default DB_MAINTENANCE_BUDGET). ``full`` analyses every row and runs
+    integrity_check instead of quick_check.
+    """
+    path = str(database_path())
+    budget = _Budget(settings.DB_MAINTENANCE_BUDGET if budget is None else budget)
+    began = time.perf_counter()
+    conn = _connect(path, budget)
+    try:
+        before = {'pages': _pragma(conn, 'page_count'), 'free_pages': _pragma(conn, 'freelist_count')}
+        steps = [
+            ('analyze', lambda: _analyze(conn, full)),
+            ('vacuum', lambda: _vacuum(conn, budget, convert)),
+            ('integrity', lambda: _check(conn, full)),
+        ]
+        if _pragma(conn, 'journal_mode') == 'wal':
+            steps.append(('checkpoint', lambda: _checkpoint(conn)))
+
+        results = {}
+        for n, (name, step) in enumerate(steps):
+            if budget.expired():
+                results[name] = {'result': 'skipped: time budget used up', 'seconds': 0}
+            else:
+                step_began = time.perf_counter()
+                try:
+                    outcome = step()
+                except sqlite3.OperationalError as exc:
+                    if 'interrupt' not in str(exc):
+                        raise
+                    outcome = 'interrupted at the time budget and rolled back'
+                results[name] = {'result': outcome, 'seconds': round(time.perf_counter() - step_began, 3)}
+                time.sleep(settings.DB_MAINTENANCE_STEP_SLEEP)
+            if progress:
+                progress((n + 1) * 90 / len(steps), f"{name}: done")
+
+        report = sizes(conn)
+    finally:
+        conn.close()
+    report.update(steps=results, before=before, seconds=round(time.perf_counter() - began, 3))
+    return report
+
+
+def size_report():
+    conn = sqlite3.connect(f'file:{database_path()}?mode=ro', uri=True)
+    try:
+        return sizes(conn)
+    finally:
+        conn.close()
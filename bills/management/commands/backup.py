@@ -0,0 +1,116 @@
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bills import jobs
+from bills.backup import (
+    BackupError, WriterProbe, backup_dir, chains, database_path, integrity_check, restore, run_backup,
+)
+from bills.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "Hot backup of the SQLite database: online page-step copy, compressed full/delta "
+        "snapshots, rotation and a restore check of every snapshot written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Backup folder (default BACKUP_DIR)")
+        parser.add_argument("--full", action="store_true", help="Start a new chain with a full snapshot")
+        parser.add_argument("--keep", type=int, help="Chains to keep (default BACKUP_KEEP)")
+        parser.add_argument("--compression", choices=["auto", "zstd", "gzip"])
+        parser.add_argument("--pages", type=int, help="Pages per backup step (default BACKUP_PAGES_PER_STEP)")
+        parser.add_argument("--probe", action="store_true",
+                            help="Measure writer commit latency before and during the backup")
+        parser.add_argument("--schedule", type=int, metavar="SECONDS",
+                            help="Queue a periodic backup job for run_worker instead of backing up now")
+        parser.add_argument("--list", action="store_true", help="List snapshot chains")
+        parser.add_argument("--restore", metavar="SNAPSHOT", help="Rebuild a snapshot into --to")
+        parser.add_argument("--to", help="Target file for --restore (must not exist)")
+
+    def handle(self, *args, **opts):
+        try:
+            if opts["list"]:
+                return self.list_chains(opts)
+            if opts["restore"]:
+                return self.restore(opts)
+            if opts["schedule"]:
+                return self.schedule(opts)
+            self.backup(opts)
+        except BackupError as exc:
+            raise CommandError(str(exc))
+
+    def backup(self, opts):
+        probe = None
+        if opts["probe"]:
+            baseline = WriterProbe(str(database_path()))
+            baseline.start()
+            time.sleep(1.0)
+            baseline_stats = baseline.stop()
+            probe = WriterProbe(str(database_path()))
+            probe.start()
+
+        try:
+            report = run_backup(folder=opts["dir"], full=opts["full"], keep=opts["keep"],
+                                compression=opts["compression"], pages=opts["pages"], log=self.stdout.write)
+        finally:
+            during = probe.stop() if probe else None
+
+        self.stdout.write(
+            f"{report['kind']} snapshot {report['file']}: {report['changed_pages']}/{report['pages']} pages, "
+            f"{report['stored_bytes'] / 1e6:.2f} MB stored from {report['db_bytes'] / 1e6:.1f} MB "
+            f"({report['mb_per_s']} MB/s copy, {report['steps']} steps, {report['restarts']} restarts"
+            f"{', finished in one step' if report['single_step'] else ''})"
+        )
+        if probe:
+            self.stdout.write(f"writer latency before: {self.fmt(baseline_stats)}")
+            self.stdout.write(f"writer latency during: {self.fmt(during)}")
+        if report["rotated"]:
+            self.stdout.write(f"rotated out {report['rotated']} old file(s)")
+        self.stdout.write(self.style.SUCCESS(f"Restore check passed in {report['seconds']}s total."))
+
+    @staticmethod
+    def fmt(stats):
+        if not stats["writes"]:
+            return "no writes"
+        return f"{stats['writes']} writes, p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, max {stats['max_ms']} ms"
+
+    def list_chains(self, opts):
+        folder = backup_dir(opts["dir"])
+        for n, chain in enumerate(chains(folder), start=1):
+            size = sum(p.stat().st_size for p in chain)
+            self.stdout.write(f"chain {n}: {chain[0].name} + {len(chain) - 1} delta(s), {size / 1e6:.2f} MB")
+            for path in chain[1:]:
+                self.stdout.write(f"    {path.name}")
+
+    def restore(self, opts):
+        if not opts["to"]:
+            raise CommandError("--restore needs --to <new file>.")
+        target = Path(opts["to"])
+        if target.exists():
+            raise CommandError(f"{target} exists; restore into a new file and swap it in while the app is stopped.")
+        snapshot = Path(opts["restore"])
+        if not snapshot.is_absolute() and not snapshot.exists():
+            snapshot = backup_dir(opts["dir"]) / snapshot
+        restore(snapshot, target)
+        check = integrity_check(target)
+        if check != "ok":
+            raise CommandError(f"Restored file failed integrity_check: {check}")
+        self.stdout.write(self.style.SUCCESS(f"Restored {snapshot.name} → {target} (integrity_check ok)"))
+
+    def schedule(self, opts):
+        payload = {"every": opts["schedule"], "dir": opts["dir"], "full": opts["full"]}
+        queued = Job.objects.filter(kind="backup", status__in=[Job.QUEUED, Job.RUNNING])
+        if queued.exists():
+            queued.filter(status=Job.QUEUED).update(payload=payload)
+            self.stdout.write("A backup job is already scheduled; its interval was updated.")
+            return
+        job = jobs.enqueue("backup", payload, run_after=timezone.now() + timedelta(seconds=5))
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued {job}; run_worker will back up every {opts['schedule']}s."
+        ))
+
@@ -0,0 +1,85 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bills import analytics
+from bills.models import Bill, Customer, LedgerEntry, Payment
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the analytics summary over synthetic history (cold load + warm runs). "
+        "The data is inserted inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payments", type=int, default=1_000_000)
+        parser.add_argument("--bills", type=int, default=0, help="Default: payments / 2")
+        parser.add_argument("--customers", type=int, default=2000)
+        parser.add_argument("--years", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        try:
+            with transaction.atomic():
+                self._seed(rng, opts)
+                # A new journal row moves the stamp so the first run reloads
+                LedgerEntry.objects.create(kind=LedgerEntry.ADJUSTMENT, date=date.today(), note="bench_analytics")
+
+                began = time.perf_counter()
+                data = analytics.summary()
+                self.stdout.write(f"cold: {time.perf_counter() - began:.2f}s "
+                                  f"({data['bills']} bills, {data['payments']} payments, "
+                                  f"{len(data['monthly'])} months)")
+                # Arrays already loaded: time the vectorised group-bys alone
+                analytics._results.clear()
+                began = time.perf_counter()
+                analytics.summary()
+                self.stdout.write(f"group-bys only: {time.perf_counter() - began:.3f}s")
+
+                began = time.perf_counter()
+                analytics.summary()
+                self.stdout.write(f"memoised: {time.perf_counter() - began:.3f}s")
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write(self.style.SUCCESS("Synthetic data rolled back."))
+
+    def _seed(self, rng, opts):
+        began = time.perf_counter()
+        customers = Customer.objects.bulk_create([
+            Customer(name=f"bench-an-{n}") for n in range(opts["customers"])
+        ])
+        start = date.today() - timedelta(days=365 * opts["years"])
+        span = 365 * opts["years"]
+        n_bills = opts["bills"] or max(opts["payments"] // 2, 1)
+        last_no = Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0
+
+        bills = []
+        for n in range(n_bills):
+            customer = rng.choice(customers)
+            total = Decimal(rng.randint(10_000, 5_000_000)) / 100
+            bills.append(Bill(customer=customer, customer_name=customer.name, bill_no=last_no + n + 1,
+                              date=start + timedelta(days=rng.randrange(span)),
+                              taxable_amount=total, total_amount=total))
+        Bill.objects.bulk_create(bills, batch_size=5000)
+
+        batch = []
+        for _ in range(opts["payments"]):
+            bill = rng.choice(bills)
+            batch.append(Payment(bill=bill, amount=Decimal(rng.randint(1_000, 1_000_000)) / 100,
+                                 date=bill.date + timedelta(days=rng.randrange(60))))
+            if len(batch) >= 20_000:
+                Payment.objects.bulk_create(batch)
+                batch = []
+        Payment.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {n_bills} bills / {opts['payments']} payments "
+                          f"in {time.perf_counter() - began:.1f}s")
@@ -0,0 +1,91 @@
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire N simultaneous requests at a running server and report how many it sustains. "
+        "Run it once against `gunicorn billing_erp.wsgi` and once against "
+        "`gunicorn billing_erp.asgi:application -k uvicorn.workers.UvicornWorker` "
+        "with the same worker count to compare the two deployment modes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("base_url", help="e.g. http://127.0.0.1:8000")
+        parser.add_argument("--path", action="append", dest="paths",
+                            help="Report path to hit (repeatable). Default: /customer-statement/")
+        parser.add_argument("--concurrency", default="1,4,16,32,64",
+                            help="Comma separated concurrency levels")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per level")
+        parser.add_argument("--username")
+        parser.add_argument("--password")
+        parser.add_argument("--timeout", type=float, default=30.0)
+
+    def handle(self, *args, **opts):
+        base = opts["base_url"].rstrip("/") + "/"
+        paths = opts["paths"] or ["/customer-statement/"]
+        levels = [int(x) for x in opts["concurrency"].split(",") if x.strip()]
+        timeout = opts["timeout"]
+
+        opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        if opts["username"]:
+            self._login(opener, base, opts["username"], opts["password"] or "", timeout)
+
+        urls = [urljoin(base, p.lstrip("/")) for p in paths]
+
+        def hit(i):
+            url = urls[i % len(urls)]
+            started = time.perf_counter()
+            try:
+                with opener.open(url, timeout=timeout) as resp:
+                    resp.read()
+                    ok = resp.status == 200 and "/login/" not in resp.geturl()
+            except (HTTPError, URLError, OSError):
+                ok = False
+            return ok, (time.perf_counter() - started) * 1000
+
+        self.stdout.write(f"{'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for level in levels:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                results = list(pool.map(hit, range(opts["requests"])))
+            elapsed = time.perf_counter() - started
+
+            latencies = sorted(ms for ok, ms in results if ok)
+            errors = len(results) - len(latencies)
+            if latencies:
+                p50 = statistics.median(latencies)
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                worst = latencies[-1]
+            else:
+                p50 = p95 = worst = 0.0
+            self.stdout.write(
+                f"{level:>5} {len(results):>6} {errors:>6} {len(latencies) / elapsed:>8.1f} "
+                f"{p50:>8.1f} {p95:>8.1f} {worst:>8.1f}"
+            )
+
+    def _login(self, opener, base, username, password, timeout):
+        login_url = urljoin(base, "login/")
+        with opener.open(login_url, timeout=timeout) as resp:
+            page = resp.read().decode("utf-8", "replace")
+        match = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', page)
+        if not match:
+            raise CommandError("Could not find a CSRF token on the login page.")
+
+        data = urlencode({
+            "csrfmiddlewaretoken": match.group(1),
+            "username": username,
+            "password": password,
+        }).encode()
+        req = Request(login_url, data=data, headers={"Referer": login_url})
+        with opener.open(req, timeout=timeout) as resp:
+            if "/login/" in resp.geturl():
+                raise CommandError("Login failed.")
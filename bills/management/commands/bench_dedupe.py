@@ -0,0 +1,116 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bills import dedupe, ledger
+from bills.integrity import refresh_customer_totals
+from bills.models import Bill, Customer, LedgerEntry, MergeProposal
+
+FIRST = ["Ramesh", "Suresh", "Mahesh", "Dinesh", "Bharat", "Dharmendra", "Khushboo", "Ghanshyam", "Shankar",
+         "Prakash", "Vikas", "Anil", "Sunil", "Rakesh", "Mukesh", "Pooja", "Neeraj", "Sandeep", "Deepak", "Manoj"]
+LAST = ["Kumar", "Sharma", "Verma", "Gupta", "Agarwal", "Thakur", "Bhatia", "Chauhan", "Yadav", "Joshi",
+        "Mehta", "Shah", "Patel", "Singh", "Jain", "Mishra", "Pandey", "Tiwari", "Dubey", "Saxena"]
+VARIANTS = [
+    lambda n: n.lower(),
+    lambda n: f"Shri {n}",
+    lambda n: " ".join(reversed(n.split())),
+    lambda n: n.replace("sh", "s").replace("Sh", "S"),
+    lambda n: n.replace("h", "", 1),
+    lambda n: n.replace("ee", "i").replace("oo", "u") + " ",
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a dedupe scan + apply over synthetic customers with misspelt duplicates and "
+        "bills saved without a customer, then replay the journal of the merged customers. "
+        "The data is inserted inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bills", type=int, default=100_000)
+        parser.add_argument("--customers", type=int, default=5_000)
+        parser.add_argument("--duplicates", type=float, default=0.2, help="Share of customers entered twice")
+        parser.add_argument("--orphans", type=float, default=0.2, help="Share of bills without a customer")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                self._seed(random.Random(opts["seed"]), opts)
+
+                began = time.perf_counter()
+                found = dedupe.scan(log=self.stdout.write)
+                scanned = time.perf_counter() - began
+                self.stdout.write(f"scan   {scanned:6.2f}s  {found}")
+
+                began = time.perf_counter()
+                done = dedupe.apply(MergeProposal.objects.filter(status=MergeProposal.PENDING))
+                applied = time.perf_counter() - began
+                self.stdout.write(f"apply  {applied:6.2f}s  {done}")
+
+                bench = set(Customer.objects.filter(name__startswith="bench-dd").values_list("id", flat=True))
+                drift = [row for row in ledger.replay_customers() if row[0] in bench]
+                orphans = Bill.objects.filter(customer__isnull=True, customer_name__startswith="bench-dd").count()
+                self.stdout.write(f"journal mismatches: {len(drift)}  bills still without a customer: {orphans}")
+                total = scanned + applied
+                style = self.style.SUCCESS if total < 60 and not drift else self.style.ERROR
+                self.stdout.write(style(f"{opts['bills']} bills deduplicated in {total:.1f}s"))
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write("Synthetic data rolled back.")
+
+    def _seed(self, rng, opts):
+        began = time.perf_counter()
+        names = set()
+        while len(names) < opts["customers"]:
+            names.add(f"{rng.choice(FIRST)} {rng.choice(LAST)} {rng.randint(1, 999)}")
+        people = [(f"bench-dd {name}", f"9{rng.randint(100_000_000, 999_999_999)}") for name in sorted(names)]
+
+        rows = [(name, phone) for name, phone in people]
+        for name, phone in rng.sample(people, int(len(people) * opts["duplicates"])):
+            variant = f"bench-dd {rng.choice(VARIANTS)(name[len('bench-dd '):]).strip()}"
+            if variant.lower() != name.lower():
+                rows.append((variant, rng.choice([phone, f"+91 {phone[:5]}-{phone[5:]}", ""])))
+        taken, customers = set(), []
+        for name, phone in rows:
+            if name not in taken:
+                taken.add(name)
+                customers.append(Customer(name=name, phone=phone))
+        customers = Customer.objects.bulk_create(customers)
+
+        start = date.today() - timedelta(days=365)
+        last_no = Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0
+        bills = []
+        for n in range(opts["bills"]):
+            customer = rng.choice(customers)
+            total = Decimal(rng.randint(10_000, 500_000)) / 100
+            paid = (total * rng.choice([0, 0, 1, Decimal("0.5")])).quantize(Decimal("0.01"))
+            bill = Bill(customer=customer, customer_name=customer.name, phone=customer.phone, bill_no=last_no + n + 1,
+                        date=start + timedelta(days=rng.randrange(365)), taxable_amount=total,
+                        total_amount=total, paid_amount=paid, is_paid=paid >= total)
+            if rng.random() < opts["orphans"]:
+                bill.customer = None
+                bill.customer_name = rng.choice([customer.name, customer.name.upper(), customer.name + " "])
+            bills.append(bill)
+        Bill.objects.bulk_create(bills, batch_size=5000)
+
+        # Journal + stored totals as the app would have written them
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(customer_id=b.customer_id, bill=b, kind=LedgerEntry.BILL, date=b.date,
+                        debit=b.total_amount, credit=b.paid_amount, note=f"Bill #{b.bill_no}")
+            for b in bills
+        ], batch_size=5000)
+        ids = [c.id for c in customers]
+        for i in range(0, len(ids), dedupe.BATCH):
+            refresh_customer_totals(ids[i:i + dedupe.BATCH])
+        self.stdout.write(f"Seeded {len(customers)} customers and {len(bills)} bills "
+                          f"in {time.perf_counter() - began:.1f}s")
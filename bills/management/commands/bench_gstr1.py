@@ -0,0 +1,97 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from bills.gst import gstr1, split_tax
+from bills.models import Bill, BillItem, Customer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the GSTR-1 export over a synthetic month of invoices. The data is "
+        "inserted inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--invoices", type=int, default=100_000)
+        parser.add_argument("--lines", type=int, default=3, help="Items per invoice")
+        parser.add_argument("--customers", type=int, default=500)
+        parser.add_argument("--month", default="2030-01", help="YYYY-MM used for the synthetic bills")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        year, month = (int(x) for x in opts["month"].split("-"))
+        start = date(year, month, 1)
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+        # Some buyers must be out of state for the B2CL/B2CS split to matter
+        home = settings.GST_STATE_CODE or "08"
+        try:
+            with transaction.atomic(), override_settings(GST_STATE_CODE=home):
+                self._seed(rng, start, end, home, opts)
+                for run in (1, 2):
+                    began = time.perf_counter()
+                    report = gstr1(start, end)
+                    elapsed = time.perf_counter() - began
+                    self.stdout.write(
+                        f"run {run}: {elapsed:.2f}s  b2b={len(report['b2b'])} b2cl={len(report['b2cl'])} "
+                        f"b2cs={len(report['b2cs'])} hsn={len(report['hsn'])}"
+                    )
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write(self.style.SUCCESS("Synthetic data rolled back."))
+
+    def _seed(self, rng, start, end, home, opts):
+        began = time.perf_counter()
+        states = [home, home, home, "27", "07", "24"]
+        customers = Customer.objects.bulk_create([
+            Customer(name=f"bench-gst-{n}", state_code=rng.choice(states),
+                     gstin=f"{home}ABCDE{n:04d}F1Z5" if n % 3 == 0 else "")
+            for n in range(opts["customers"])
+        ])
+        last_no = (Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0)
+        rates = [Decimal("0"), Decimal("5"), Decimal("12"), Decimal("18"), Decimal("28")]
+        hsn = ["7318", "7326", "8481", "3917", "9403"]
+        days = (end - start).days + 1
+
+        bills, lines = [], []
+        for n in range(opts["invoices"]):
+            customer = rng.choice(customers)
+            inter_state = customer.state_code != home
+            items = []
+            for _ in range(opts["lines"]):
+                qty = rng.randint(1, 50)
+                rate = Decimal(rng.randint(100, 500_000)) / 100
+                gst_rate = rng.choice(rates)
+                taxable = qty * rate
+                cgst, sgst, igst = split_tax(taxable, gst_rate, inter_state)
+                items.append(BillItem(description="bench", quantity=qty, rate=rate, total=taxable,
+                                      hsn_code=rng.choice(hsn), gst_rate=gst_rate,
+                                      cgst=cgst, sgst=sgst, igst=igst))
+            taxable = sum(i.total for i in items)
+            taxes = sum(i.cgst + i.sgst + i.igst for i in items)
+            bills.append(Bill(customer=customer, customer_name=customer.name, bill_no=last_no + n + 1,
+                              date=start + timedelta(days=n % days), place_of_supply=customer.state_code,
+                              taxable_amount=taxable, total_amount=taxable + taxes))
+            lines.append(items)
+
+        Bill.objects.bulk_create(bills, batch_size=2000)
+        for bill, items in zip(bills, lines):
+            for item in items:
+                item.bill = bill
+        BillItem.objects.bulk_create([i for items in lines for i in items], batch_size=5000)
+        self.stdout.write(
+            f"Seeded {len(bills)} invoices / {sum(len(i) for i in lines)} lines "
+            f"in {time.perf_counter() - began:.1f}s"
+        )
@@ -0,0 +1,99 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from bills import analytics, integrity, ledger
+from bills.models import Bill, BillItem, Customer, Payment
+from bills.reports import statement_queryset, statement_rows
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _customer_totals():
+    return list(Customer.objects.filter(name__startswith="bench-money-")
+                .annotate(t=Sum("bill__total_amount"), p=Sum("bill__paid_amount")).values_list("id", "t", "p"))
+
+
+def _analytics_load():
+    import numpy as np
+    return analytics._load(np)
+
+
+REPORTS = [
+    ("customer totals (ORM SUM)", _customer_totals),
+    ("statement rows", lambda: list(statement_rows(statement_queryset("bench-money-")))),
+    ("analytics facts (NumPy)", _analytics_load),
+    ("verify_ledger recompute", lambda: integrity.check_bills(workers=1)),
+    ("journal replay", lambda: list(ledger.replay_bills())),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Throughput of the money-heavy report paths (ORM sums, statement rows, analytics "
+        "arrays, verify_ledger, journal replay) over synthetic bills with paise amounts. "
+        "The data is inserted inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bills", type=int, default=50_000)
+        parser.add_argument("--customers", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per report; the best is shown")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                self._seed(random.Random(opts["seed"]), opts)
+                for label, run in REPORTS:
+                    best = min(self._time(run) for _ in range(opts["repeat"]))
+                    self.stdout.write(f"{label:28} {best * 1000:8.1f} ms  "
+                                      f"{opts['bills'] / best / 1000:8.1f}k bills/s")
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write(self.style.SUCCESS("Synthetic data rolled back."))
+
+    @staticmethod
+    def _time(run):
+        began = time.perf_counter()
+        run()
+        return time.perf_counter() - began
+
+    def _seed(self, rng, opts):
+        began = time.perf_counter()
+        customers = Customer.objects.bulk_create([
+            Customer(name=f"bench-money-{n}") for n in range(opts["customers"])
+        ])
+        start = date.today() - timedelta(days=365)
+        last_no = Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0
+
+        bills, items, payments = [], [], []
+        for n in range(opts["bills"]):
+            customer = rng.choice(customers)
+            lines = [(rng.randint(1, 5), Decimal(rng.randint(100, 99_999)) / 100) for _ in range(rng.randint(1, 3))]
+            taxable = sum((qty * rate for qty, rate in lines), Decimal("0.00"))
+            tax = (taxable * Decimal("0.09")).quantize(Decimal("0.01"))
+            bill = Bill(customer=customer, customer_name=customer.name, bill_no=last_no + n + 1,
+                        date=start + timedelta(days=rng.randrange(365)), taxable_amount=taxable,
+                        cgst_amount=tax, sgst_amount=tax, total_amount=taxable + 2 * tax)
+            bills.append(bill)
+            items += [BillItem(bill=bill, description="bench", quantity=qty, rate=rate, total=qty * rate,
+                               gst_rate=Decimal("18"), cgst=(qty * rate * Decimal("0.09")).quantize(Decimal("0.01")),
+                               sgst=(qty * rate * Decimal("0.09")).quantize(Decimal("0.01")))
+                      for qty, rate in lines]
+            if rng.random() < 0.6:
+                paid = (bill.total_amount * Decimal(rng.randint(1, 100)) / 100).quantize(Decimal("0.01"))
+                bill.paid_amount = paid
+                payments.append(Payment(bill=bill, amount=paid, date=bill.date))
+        Bill.objects.bulk_create(bills, batch_size=5000)
+        BillItem.objects.bulk_create(items, batch_size=5000)
+        Payment.objects.bulk_create(payments, batch_size=5000)
+        self.stdout.write(f"Seeded {len(bills)} bills, {len(items)} items, {len(payments)} payments "
+                          f"in {time.perf_counter() - began:.1f}s")
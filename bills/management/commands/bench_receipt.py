@@ -0,0 +1,108 @@
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from bills import receipt
+from bills.models import Bill, BillItem, Customer
+from bills.reports import invoice_context
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering bills as the HTML invoice page against the ESC/POS thermal receipt "
+        "(built cold and read back from the cache), then write receipts to a file and to a "
+        "spool directory. The data is inserted inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bills", type=int, default=2_000)
+        parser.add_argument("--items", type=int, default=8, help="Item rows per bill")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                ids = self._seed(random.Random(opts["seed"]), opts)
+                request = RequestFactory().get("/")
+
+                def html(bill_id):
+                    bill = Bill.objects.get(id=bill_id)
+                    items = list(BillItem.objects.filter(bill=bill))
+                    return render_to_string("generate_bill.html", invoice_context(bill, items), request=request)
+
+                def cold(bill_id):
+                    bill = Bill.objects.get(id=bill_id)
+                    return receipt.build_receipt(bill, receipt.receipt_items(bill))
+
+                def warm(bill_id):
+                    return receipt.receipt_bytes(Bill.objects.select_related("customer").get(id=bill_id))[0]
+
+                for bill_id in ids:   # fill the receipt cache
+                    warm(bill_id)
+                timings = {}
+                for name, render in (("html", html), ("receipt", cold), ("cached", warm)):
+                    began = time.perf_counter()
+                    size = sum(len(render(bill_id)) for bill_id in ids)
+                    timings[name] = time.perf_counter() - began
+                    self.stdout.write(f"{name:8} {timings[name] * 1000 / len(ids):7.3f} ms/bill "
+                                      f"{len(ids) / timings[name]:9.0f} bills/s  {size // len(ids):6} bytes/bill")
+
+                data = [warm(bill_id) for bill_id in ids]
+                with tempfile.TemporaryDirectory() as tmp:
+                    device = Path(tmp) / "lp0"
+                    spool = Path(tmp) / "spool"
+                    spool.mkdir()
+                    for target in (device, spool):
+                        began = time.perf_counter()
+                        for chunk in data:
+                            receipt.send(chunk, target)
+                        seconds = time.perf_counter() - began
+                        written = (device.stat().st_size if target is device
+                                   else sum(f.stat().st_size for f in spool.iterdir()))
+                        self.stdout.write(f"send to {'file' if target is device else 'spool':5} "
+                                          f"{len(data) / seconds:9.0f} receipts/s  {written} bytes")
+
+                self.stdout.write(self.style.SUCCESS(
+                    f"receipt {timings['html'] / timings['receipt']:.1f}x faster than HTML cold, "
+                    f"{timings['html'] / timings['cached']:.1f}x cached"))
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write("Synthetic data rolled back.")
+
+    def _seed(self, rng, opts):
+        began = time.perf_counter()
+        customers = Customer.objects.bulk_create([
+            Customer(name=f"bench-receipt-{n}", phone=f"9{n:09d}") for n in range(max(opts["bills"] // 20, 1))
+        ])
+        start = date.today() - timedelta(days=90)
+        last_no = Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0
+        bills = []
+        for n in range(opts["bills"]):
+            customer = customers[n % len(customers)]
+            bills.append(Bill(customer=customer, customer_name=customer.name, phone=customer.phone,
+                              bill_no=last_no + n + 1, date=start + timedelta(days=rng.randrange(90))))
+        Bill.objects.bulk_create(bills, batch_size=5000)
+
+        items = []
+        for bill in bills:
+            for n in range(opts["items"]):
+                quantity, rate = rng.randint(1, 20), Decimal(rng.randint(500, 50_000)) / 100
+                items.append(BillItem(bill=bill, description=f"Item {rng.randint(1, 500)} assorted goods",
+                                      quantity=quantity, rate=rate, total=quantity * rate))
+            bill.taxable_amount = bill.total_amount = sum(i.total for i in items[-opts["items"]:])
+        BillItem.objects.bulk_create(items, batch_size=5000)
+        Bill.objects.bulk_update(bills, ["taxable_amount", "total_amount"], batch_size=5000)
+        self.stdout.write(f"Seeded {len(bills)} bills with {len(items)} items in {time.perf_counter() - began:.1f}s")
+        return [b.id for b in bills]
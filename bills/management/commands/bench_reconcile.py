@@ -0,0 +1,139 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bills import ledger
+from bills.integrity import refresh_customer_totals
+from bills.models import BankLine, Bill, Customer, LedgerEntry
+from bills.reconcile import import_statement, match_statement, post_lines
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time importing, matching and posting a synthetic bank statement against open bills: "
+        "credits naming a bill number, a customer's phone (one bill or several oldest bills), "
+        "only an amount, or nothing known. The data is inserted inside a transaction that is "
+        "rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bills", type=int, default=200_000)
+        parser.add_argument("--customers", type=int, default=20_000)
+        parser.add_argument("--lines", type=int, default=50_000)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        try:
+            with transaction.atomic():
+                customers, bills = self._seed(rng, opts)
+                text, truth = self._statement(rng, customers, bills, opts["lines"])
+
+                timings = {}
+                began = time.perf_counter()
+                statement = import_statement(text, "bench.csv")
+                timings["import"] = time.perf_counter() - began
+
+                began = time.perf_counter()
+                match_statement(statement, log=self.stdout.write)
+                timings["match"] = time.perf_counter() - began
+
+                lines = list(statement.bank_lines.all())
+                proposed = [({b for b, _ in line.allocations}, truth[line.line_no]) for line in lines]
+                right = sum(1 for got, paid in proposed if paid and got == paid)
+                known = sum(1 for _, paid in proposed if paid)
+                wrong = sum(1 for got, paid in proposed if got and got != paid)
+
+                began = time.perf_counter()
+                result = post_lines([line for line in lines if line.status == BankLine.PROPOSED])
+                timings["post"] = time.perf_counter() - began
+
+                bench = {c.id for c in customers}
+                drift = [row for row in ledger.replay_customers() if row[0] in bench]
+                for step, seconds in timings.items():
+                    self.stdout.write(f"{step:7} {seconds:6.2f}s")
+                self.stdout.write(f"{statement.lines} lines: {right}/{known} matchable credits matched exactly, "
+                                  f"{wrong} proposals differ from the truth")
+                self.stdout.write(f"posted {result}; journal mismatches: {len(drift)}")
+                self.stdout.write(self.style.SUCCESS(
+                    f"{statement.lines} lines against {len(bills)} open bills in {sum(timings.values()):.1f}s"))
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write("Synthetic data rolled back.")
+
+    def _seed(self, rng, opts):
+        began = time.perf_counter()
+        customers = Customer.objects.bulk_create([
+            Customer(name=f"bench-recon-{n}", phone=f"9{n:09d}") for n in range(opts["customers"])
+        ])
+        start = date.today() - timedelta(days=150)
+        last_no = Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0
+        bills = []
+        for n in range(opts["bills"]):
+            customer = customers[n % len(customers)]
+            total = Decimal(rng.randint(10_000, 2_000_000)) / 100
+            bills.append(Bill(customer=customer, customer_name=customer.name, phone=customer.phone,
+                              bill_no=last_no + n + 1, date=start + timedelta(days=rng.randrange(120)),
+                              taxable_amount=total, total_amount=total))
+        Bill.objects.bulk_create(bills, batch_size=5000)
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(customer_id=b.customer_id, bill=b, kind=LedgerEntry.BILL, date=b.date,
+                        debit=b.total_amount, note=f"Bill #{b.bill_no}") for b in bills
+        ], batch_size=5000)
+        ids = [c.id for c in customers]
+        for i in range(0, len(ids), 900):
+            refresh_customer_totals(ids[i:i + 900])
+        self.stdout.write(f"Seeded {len(customers)} customers, {len(bills)} open bills "
+                          f"in {time.perf_counter() - began:.1f}s")
+        return customers, bills
+
+    def _statement(self, rng, customers, bills, count):
+        """CSV lines of a bank export + {line_no: bill ids the credit really pays}."""
+        by_customer = {}
+        for bill in bills:
+            by_customer.setdefault(bill.customer_id, []).append(bill)
+        several = set(rng.sample([c.id for c in customers], min(len(customers) // 3, count // 6)))
+        singles = [b for b in bills if b.customer_id not in several]
+        rng.shuffle(singles)
+
+        rows, truth = [], {}
+        header = ["Txn Date", "Description", "Ref No.", "Debit", "Credit", "Balance"]
+        text = ["Account statement for 0000123456789", "", ",".join(header)]
+
+        def add(day, narration, ref, amount, paid):
+            rows.append((day, narration, ref, amount))
+            truth[len(text) + len(rows)] = paid
+
+        for customer_id in several:
+            oldest = sorted(by_customer[customer_id], key=lambda b: (b.date, b.id))[:2]
+            phone = oldest[0].phone
+            add(oldest[-1].date + timedelta(days=5), f"UPI/{rng.randint(10**11, 10**12)}/{phone}@ybl/bills", "",
+                sum(b.total_amount for b in oldest), {b.id for b in oldest})
+        while len(rows) < count:
+            kind = rng.random()
+            day_of = lambda b: b.date + timedelta(days=rng.randrange(20))
+            if kind < 0.1:
+                add(date.today() - timedelta(days=rng.randrange(60)), "CASH DEPOSIT", "",
+                    Decimal(rng.randint(100, 100_000)) / 100 + Decimal("0.37"), set())
+                continue
+            bill = singles.pop()
+            if kind < 0.45:
+                add(day_of(bill), f"UPI/{rng.randint(10**11, 10**12)}/PAYMENT FROM {bill.phone}", "",
+                    bill.total_amount, {bill.id})
+            elif kind < 0.75:
+                add(day_of(bill), f"NEFT-INV {bill.bill_no}-TRADERS", f"N{rng.randint(10**9, 10**10)}",
+                    bill.total_amount, {bill.id})
+            else:
+                add(day_of(bill), "IMPS TRANSFER", f"{rng.randint(10**11, 10**12)}", bill.total_amount, {bill.id})
+
+        for day, narration, ref, amount in rows:
+            text.append(f"{day:%d/%m/%Y},{narration},{ref},,\"{amount:,}\",")
+        return [line + "\n" for line in text], truth
@@ -0,0 +1,101 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bills.models import Bill, Customer
+from bills.reports import (
+    REGISTER_ORDER, RegisterRow, register_groups, register_older, register_page, register_queryset,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time bill register pages at increasing depth: keyset pages (register_page) against "
+        "OFFSET pages, unfiltered and unpaid only, plus the day/month subtotal queries. "
+        "The data is inserted inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bills", type=int, default=1_000_000)
+        parser.add_argument("--page", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                self._seed(random.Random(opts["seed"]), opts)
+                if connection.vendor == "sqlite":
+                    with connection.cursor() as cursor:
+                        cursor.execute("ANALYZE")
+                for label, qs in (("all", register_queryset()), ("unpaid", register_queryset(status="unpaid"))):
+                    self._explain(label, qs, opts["page"])
+                    self._depths(label, qs, opts)
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write("Synthetic data rolled back.")
+
+    def _time(self, fn, repeat):
+        best = None
+        for _ in range(repeat):
+            began = time.perf_counter()
+            fn()
+            spent = time.perf_counter() - began
+            best = spent if best is None else min(best, spent)
+        return best * 1000
+
+    def _depths(self, label, qs, opts):
+        size, total = opts["page"], qs.count()
+        ordered = qs.order_by(*REGISTER_ORDER)
+        self.stdout.write(f"{label}: {total} bills")
+        self.stdout.write(f"  {'depth':>9} {'keyset ms':>10} {'offset ms':>10} {'subtotals ms':>13}")
+        for depth in (0, total // 100, total // 10, total // 2, max(total - size, 0)):
+            cursor = ordered.values_list("date", "bill_no", "id")[depth - 1] if depth else None
+            keyset = self._time(lambda: register_page(qs, after=cursor, size=size), opts["repeat"])
+            offset = self._time(lambda: list(ordered.values_list(*RegisterRow.COLUMNS)[depth:depth + size]),
+                                opts["repeat"])
+            rows = register_page(qs, after=cursor, size=size).rows
+            groups = self._time(lambda: register_groups(qs, rows), opts["repeat"])
+            self.stdout.write(f"  {depth:>9} {keyset:>10.2f} {offset:>10.2f} {groups:>13.2f}")
+
+    def _explain(self, label, qs, size):
+        # A deep keyset page should be an index seek without "USE TEMP B-TREE FOR ORDER BY"
+        if connection.vendor != "sqlite":
+            return
+        cursor = qs.order_by(*REGISTER_ORDER).values_list("date", "bill_no", "id")[qs.count() // 2]
+        page = register_older(qs, cursor)
+        sql, params = page.values_list(*RegisterRow.COLUMNS)[:size + 1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = "; ".join(row[-1] for row in cursor.fetchall())
+        self.stdout.write(f"{label} plan: {plan}")
+
+    def _seed(self, rng, opts):
+        began = time.perf_counter()
+        customers = Customer.objects.bulk_create([
+            Customer(name=f"bench-register-{n}", phone=f"9{n:09d}") for n in range(2_000)
+        ])
+        start = date.today() - timedelta(days=3 * 365)
+        last_no = Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0
+        per_day = max(opts["bills"] // (3 * 365), 1)
+        batch = []
+        for n in range(opts["bills"]):
+            customer = customers[n % len(customers)]
+            total = Decimal(rng.randint(10_000, 500_000)) / 100
+            paid = total if rng.random() < 0.8 else Decimal("0.00")
+            batch.append(Bill(customer=customer, customer_name=customer.name, phone=customer.phone,
+                              bill_no=last_no + n + 1, date=start + timedelta(days=n // per_day),
+                              taxable_amount=total, total_amount=total, paid_amount=paid, is_paid=paid > 0))
+            if len(batch) == 20_000:
+                Bill.objects.bulk_create(batch)
+                batch = []
+        Bill.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {opts['bills']} bills in {time.perf_counter() - began:.1f}s")
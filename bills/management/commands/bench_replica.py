@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from bills.backup import database_path, latency_summary, online_copy
+
+REPORT_URLS = [
+    "/customer-statement/?customer_name={name}",
+    "/customer-monthly-statement/?customer_name={name}&start_date=2030-01-01&end_date=2030-12-31",
+    "/view-customers/",
+    "/analytics/data/",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Bill-entry latency while report views run concurrently, with reports on the primary "
+        "vs on a SQLite replica. Works on temporary copies of the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bills", type=int, default=20_000, help="Synthetic bills added to the copy")
+        parser.add_argument("--customers", type=int, default=200)
+        parser.add_argument("--readers", type=int, default=4, help="Processes requesting report pages")
+        parser.add_argument("--seconds", type=float, default=10.0, help="Measured time per mode")
+        parser.add_argument("--interval", type=float, default=0.02, help="Pause between bill entries")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--phase", choices=["seed", "run", "read"], help=argparse.SUPPRESS)   # child process step
+
+    def handle(self, *args, **opts):
+        if opts["phase"] == "seed":
+            return self.seed(opts)
+        if opts["phase"] == "run":
+            return self.run(opts)
+        if opts["phase"] == "read":
+            return self.read(opts)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            primary, replica = Path(tmp) / "primary.sqlite3", Path(tmp) / "replica.sqlite3"
+            online_copy(str(database_path()), str(primary))
+            self.child("seed", opts, primary)
+            online_copy(str(primary), str(replica))
+
+            results = {"no reports": self.child("run", dict(opts, readers=0), primary)}
+            for mode, replica_path in (("primary only", None), ("with replica", replica)):
+                results[mode] = self.child("run", opts, primary, replica_path)
+
+        self.stdout.write(f"{'':14} {'entries':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'reports':>8}  reads from")
+        for mode, r in results.items():
+            e = r["entry"]
+            self.stdout.write(
+                f"{mode:14} {e['writes']:>8} {e.get('p50_ms', 0):>8} {e.get('p95_ms', 0):>8} "
+                f"{e.get('max_ms', 0):>8} {r['reports']:>8}  {r['aliases']}"
+            )
+
+    # -----------------------------
+    # Parent: run a phase in a child process against the copies
+    # -----------------------------
+    @staticmethod
+    def command(phase, opts):
+        args = [sys.executable, str(settings.BASE_DIR / "manage.py"), "bench_replica", "--phase", phase]
+        for name in ("bills", "customers", "readers", "seconds", "interval", "seed"):
+            args += [f"--{name}", str(opts[name])]
+        return args
+
+    def child(self, phase, opts, primary, replica=None):
+        env = dict(os.environ, BILLING_DB_PATH=str(primary))
+        env.pop("BILLING_REPLICA_PATH", None)
+        if replica:
+            env["BILLING_REPLICA_PATH"] = str(replica)
+        done = subprocess.run(self.command(phase, opts), env=env, capture_output=True, text=True)
+        if done.returncode:
+            raise CommandError(f"{phase} phase failed:\n{done.stderr}")
+        return json.loads(done.stdout.strip().splitlines()[-1])
+
+    # -----------------------------
+    # Child phases
+    # -----------------------------
+    def seed(self, opts):
+        from django.contrib.auth.models import User
+        from bills.models import Bill, BillItem, Customer, Payment
+
+        rng = random.Random(opts["seed"])
+        with transaction.atomic():
+            User.objects.filter(username="bench-replica").delete()
+            User.objects.create_user("bench-replica", password="bench-replica")
+            customers = Customer.objects.bulk_create([
+                Customer(name=f"bench-replica-{n}") for n in range(opts["customers"])
+            ])
+            last_no = Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0
+            bills = Bill.objects.bulk_create([
+                Bill(customer=c, customer_name=c.name, bill_no=last_no + n + 1,
+                     date=f"2030-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", total_amount=Decimal("300"))
+                for n, c in enumerate(rng.choice(customers) for _ in range(opts["bills"]))
+            ], batch_size=2000)
+            BillItem.objects.bulk_create([
+                BillItem(bill=b, description="bench", quantity=1, rate=Decimal("100"), total=Decimal("100"))
+                for b in bills for _ in range(3)
+            ], batch_size=5000)
+            Payment.objects.bulk_create([
+                Payment(bill=b, amount=Decimal("100"), date=b.date) for b in bills[::2]
+            ], batch_size=5000)
+        self.stdout.write(json.dumps({"bills": len(bills)}))
+
+    def read(self, opts):
+        """One reader process: request report pages until --seconds have passed."""
+        from django.contrib.auth.models import User
+        from django.test import Client
+        from django.test.utils import override_settings
+        from bills.models import Customer
+
+        names = list(Customer.objects.filter(name__startswith="bench-replica-").values_list("name", flat=True))
+        rng = random.Random(os.getpid())
+        client = Client()
+        client.force_login(User.objects.get(username="bench-replica"))
+        aliases = {}
+        deadline = time.perf_counter() + opts["seconds"]
+        # The versioned report cache would turn repeat reports into cache hits
+        with override_settings(CACHES=dict(settings.CACHES, ledger={
+                "BACKEND": "django.core.cache.backends.dummy.DummyCache"})):
+            while time.perf_counter() < deadline:
+                response = client.get(rng.choice(REPORT_URLS).format(name=rng.choice(names)))
+                alias = response.get("X-Read-Alias", "?")
+                aliases[alias] = aliases.get(alias, 0) + 1
+        self.stdout.write(json.dumps(aliases))
+
+    def run(self, opts):
+        from bills.models import Bill, BillItem, Customer, Payment
+
+        readers = [
+            subprocess.Popen(self.command("read", dict(opts, seconds=opts["seconds"] + 1)),
+                             stdout=subprocess.PIPE, text=True)
+            for _ in range(opts["readers"])
+        ]
+        time.sleep(1.0 if readers else 0)
+
+        customers = list(Customer.objects.filter(name__startswith="bench-replica-")[:20])
+        samples = []
+        deadline = time.perf_counter() + opts["seconds"]
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            with transaction.atomic():
+                bill = Bill.objects.create(customer=random.choice(customers), bill_no=0)
+                BillItem.objects.create(bill=bill, description="entry", quantity=2, rate=Decimal("75"))
+                Payment.objects.create(bill=bill, amount=Decimal("50"))
+            samples.append(time.perf_counter() - began)
+            time.sleep(opts["interval"])
+        connection.close()
+
+        aliases, reports = {}, 0
+        for proc in readers:
+            out, _ = proc.communicate()
+            for alias, count in json.loads(out.strip().splitlines()[-1]).items():
+                aliases[alias] = aliases.get(alias, 0) + count
+                reports += count
+        self.stdout.write(json.dumps({"entry": latency_summary(samples), "reports": reports, "aliases": aliases}))
@@ -0,0 +1,101 @@
+import gc
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bills.models import Bill, Customer, Payment
+from bills.reports import monthly_queryset, statement_rows
+
+
+class _Rollback(Exception):
+    pass
+
+
+def model_rows(qs):
+    """The previous report path: Bill instances with display columns patched on."""
+    rows = []
+    for bill in qs.iterator(chunk_size=2000):
+        total = Decimal(str(bill.total_amount or 0))
+        bill.total_display = total
+        bill.remaining_display = max(total - bill.positive_paid - bill.returns_total, 0)
+        rows.append(bill)
+    return rows
+
+
+def tuple_rows(qs):
+    return list(statement_rows(qs))
+
+
+class Command(BaseCommand):
+    help = (
+        "Memory and time of building a year-long statement as Bill instances versus "
+        "values_list() report rows. The bills are inserted inside a transaction that is "
+        "rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                name = self._seed(random.Random(opts["seed"]), opts["rows"])
+                qs = monthly_queryset(name, str(date.today() - timedelta(days=365)), str(date.today()))
+                results = {label: self._measure(build, qs)
+                           for label, build in (("Bill instances", model_rows), ("report rows", tuple_rows))}
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        for label, (count, seconds, retained, peak) in results.items():
+            self.stdout.write(f"{label:15} {count} rows  {seconds:.2f}s  "
+                              f"held {retained / 2**20:.1f} MiB  peak {peak / 2**20:.1f} MiB  "
+                              f"({retained / max(count, 1):.0f} B/row)")
+        (_, old_s, old_held, old_peak), (_, new_s, new_held, new_peak) = results.values()
+        self.stdout.write(self.style.SUCCESS(
+            f"report rows: {old_held / max(new_held, 1):.1f}x less memory held, "
+            f"{old_peak / max(new_peak, 1):.1f}x lower peak, {old_s / max(new_s, 1e-9):.1f}x faster. "
+            "Synthetic data rolled back."
+        ))
+
+    @staticmethod
+    def _measure(build, qs):
+        gc.collect()
+        began = time.perf_counter()
+        rows = build(qs)
+        seconds = time.perf_counter() - began
+        del rows
+
+        gc.collect()
+        tracemalloc.start()
+        rows = build(qs)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return len(rows), seconds, retained, peak
+
+    def _seed(self, rng, count):
+        began = time.perf_counter()
+        customer = Customer.objects.create(name="bench-report-rows")
+        start = date.today() - timedelta(days=364)
+        last_no = Bill.objects.order_by("-bill_no").values_list("bill_no", flat=True).first() or 0
+
+        bills = []
+        for n in range(count):
+            total = Decimal(rng.randint(10_000, 5_000_000)) / 100
+            bills.append(Bill(customer=customer, customer_name=customer.name, bill_no=last_no + n + 1,
+                              date=start + timedelta(days=rng.randrange(365)),
+                              taxable_amount=total, total_amount=total))
+        Bill.objects.bulk_create(bills, batch_size=5000)
+        Payment.objects.bulk_create(
+            [Payment(bill=bill, amount=(bill.total_amount / rng.randint(1, 4)).quantize(Decimal("0.01")),
+                     date=bill.date) for bill in bills if rng.random() < 0.7],
+            batch_size=5000,
+        )
+        self.stdout.write(f"Seeded {count} bills in {time.perf_counter() - began:.1f}s")
+        return customer.name
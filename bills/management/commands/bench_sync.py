@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bills.backup import database_path, online_copy
+
+TOKEN = "bench-sync"
+TERMINAL = "bench-1"
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline POS sync end to end: a central server process and a terminal process on "
+        "temporary copies of the database; times pushing a day of terminal bills and pulling "
+        "the server's, then checks both copies agree."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bills", type=int, default=5000, help="Bills entered on the terminal while offline")
+        parser.add_argument("--server-bills", type=int, default=500, help="Bills entered on the server meanwhile")
+        parser.add_argument("--customers", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--phase", choices=["enter", "sync", "summary"], help=argparse.SUPPRESS)
+        parser.add_argument("--count", type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **opts):
+        if opts["phase"]:
+            return getattr(self, opts["phase"])(opts)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            central, terminal = Path(tmp) / "central.sqlite3", Path(tmp) / "terminal.sqlite3"
+            online_copy(str(database_path()), str(central))
+            self.manage(["migrate", "-v0"], central)
+            # A terminal starts as a copy of the server; its first sync is a full pull
+            online_copy(str(central), str(terminal))
+
+            port = self.free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = subprocess.Popen(
+                [sys.executable, str(settings.BASE_DIR / "manage.py"), "runserver", f"127.0.0.1:{port}",
+                 "--noreload", "--skip-checks"],
+                env=self.env(central), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                self.wait_for(port)
+                first = self.child("sync", opts, terminal, url)
+                self.stdout.write(f"bootstrap pull: {self.fmt(first)}")
+
+                entered = self.child("enter", dict(opts, count=opts["bills"]), terminal, url)
+                self.child("enter", dict(opts, count=opts["server_bills"]), central)
+                self.stdout.write(f"entered {entered['bills']} bills on the terminal in {entered['seconds']}s "
+                                  f"and {opts['server_bills']} on the server")
+
+                day = self.child("sync", opts, terminal, url)
+                self.stdout.write(self.style.SUCCESS(f"day sync: {self.fmt(day)}"))
+                again = self.child("sync", opts, terminal, url)
+                self.stdout.write(f"next sync (nothing new): {self.fmt(again)}")
+            finally:
+                server.terminate()
+                server.wait()
+
+            both = {name: self.child("summary", opts, path, url if name == "terminal" else None)
+                    for name, path in (("central", central), ("terminal", terminal))}
+
+        for name, summary in both.items():
+            self.stdout.write(f"{name:9} {json.dumps(summary)}")
+        if both["central"]["rows"] != both["terminal"]["rows"]:
+            raise CommandError("The copies differ after syncing.")
+        if any(summary["journal_mismatches"] for summary in both.values()):
+            raise CommandError("A ledger journal no longer matches its balances.")
+        self.stdout.write(self.style.SUCCESS("Both copies hold the same rows and their journals match."))
+
+    @staticmethod
+    def fmt(report):
+        return (f"{report['seconds']}s, pushed {report['pushed']} (applied {report['accepted']}), "
+                f"pulled {report['pulled']}, {report['conflicts']} conflicts, "
+                f"{report['bytes_sent'] / 1e3:.0f} kB up / {report['bytes_received'] / 1e3:.0f} kB down")
+
+    # -----------------------------
+    # Parent: processes against the copies
+    # -----------------------------
+    @staticmethod
+    def env(path, url=None):
+        env = dict(os.environ, BILLING_DB_PATH=str(path), BILLING_SYNC_TOKEN=TOKEN)
+        for name in ("BILLING_REPLICA_PATH", "BILLING_TERMINAL_ID", "BILLING_SYNC_URL"):
+            env.pop(name, None)
+        if url:
+            env.update(BILLING_TERMINAL_ID=TERMINAL, BILLING_SYNC_URL=url)
+        return env
+
+    def manage(self, args, path, url=None):
+        done = subprocess.run([sys.executable, str(settings.BASE_DIR / "manage.py"), *args],
+                              env=self.env(path, url), capture_output=True, text=True)
+        if done.returncode:
+            raise CommandError(f"{' '.join(args[:3])} failed:\n{done.stderr}")
+        return done.stdout
+
+    def child(self, phase, opts, path, url=None):
+        args = ["bench_sync", "--phase", phase]
+        for name in ("bills", "server_bills", "customers", "seed", "count"):
+            if opts.get(name) is not None:
+                args += [f"--{name.replace('_', '-')}", str(opts[name])]
+        return json.loads(self.manage(args, path, url).strip().splitlines()[-1])
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    @staticmethod
+    def wait_for(port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError("The central server process did not start.")
+
+    # -----------------------------
+    # Child phases
+    # -----------------------------
+    def enter(self, opts):
+        """Bills through the normal model path (as the bill entry views write them)."""
+        from bills.models import Bill, BillItem, BillNumberBlock, Customer, Payment
+        from bills.sync import Client, reserve_numbers
+
+        if settings.SYNC_TERMINAL_ID and BillNumberBlock.remaining(TERMINAL) < opts["count"]:
+            reserve_numbers(Client(settings.SYNC_SERVER_URL), opts["count"])
+
+        rng = random.Random(f"{opts['seed']}-{settings.SYNC_TERMINAL_ID}")
+        prefix = f"bench-sync-{settings.SYNC_TERMINAL_ID or 'server'}-"
+        began = time.perf_counter()
+        with transaction.atomic():
+            customers = [Customer.objects.get_or_create(name=f"{prefix}{n}")[0] for n in range(opts["customers"])]
+            for _ in range(opts["count"]):
+                bill = Bill.objects.create(customer=rng.choice(customers), bill_no=0)
+                for _ in range(rng.randint(1, 4)):
+                    BillItem.objects.create(bill=bill, description="bench", quantity=rng.randint(1, 5),
+                                            rate=Decimal(rng.randint(10, 500)))
+                if rng.random() < 0.6:
+                    Payment.objects.create(bill=bill, amount=Decimal(rng.randint(10, 300)))
+        self.stdout.write(json.dumps({"bills": opts["count"], "seconds": round(time.perf_counter() - began, 2)}))
+
+    def sync(self, opts):
+        from bills.sync import run_sync
+
+        self.stdout.write(json.dumps(run_sync()))
+
+    def summary(self, opts):
+        from django.db.models import Count, Sum
+        from bills.ledger import replay_bills, replay_customers
+        from bills.models import Bill, BillItem, BillReturn, Customer, Payment
+
+        rows = {}
+        for model in (Customer, Bill, BillItem, Payment, BillReturn):
+            rows[model._meta.model_name] = model.objects.count()
+        totals = Bill.objects.aggregate(n=Count("id"), total=Sum("total_amount"), paid=Sum("paid_amount"))
+        rows["bill_totals"] = [str(totals["total"]), str(totals["paid"])]
+        rows["bill_numbers"] = len(set(Bill.objects.values_list("bill_no", flat=True)))
+        self.stdout.write(json.dumps({
+            "rows": rows,
+            "journal_mismatches": len(list(replay_bills())) + len(list(replay_customers())),
+        }))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bills.archive import close_year
+
+
+class Command(BaseCommand):
+    help = ("Close the financial year in BillingSettings: move its bills into the archive tables, "
+            "carry customer balances forward and roll the settings to the next year.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Bills moved per batch")
+
+    def handle(self, *args, **opts):
+        try:
+            result = close_year(batch_size=opts["batch_size"], dry_run=opts["dry_run"], log=self.stdout.write)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Done: {result}"))
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bills import jobs
+from bills.backup import BackupError
+from bills.maintenance import in_window, next_window, run_maintenance, size_report
+from bills.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "SQLite upkeep: ANALYZE, incremental vacuum (switching the file to auto_vacuum=INCREMENTAL "
+        "with --convert), an integrity check and per-table row, page and index sizes, all within a "
+        "time budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--budget", type=float, help="Seconds to spend (default DB_MAINTENANCE_BUDGET)")
+        parser.add_argument("--full", action="store_true",
+                            help="ANALYZE every row and run integrity_check instead of quick_check")
+        parser.add_argument("--convert", action="store_true",
+                            help="Rewrite the file once (VACUUM) to enable incremental vacuum; blocks writes")
+        parser.add_argument("--report", action="store_true", help="Only print the size report")
+        parser.add_argument("--top", type=int, default=15, help="Tables / indexes listed in the report")
+        parser.add_argument("--schedule", type=int, metavar="SECONDS",
+                            help="Queue a periodic job for run_worker; it only runs inside DB_MAINTENANCE_WINDOW")
+
+    def handle(self, *args, **opts):
+        try:
+            if opts["schedule"]:
+                return self.schedule(opts)
+            if opts["report"]:
+                return self.print_sizes(size_report(), opts["top"])
+            self.maintain(opts)
+        except BackupError as exc:
+            raise CommandError(str(exc))
+
+    def maintain(self, opts):
+        if not in_window():
+            self.stdout.write(self.style.WARNING(
+                f"Outside the maintenance window {settings.DB_MAINTENANCE_WINDOW}; "
+                "writes may wait while a step holds the lock."))
+        report = run_maintenance(budget=opts["budget"], full=opts["full"], convert=opts["convert"],
+                                 progress=lambda pct, note: self.stdout.write(f"  {note}"))
+        for name, step in report["steps"].items():
+            result = step["result"]
+            if isinstance(result, list):
+                result = "PROBLEMS:\n    " + "\n    ".join(result)
+            self.stdout.write(f"{name:10} {step['seconds']:8.2f}s  {result}")
+        self.print_sizes(report, opts["top"])
+        before = report["before"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{before['pages']} → {report['pages']} pages, {before['free_pages']} → {report['free_pages']} free, "
+            f"in {report['seconds']:.1f}s"))
+
+    def print_sizes(self, report, top):
+        page = report["page_size"]
+        self.stdout.write(
+            f"{report['pages'] * page / 1e6:.1f} MB: {report['pages']} pages of {page} bytes, "
+            f"{report['free_pages']} free, auto_vacuum={report['auto_vacuum']}, journal={report['journal_mode']}")
+        self.stdout.write(f"{'table':34} {'rows':>10} {'pages':>8} {'MB':>8} {'idx':>4} {'idx pages':>10} {'idx MB':>8}")
+        for t in report["tables"][:top]:
+            self.stdout.write(
+                f"{t['table'][:34]:34} {t['rows']:>10} {self.num(t['pages'])} {self.mb(t['bytes'])} "
+                f"{t['indexes']:>4} {t['index_pages']:>10} {t['index_bytes'] / 1e6:>8.2f}")
+        self.stdout.write(f"{'index':45} {'table':28} {'pages':>8} {'MB':>8}")
+        for i in report["indexes"][:top]:
+            self.stdout.write(f"{i['index'][:45]:45} {i['table'][:28]:28} {self.num(i['pages'])} {self.mb(i['bytes'])}")
+
+    @staticmethod
+    def num(value):
+        return f"{'-' if value is None else value:>8}"
+
+    @staticmethod
+    def mb(value):
+        return f"{'-':>8}" if value is None else f"{value / 1e6:>8.2f}"
+
+    def schedule(self, opts):
+        payload = {"every": opts["schedule"], "budget": opts["budget"], "full": opts["full"], "convert": opts["convert"]}
+        queued = Job.objects.filter(kind="db_maintenance", status__in=[Job.QUEUED, Job.RUNNING])
+        if queued.exists():
+            queued.filter(status=Job.QUEUED).update(payload=payload)
+            self.stdout.write("A maintenance job is already scheduled; its settings were updated.")
+            return
+        start = timezone.now() + timedelta(seconds=5) if in_window() else next_window()
+        job = jobs.enqueue("db_maintenance", payload, run_after=start)
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued {job} for {timezone.localtime(start):%Y-%m-%d %H:%M}; run_worker repeats it every "
+            f"{opts['schedule']}s inside the {settings.DB_MAINTENANCE_WINDOW[0]}:00–"
+            f"{settings.DB_MAINTENANCE_WINDOW[1]}:00 window."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from bills import dedupe
+from bills.models import MergeProposal
+
+
+class Command(BaseCommand):
+    help = ("Propose merges of duplicate customers and relinks of bills saved without a customer "
+            "(reviewed at /customers/dedupe/), optionally applying the confident ones straight away.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--apply-above", type=float, metavar="SCORE",
+                            help="Apply pending proposals scoring at least SCORE (0-1) after the scan")
+        parser.add_argument("--no-scan", action="store_true", help="Keep the pending proposals, only apply")
+
+    def handle(self, *args, **opts):
+        if not opts["no_scan"]:
+            dedupe.scan(log=self.stdout.write)
+        if opts["apply_above"] is not None:
+            pending = MergeProposal.objects.filter(status=MergeProposal.PENDING, score__gte=opts["apply_above"])
+            result = dedupe.apply(pending, log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f"Done: {result}"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from bills.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Write a balance snapshot per customer so point-in-time balances only scan the journal tail."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--as-of", help="YYYY-MM-DD (default: today)")
+
+    def handle(self, *args, **opts):
+        as_of = parse_date(opts["as_of"]) if opts["as_of"] else None
+        count = take_snapshots(as_of)
+        self.stdout.write(self.style.SUCCESS(f"{count} customer snapshot(s) written."))
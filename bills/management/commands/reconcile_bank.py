@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bills.models import BankLine
+from bills.reconcile import import_statement, match_statement, post_lines
+
+
+class Command(BaseCommand):
+    help = ("Import a bank / UPI CSV export, match its credits to open bills (review them at /bank/) "
+            "and optionally post the confident matches as payments.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV export of the account statement")
+        parser.add_argument("--post-above", type=float, metavar="SCORE",
+                            help="Post proposals scoring at least SCORE (0-1) as payments right away")
+
+    def handle(self, *args, **opts):
+        try:
+            fh = open(opts["path"], "rb")
+        except OSError as exc:
+            raise CommandError(str(exc))
+        with fh:
+            statement = import_statement(fh, opts["path"])
+        self.stdout.write(f"Statement #{statement.id}: {statement.lines} credit(s), "
+                          f"{statement.duplicates} already imported")
+        match_statement(statement, log=self.stdout.write)
+        if opts["post_above"] is not None:
+            lines = statement.bank_lines.filter(status=BankLine.PROPOSED, score__gte=opts["post_above"])
+            result = post_lines(lines, log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f"Done: {result}"))
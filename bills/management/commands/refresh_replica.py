@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bills import jobs
+from bills.models import Job
+from bills.replica import refresh_sqlite_replica
+
+
+class Command(BaseCommand):
+    help = "Refresh the SQLite read-replica snapshot used by the report views (BILLING_REPLICA_PATH)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--schedule", type=int, metavar="SECONDS",
+                            help="Queue a periodic refresh job for run_worker instead of refreshing now")
+
+    def handle(self, *args, **opts):
+        if settings.REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError("No replica configured; set BILLING_REPLICA_PATH.")
+
+        if opts["schedule"]:
+            payload = {"every": opts["schedule"]}
+            queued = Job.objects.filter(kind="refresh_replica", status=Job.QUEUED)
+            if queued.exists():
+                queued.update(payload=payload)
+                self.stdout.write("A refresh job is already queued; its interval was updated.")
+            else:
+                jobs.enqueue("refresh_replica", payload, run_after=timezone.now() + timedelta(seconds=1))
+                self.stdout.write(self.style.SUCCESS(f"Queued; run_worker refreshes the replica every {opts['schedule']}s."))
+            return
+
+        try:
+            seconds = refresh_sqlite_replica()
+        except ImproperlyConfigured as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Replica refreshed in {seconds:.2f}s."))
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+
+# Pool entry points live here (not in bills.jobs) so a spawned process can
+# unpickle them before the app registry is ready.
+def _init_process():
+    import django
+    django.setup()
+
+
+def _run_job(job_id):
+    from bills import jobs
+    return jobs.execute(job_id)
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the database queue (no external broker needed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=2, help="Jobs run at the same time")
+        parser.add_argument("--pool", choices=["thread", "process"], default="thread",
+                            help="thread for DB/IO heavy jobs, process for CPU heavy ones (PDF rendering)")
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds between queue polls when idle")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit")
+
+    def handle(self, *args, **opts):
+        from bills import jobs
+
+        concurrency = max(1, opts["concurrency"])
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        if opts["pool"] == "process":
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=concurrency, initializer=_init_process,
+                                       mp_context=multiprocessing.get_context("spawn"))
+        else:
+            pool = ThreadPoolExecutor(max_workers=concurrency)
+
+        self.stdout.write(f"Worker {worker_id}: {concurrency} {opts['pool']}(s), kinds: {', '.join(sorted(jobs.HANDLERS))}")
+        running = {}
+        self.last_beat = time.monotonic()
+        with pool:
+            while not self.stopping:
+                close_old_connections()
+                self._heartbeat(worker_id, running)
+                jobs.requeue_stale()
+
+                while len(running) < concurrency:
+                    job = jobs.claim_next(worker_id)
+                    if job is None:
+                        break
+                    self.stdout.write(f"→ {job}")
+                    running[pool.submit(_run_job, job.id)] = job
+
+                if not running:
+                    if opts["once"]:
+                        break
+                    time.sleep(opts["poll"])
+                    continue
+
+                done, _ = wait(running, timeout=opts["poll"], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as exc:  # crashed process; stale lock will requeue it
+                        status = f"crashed: {exc}"
+                    self.stdout.write(f"← Job #{job.id} {job.kind}: {status}")
+
+            if running:
+                self.stdout.write(f"Waiting for {len(running)} running job(s)…")
+            while running:
+                done, _ = wait(running, timeout=opts["poll"])
+                for future in done:
+                    running.pop(future)
+                self._heartbeat(worker_id, running)
+
+    def _heartbeat(self, worker_id, running):
+        # Long jobs keep their lock; only a dead worker's jobs go stale
+        from bills import jobs
+
+        if running and time.monotonic() - self.last_beat >= settings.JOB_HEARTBEAT_SECONDS:
+            jobs.heartbeat(worker_id, [job.id for job in running.values()])
+            self.last_beat = time.monotonic()
+
+    def _stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bills import jobs
+from bills.models import BillNumberBlock, Job, SyncConflict
+from bills.sync import SyncError, run_sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Sync this POS terminal with the central server: reserve bill numbers, push the "
+        "changes made here and pull everyone else's (BILLING_TERMINAL_ID must be set)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", help="Central server URL (default BILLING_SYNC_URL)")
+        parser.add_argument("--batch", type=int, help="Change-log entries per request (default SYNC_BATCH)")
+        parser.add_argument("--schedule", type=int, metavar="SECONDS",
+                            help="Queue a periodic sync job for run_worker instead of syncing now")
+        parser.add_argument("--conflicts", action="store_true", help="List unresolved sync conflicts")
+
+    def handle(self, *args, **opts):
+        if opts["conflicts"]:
+            return self.list_conflicts()
+        if opts["schedule"]:
+            return self.schedule(opts)
+        try:
+            report = run_sync(server=opts["server"], batch=opts["batch"], log=self.stdout.write)
+        except SyncError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced in {report['seconds']}s: pushed {report['pushed']} row(s) ({report['accepted']} applied), "
+            f"pulled {report['pulled']}, {report['bytes_sent'] / 1e3:.1f} kB up / "
+            f"{report['bytes_received'] / 1e3:.1f} kB down."
+        ))
+        if report["conflicts"]:
+            self.stdout.write(self.style.WARNING(
+                f"{report['conflicts']} conflict(s); the server's version was kept. See --conflicts."
+            ))
+
+    def list_conflicts(self):
+        conflicts = SyncConflict.objects.filter(resolved=False)
+        for c in conflicts:
+            self.stdout.write(f"{c.created_at:%Y-%m-%d %H:%M}  {c.terminal}  {c.model} {c.sync_id}  "
+                              f"{c.op}: {c.reason} (based on v{c.base_version}, server v{c.server_version})")
+        if not conflicts:
+            self.stdout.write("No unresolved conflicts.")
+
+    def schedule(self, opts):
+        if not settings.SYNC_TERMINAL_ID:
+            raise CommandError("BILLING_TERMINAL_ID is not set; only POS terminals sync.")
+        payload = {"every": opts["schedule"], "server": opts["server"]}
+        queued = Job.objects.filter(kind="sync_terminal", status__in=[Job.QUEUED, Job.RUNNING])
+        if queued.exists():
+            queued.filter(status=Job.QUEUED).update(payload=payload)
+            self.stdout.write("A sync job is already scheduled; its interval was updated.")
+            return
+        job = jobs.enqueue("sync_terminal", payload, run_after=timezone.now() + timedelta(seconds=1))
+        left = BillNumberBlock.remaining(settings.SYNC_TERMINAL_ID)
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued {job}; run_worker will sync every {opts['schedule']}s ({left} bill numbers reserved now)."
+        ))
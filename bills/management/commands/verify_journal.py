@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bills.ledger import replay_bills, replay_customers
+
+
+class Command(BaseCommand):
+    help = "Replay the ledger journal and compare it with the stored Customer/Bill balance columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bills", action="store_true", help="Also check every bill, not just customers")
+        parser.add_argument("--limit", type=int, default=50, help="Mismatches to print per section")
+
+    def handle(self, *args, **opts):
+        sections = [("customer", replay_customers, "total/paid")]
+        if opts["bills"]:
+            sections.append(("bill", replay_bills, "net/paid"))
+
+        bad = 0
+        for label, replay, columns in sections:
+            count = 0
+            for row_id, stored_total, stored_paid, debit, credit in replay():
+                count += 1
+                if count <= opts["limit"]:
+                    self.stdout.write(
+                        f"{label} #{row_id}: stored {columns} {stored_total}/{stored_paid} "
+                        f"≠ journal {debit}/{credit}"
+                    )
+            self.stdout.write(f"{label}s with drift: {count}")
+            bad += count
+
+        if bad:
+            raise CommandError(f"{bad} balance(s) do not match the journal.")
+        self.stdout.write(self.style.SUCCESS("Journal matches stored balances."))
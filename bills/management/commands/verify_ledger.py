@@ -0,0 +1,52 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bills.integrity import check_bills, check_customers, csv_rows, repair
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every bill and customer balance from items, payments and returns, "
+        "write the differences to a CSV and optionally repair them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Processes checking bill id ranges in parallel (1 = in this process)")
+        parser.add_argument("--chunk", type=int, default=50_000, help="Bill ids per partition")
+        parser.add_argument("--csv", default="-", help="Report path (default '-': stdout)")
+        parser.add_argument("--fix", action="store_true", help="Write the recomputed values back")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        began = time.perf_counter()
+        bill_drift, per_customer = check_bills(opts["workers"], opts["chunk"])
+        customer_drift = check_customers(per_customer)
+        self.stdout.write(
+            f"Checked in {time.perf_counter() - began:.1f}s: {len(bill_drift)} bill(s) and "
+            f"{len(customer_drift)} customer(s) differ."
+        )
+
+        if opts["csv"] == "-":
+            if bill_drift or customer_drift:
+                csv.writer(self.stdout).writerows(csv_rows(bill_drift, customer_drift))
+        elif bill_drift or customer_drift:
+            with open(opts["csv"], "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(csv_rows(bill_drift, customer_drift))
+            self.stdout.write(f"Report: {opts['csv']}")
+
+        if not (bill_drift or customer_drift):
+            self.stdout.write(self.style.SUCCESS("All balances match their items, payments and returns."))
+            return
+
+        if not opts["fix"]:
+            raise CommandError("Balances differ; re-run with --fix to repair them.")
+
+        began = time.perf_counter()
+        bills, customers = repair(bill_drift, customer_drift, opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Repaired {bills} bill(s) and {customers} customer(s) in {time.perf_counter() - began:.1f}s."
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0028_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='ledger_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0029_customer_ledger_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bill', 'Bill posted'), ('payment', 'Payment'), ('return', 'Return'), ('adjustment', 'Adjustment')], max_length=12)),
+                ('date', models.DateField()),
+                ('debit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('credit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('note', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bill', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='bills.bill')),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='bills.customer')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['customer', 'date'], name='bills_ledge_custome_e06ced_idx'), models.Index(fields=['customer', 'id'], name='bills_ledge_custome_c0a33a_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField()),
+                ('last_entry_id', models.BigIntegerField()),
+                ('debit_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_snapshots', to='bills.customer')),
+            ],
+            options={
+                'ordering': ['-as_of', '-last_entry_id'],
+                'indexes': [models.Index(fields=['customer', 'as_of'], name='bills_ledge_custome_e9e14b_idx')],
+            },
+        ),
+    ]
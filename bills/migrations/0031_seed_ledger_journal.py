@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def seed_opening_entries(apps, schema_editor):
+    """Start the journal from the balances already stored on each bill."""
+    Bill = apps.get_model('bills', 'Bill')
+    LedgerEntry = apps.get_model('bills', 'LedgerEntry')
+
+    batch = []
+    fields = ('id', 'customer_id', 'date', 'bill_no', 'total_amount', 'returned_amount', 'paid_amount')
+    for b in Bill.objects.order_by('id').values(*fields).iterator(chunk_size=2000):
+        net = max((b['total_amount'] or Decimal('0')) - (b['returned_amount'] or Decimal('0')), Decimal('0'))
+        paid = b['paid_amount'] or Decimal('0')
+        if not net and not paid:
+            continue
+        batch.append(LedgerEntry(
+            customer_id=b['customer_id'], bill_id=b['id'], kind='adjustment', date=b['date'],
+            debit=net, credit=paid, note=f"Opening balance for Bill #{b['bill_no']}",
+        ))
+        if len(batch) >= 2000:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0030_ledger_journal'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_opening_entries, migrations.RunPython.noop),
+    ]
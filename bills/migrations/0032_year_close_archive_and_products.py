@@ -0,0 +1,99 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:02
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0031_seed_ledger_journal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=30, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('default_rate', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('unit', models.CharField(default='pcs', max_length=20)),
+                ('active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBill',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('financial_year', models.CharField(max_length=9)),
+                ('customer_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('phone', models.CharField(blank=True, max_length=20, null=True)),
+                ('date', models.DateField()),
+                ('bill_no', models.IntegerField()),
+                ('packing_qty', models.IntegerField(blank=True, null=True)),
+                ('packing_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('packing_reason', models.CharField(blank=True, max_length=255, null=True)),
+                ('extra_reason', models.CharField(blank=True, max_length=255, null=True)),
+                ('extra_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('returned_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('is_paid', models.BooleanField(default=False)),
+                ('paid_date', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_bills', to='bills.customer')),
+                ('paid_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date', '-bill_no'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBillReturn',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('note', models.TextField(blank=True, null=True)),
+                ('date', models.DateTimeField()),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='returns', to='bills.archivedbill')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date', models.DateField()),
+                ('note', models.CharField(blank=True, max_length=200, null=True)),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='bills.archivedbill')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedBillItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('description', models.TextField(blank=True)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('rate', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='bills.archivedbill')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bills.product')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bill_items', to='bills.product'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbill',
+            index=models.Index(fields=['date'], name='bills_archi_date_99cfd0_idx'),
+        ),
+    ]
@@ -0,0 +1,147 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:08
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_taxable_amount(apps, schema_editor):
+    """Bills written before GST: every item total is taxable value at 0%."""
+    Bill = apps.get_model('bills', 'Bill')
+    BillItem = apps.get_model('bills', 'BillItem')
+    items = (BillItem.objects.filter(bill=OuterRef('pk')).order_by()
+             .values('bill').annotate(s=Sum('total')).values('s'))
+    money = DecimalField(max_digits=12, decimal_places=2)
+    Bill.objects.update(taxable_amount=Coalesce(Subquery(items, output_field=money), Value(Decimal('0')), output_field=money))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0032_year_close_archive_and_products'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbill',
+            name='cgst_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='archivedbill',
+            name='igst_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='archivedbill',
+            name='place_of_supply',
+            field=models.CharField(blank=True, default='', max_length=2),
+        ),
+        migrations.AddField(
+            model_name='archivedbill',
+            name='sgst_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='archivedbill',
+            name='taxable_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='archivedbillitem',
+            name='cgst',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='archivedbillitem',
+            name='gst_rate',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='archivedbillitem',
+            name='hsn_code',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='archivedbillitem',
+            name='igst',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='archivedbillitem',
+            name='sgst',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='cgst_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='igst_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='place_of_supply',
+            field=models.CharField(blank=True, default='', max_length=2),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='sgst_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='taxable_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='cgst',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='gst_rate',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='hsn_code',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='igst',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='sgst',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='gstin',
+            field=models.CharField(blank=True, default='', max_length=15),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='state_code',
+            field=models.CharField(blank=True, default='', max_length=2),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='gst_rate',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='hsn_code',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.RunPython(backfill_taxable_amount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,169 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:52
+
+import uuid
+from django.db import migrations, models
+
+
+SYNCED = ['customer', 'bill', 'billitem', 'payment', 'billreturn']   # parents first
+
+
+def assign_sync_ids(apps, schema_editor):
+    """
+    Give every existing row its own sync id and seed the change feed with
+    one entry per row, so a new terminal pulling from 0 receives everything.
+    """
+    ChangeLog = apps.get_model('bills', 'ChangeLog')
+    for name in SYNCED:
+        model = apps.get_model('bills', name)
+        rows = list(model.objects.only('id').order_by('id'))
+        for row in rows:
+            row.sync_id = uuid.uuid4()
+        model.objects.bulk_update(rows, ['sync_id'], batch_size=1000)
+        ChangeLog.objects.bulk_create(
+            [ChangeLog(model=name, sync_id=row.sync_id) for row in rows], batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0033_gst_taxes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillNumberBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terminal', models.CharField(max_length=30)),
+                ('start', models.IntegerField()),
+                ('end', models.IntegerField()),
+                ('next_no', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncConflict',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terminal', models.CharField(max_length=30)),
+                ('model', models.CharField(max_length=20)),
+                ('sync_id', models.UUIDField()),
+                ('op', models.CharField(max_length=6)),
+                ('reason', models.CharField(max_length=100)),
+                ('base_version', models.BigIntegerField(default=0)),
+                ('server_version', models.BigIntegerField(default=0)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('resolved', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('server', models.CharField(max_length=200, unique=True)),
+                ('pull_cursor', models.BigIntegerField(default=0)),
+                ('push_cursor', models.BigIntegerField(default=0)),
+                ('last_sync', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='sync_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='sync_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='sync_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='sync_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='billreturn',
+            name='sync_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='billreturn',
+            name='sync_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='sync_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='sync_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='sync_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='sync_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20)),
+                ('sync_id', models.UUIDField()),
+                ('op', models.CharField(default='upsert', max_length=6)),
+                ('base_version', models.BigIntegerField(default=0)),
+                ('origin', models.CharField(blank=True, default='', max_length=30)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['sync_id', 'id'], name='bills_chang_sync_id_a66456_idx')],
+            },
+        ),
+        migrations.RunPython(assign_sync_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customer',
+            name='sync_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='sync_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='billitem',
+            name='sync_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='sync_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='billreturn',
+            name='sync_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,245 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:18
+
+import bills.money
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations
+
+
+def _scale(apps, schema_editor, expression):
+    """Rewrite every column altered below in place, e.g. rupees -> paise."""
+    columns = defaultdict(list)
+    for op in Migration.operations:
+        if isinstance(op, migrations.AlterField):
+            columns[op.model_name].append(op.name)
+    quote = schema_editor.quote_name
+    for model_name, names in columns.items():
+        model = apps.get_model('bills', model_name)
+        sets = ", ".join(
+            "{0} = {1}".format(quote(c), expression.format(quote(c)))
+            for c in (model._meta.get_field(name).column for name in names)
+        )
+        schema_editor.execute(f"UPDATE {quote(model._meta.db_table)} SET {sets}")
+
+
+def to_paise(apps, schema_editor):
+    # Still decimal columns here; the AlterFields then make them integers.
+    # SQLite keeps them as binary floats (1.015 * 100 = 101.49999...), so
+    # the value is nudged a thousandth of a paisa away from zero before
+    # ROUND, which then rounds half up like money.to_paise().
+    _scale(apps, schema_editor, "CAST(ROUND({0} * 100 + CASE WHEN {0} < 0 THEN -0.001 ELSE 0.001 END) AS INTEGER)")
+
+
+def to_rupees(apps, schema_editor):
+    _scale(apps, schema_editor, "{} / 100.0")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0035_request_profiles'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_paise, to_rupees),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='cgst_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='extra_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='igst_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='packing_rate',
+            field=bills.money.PaiseField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='paid_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='returned_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='sgst_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='taxable_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedbill',
+            name='total_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedbillitem',
+            name='cgst',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='archivedbillitem',
+            name='igst',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='archivedbillitem',
+            name='rate',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='archivedbillitem',
+            name='sgst',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='archivedbillitem',
+            name='total',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='archivedbillreturn',
+            name='amount',
+            field=bills.money.PaiseField(),
+        ),
+        migrations.AlterField(
+            model_name='archivedpayment',
+            name='amount',
+            field=bills.money.PaiseField(),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='cgst_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='extra_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='igst_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='packing_rate',
+            field=bills.money.PaiseField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='paid_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='returned_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='sgst_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='taxable_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='total_amount',
+            field=bills.money.PaiseField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='billitem',
+            name='cgst',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='billitem',
+            name='igst',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='billitem',
+            name='rate',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='billitem',
+            name='sgst',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='billitem',
+            name='total',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='billreturn',
+            name='amount',
+            field=bills.money.PaiseField(),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='paid_amount',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='remaining_amount',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='total_amount',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='credit',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='debit',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='ledgersnapshot',
+            name='credit_total',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='ledgersnapshot',
+            name='debit_total',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='amount',
+            field=bills.money.PaiseField(),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='default_rate',
+            field=bills.money.PaiseField(default=Decimal('0.00')),
+        ),
+    ]
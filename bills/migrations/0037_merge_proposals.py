@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0036_paise_money'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MergeProposal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('merge', 'Merge customers'), ('relink', 'Relink bills')], max_length=10)),
+                ('sources', models.JSONField(blank=True, default=list)),
+                ('names', models.JSONField(blank=True, default=list)),
+                ('bills', models.PositiveIntegerField(default=0)),
+                ('score', models.FloatField()),
+                ('reason', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('applied', 'Applied'), ('rejected', 'Rejected')], default='pending', max_length=10)),
+                ('decided_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('decided_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='merge_proposals', to='bills.customer')),
+            ],
+            options={
+                'ordering': ['-score', 'id'],
+                'indexes': [models.Index(fields=['status', 'score'], name='bills_merge_status_90d1b1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:32
+
+import bills.money
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0037_merge_proposals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('lines', models.PositiveIntegerField(default=0)),
+                ('duplicates', models.PositiveIntegerField(default=0)),
+                ('matched', models.PositiveIntegerField(default=0)),
+                ('posted', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('imported_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BankLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_no', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('amount', bills.money.PaiseField()),
+                ('narration', models.CharField(blank=True, default='', max_length=300)),
+                ('reference', models.CharField(blank=True, default='', max_length=100)),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('status', models.CharField(choices=[('unmatched', 'Unmatched'), ('proposed', 'Proposed'), ('posted', 'Posted'), ('ignored', 'Ignored')], default='unmatched', max_length=10)),
+                ('allocations', models.JSONField(blank=True, default=list)),
+                ('score', models.FloatField(default=0)),
+                ('reason', models.CharField(blank=True, default='', max_length=200)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bank_lines', to='bills.customer')),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bank_lines', to='bills.bankstatement')),
+            ],
+            options={
+                'ordering': ['statement', 'line_no'],
+                'indexes': [models.Index(fields=['statement', 'status'], name='bills_bankl_stateme_cfce95_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0039_admin_date_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['is_paid', 'date', 'bill_no'], name='bills_bill_is_paid_bd9ef7_idx'),
+        ),
+    ]
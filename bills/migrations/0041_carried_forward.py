@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+
+def flag_opening_balances(apps, schema_editor):
+    """Opening-balance bills written by close_year() so far are known by their reason."""
+    for name in ('bill', 'archivedbill'):
+        apps.get_model('bills', name).objects.filter(
+            extra_reason__startswith='Opening balance (FY ',
+        ).update(carried_forward=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0040_bill_register_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbill',
+            name='carried_forward',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='carried_forward',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(flag_opening_balances, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,16 @@
-from django.db import models
+import contextvars
+import uuid
+from contextlib import contextmanager
+
+from django.db import models, transaction
 from django.utils import timezone
 from decimal import Decimal
+from datetime import datetime
 from django.conf import settings
 
+from .money import ZERO, PaiseField
+from .replica import note_writes
+
 
 # 🧾 CUSTOMER MODEL
 class Customer(models.Model):
@@ -11,9 +19,20 @@ class Customer(models.Model):
     address = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
-    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
-    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
-    remaining_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    # GST: registered buyers (B2B) have a GSTIN; state code = place of supply
+    gstin = models.CharField(max_length=15, blank=True, default='')
+    state_code = models.CharField(max_length=2, blank=True, default='')
+
+    total_amount = PaiseField(default=Decimal('0.00'))
+    paid_amount = PaiseField(default=Decimal('0.00'))
+    remaining_amount = PaiseField(default=Decimal('0.00'))
+
+    # Bumped on every bill/item/payment/return write; part of the report cache key
+    ledger_version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Offline POS sync (bills/sync.py): id shared by all copies + central version last synced
+    sync_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    sync_version = models.BigIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.name} ({self.phone})" if self.phone else self.name
@@ -21,6 +40,29 @@ class Customer(models.Model):
     class Meta:
         ordering = ['name']
 
+    def save(self, *args, **kwargs):
+        # A full save of a loaded customer must not write back a stale version
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('ledger_version', 'sync_version')
+            ]
+        super().save(*args, **kwargs)
+        ChangeLog.record(self, update_fields=kwargs.get('update_fields'))
+        note_writes(self.pk)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        ChangeLog.record(self, ChangeLog.DELETE)
+        return result
+
+    @staticmethod
+    def bump_ledger_version(*customer_ids):
+        ids = {cid for cid in customer_ids if cid}
+        if ids:
+            Customer.objects.filter(id__in=ids).update(ledger_version=models.F('ledger_version') + 1)
+            note_writes(*ids)
+
     def refresh_totals(self):
         bills = self.bill_set.all()
         total = sum((b.net_total or 0) for b in bills)
@@ -43,38 +85,74 @@ class Bill(models.Model):
     bill_no = models.IntegerField(default=1)
 
     packing_qty = models.IntegerField(blank=True, null=True)
-    packing_rate = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    packing_rate = PaiseField(blank=True, null=True)
     packing_reason = models.CharField(max_length=255, blank=True, null=True)
 
     extra_reason = models.CharField(max_length=255, blank=True, null=True)
-    extra_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    extra_amount = PaiseField(default=0)
+    # Opening balance written by archive.close_year(); stands in for the archived bills before it
+    carried_forward = models.BooleanField(default=False)
+
+    # GST, stored by update_total() (taxable = item totals; taxes are included in total_amount)
+    place_of_supply = models.CharField(max_length=2, blank=True, default='')
+    taxable_amount = PaiseField(default=0)
+    cgst_amount = PaiseField(default=0)
+    sgst_amount = PaiseField(default=0)
+    igst_amount = PaiseField(default=0)
 
-    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    returned_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_amount = PaiseField(default=0)
+    paid_amount = PaiseField(default=0)
+    returned_amount = PaiseField(default=0)
 
     is_paid = models.BooleanField(default=False)
     paid_date = models.DateTimeField(null=True, blank=True)
     paid_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
 
-    def save(self, *args, **kwargs):
+    # Offline POS sync (bills/sync.py): id shared by all copies + central version last synced
+    sync_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    sync_version = models.BigIntegerField(default=0, editable=False)
+
+    @staticmethod
+    def next_number(consume=False):
+        # POS terminals number from blocks reserved on the central server;
+        # the server itself skips past every block it has handed out.
+        if settings.SYNC_TERMINAL_ID:
+            return BillNumberBlock.take(settings.SYNC_TERMINAL_ID, consume)
+        last_bill = Bill.objects.order_by('-bill_no').first()
+        return max(last_bill.bill_no if last_bill else 0, BillNumberBlock.highest()) + 1
+
+    def save(self, *args, ledger_date=None, **kwargs):
+        # ledger_date: business date of the payment / return behind this write (journal entry date)
         # Auto bill no
         if not self.bill_no:
-            last_bill = Bill.objects.order_by('-bill_no').first()
-            self.bill_no = 1 if not last_bill else last_bill.bill_no + 1
+            self.bill_no = Bill.next_number(consume=True)
 
         # Auto fill customer info
         if self.customer:
             self.customer_name = self.customer.name
             self.phone = self.customer.phone
+            if not self.place_of_supply:
+                self.place_of_supply = self.customer.state_code
 
         # Prevent None packing values
         if self.packing_qty is None:
             self.packing_qty = 0
         if self.packing_rate is None:
-            self.packing_rate = Decimal('0.00')
+            self.packing_rate = ZERO
 
-        super().save(*args, **kwargs)
+        # Column write + journal entry commit together
+        with transaction.atomic():
+            old = None
+            if self.pk and self._touches_ledger(kwargs.get('update_fields')):
+                old = Bill.objects.filter(pk=self.pk).values(*LedgerEntry.BILL_FIELDS).first()
+            is_new = old is None and (self._state.adding or not self.pk)
+
+            super().save(*args, **kwargs)
+
+            if old is not None or is_new:
+                LedgerEntry.record_bill_change(self, old, kwargs.get('update_fields'), on=ledger_date)
+            ChangeLog.record(self, update_fields=kwargs.get('update_fields'))
+            Customer.bump_ledger_version(self.customer_id, old and old['customer_id'])
 
         # Refresh paid flag
         self._refresh_paid_flag()
@@ -83,14 +161,51 @@ class Bill(models.Model):
         if self.customer:
             self.customer.refresh_totals()
 
-    # Bill Total = Items + Packing + Extra
+    def delete(self, *args, **kwargs):
+        customer = self.customer
+        with transaction.atomic():
+            LedgerEntry.reverse_bill(self)
+            result = super().delete(*args, **kwargs)
+            ChangeLog.record(self, ChangeLog.DELETE)
+        if customer:
+            Customer.bump_ledger_version(customer.id)
+            customer.refresh_totals()
+        return result
+
+    @staticmethod
+    def _touches_ledger(update_fields):
+        if update_fields is None:
+            return True
+        return bool(set(update_fields) & {'customer', 'customer_id', 'total_amount', 'returned_amount', 'paid_amount'})
+
+    @property
+    def is_inter_state(self):
+        home = settings.GST_STATE_CODE
+        return bool(home and self.place_of_supply and self.place_of_supply != home)
+
+    # Bill Total = Items + GST + Packing + Extra
     def update_total(self):
-        items_total = sum((i.total or 0) for i in self.items.all())
-        packing_total = (self.packing_qty or 0) * (self.packing_rate or 0)
-        extra_total = self.extra_amount or 0
+        from .gst import apply_line_taxes
+
+        items = list(self.items.all())
+        # Place of supply may have changed since the lines were taxed
+        changed = [i for i in items if apply_line_taxes(i, self.is_inter_state)]
+        if changed:
+            BillItem.objects.bulk_update(changed, ['cgst', 'sgst', 'igst'])
+            ChangeLog.record_many(BillItem, [i.sync_id for i in changed])
+
+        items_total = sum((i.total or ZERO for i in items), ZERO)
+        packing_total = (self.packing_qty or 0) * (self.packing_rate or ZERO)
+        extra_total = self.extra_amount or ZERO
+
+        self.taxable_amount = items_total
+        self.cgst_amount = sum((i.cgst for i in items), ZERO)
+        self.sgst_amount = sum((i.sgst for i in items), ZERO)
+        self.igst_amount = sum((i.igst for i in items), ZERO)
+        taxes = self.cgst_amount + self.sgst_amount + self.igst_amount
 
-        self.total_amount = Decimal(items_total) + Decimal(packing_total) + Decimal(extra_total)
-        self.save(update_fields=['total_amount'])
+        self.total_amount = items_total + taxes + packing_total + extra_total
+        self.save(update_fields=['taxable_amount', 'cgst_amount', 'sgst_amount', 'igst_amount', 'total_amount'])
 
     # 🔥 Required Method — missing earlier
     def _refresh_paid_flag(self):
@@ -104,6 +219,14 @@ class Bill(models.Model):
             self.paid_date = None
             self.save(update_fields=['is_paid', 'paid_date'])
 
+    # Paid = positive payments only. The negative "Return: …" payments just
+    # mirror BillReturn rows, which already reduce the net (views.return_bill).
+    # Payment.update_bill_paid_total and integrity._check both use this.
+    PAID_PAYMENTS = models.Q(amount__gt=0)
+
+    def payments_paid(self):
+        return self.payments.filter(Bill.PAID_PAYMENTS).aggregate(s=models.Sum('amount'))['s'] or ZERO
+
     @property
     def net_total(self):
         return max((self.total_amount or 0) - (self.returned_amount or 0), 0)
@@ -112,48 +235,113 @@ class Bill(models.Model):
     def remaining(self):
         return max(self.net_total - (self.paid_amount or 0), 0)
 
+    def __str__(self):
+        return f"Bill #{self.bill_no} – {self.customer_name}" if self.customer_name else f"Bill #{self.bill_no}"
+
     class Meta:
         ordering = ['-date', '-bill_no']
+        indexes = [
+            models.Index(fields=['date', 'bill_no']),              # default ordering, admin date drill-down
+            models.Index(fields=['is_paid', 'date', 'bill_no']),   # bill register: paid / unpaid pages
+        ]
+
+
+
+# 📦 PRODUCT / ITEM MASTER
+class Product(models.Model):
+    code = models.CharField(max_length=30, unique=True)
+    name = models.CharField(max_length=200)
+    default_rate = PaiseField(default=Decimal('0.00'))
+    unit = models.CharField(max_length=20, default='pcs')
+    hsn_code = models.CharField(max_length=8, blank=True, default='')
+    gst_rate = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('0.00'))   # percent
+    active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)   # part of the lookup index version stamp
 
+    def __str__(self):
+        return f"{self.code} – {self.name}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .catalog import invalidate
+        invalidate()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        from .catalog import invalidate
+        invalidate()
+        return result
+
+    class Meta:
+        ordering = ['code']
 
 
 # 🧾 BILL ITEM MODEL
 class BillItem(models.Model):
     bill = models.ForeignKey(Bill, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='bill_items', null=True, blank=True, on_delete=models.SET_NULL)
     description = models.TextField(blank=True)
     quantity = models.PositiveIntegerField(default=1)
-    rate = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
-    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    rate = PaiseField(default=Decimal('0.00'))
+    total = PaiseField(default=Decimal('0.00'))   # taxable value
+
+    # GST for this line, computed on save
+    hsn_code = models.CharField(max_length=8, blank=True, default='')
+    gst_rate = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('0.00'))
+    cgst = PaiseField(default=Decimal('0.00'))
+    sgst = PaiseField(default=Decimal('0.00'))
+    igst = PaiseField(default=Decimal('0.00'))
+
+    # Offline POS sync (bills/sync.py): id shared by all copies + central version last synced
+    sync_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    sync_version = models.BigIntegerField(default=0, editable=False)
 
     def save(self, *args, **kwargs):
-        self.total = Decimal(self.quantity) * Decimal(self.rate)
+        from .gst import apply_line_taxes
+
+        self.rate = self._meta.get_field('rate').to_python(self.rate)
+        self.total = Decimal(self.quantity) * self.rate
+        if self.product_id and not self.hsn_code:
+            self.hsn_code = self.product.hsn_code
+            self.gst_rate = self.product.gst_rate
+        apply_line_taxes(self, self.bill.is_inter_state)
         super().save(*args, **kwargs)
+        ChangeLog.record(self, update_fields=kwargs.get('update_fields'))
         self.bill.update_total()
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
+        ChangeLog.record(self, ChangeLog.DELETE)
         self.bill.update_total()
 
 
 # 💰 PAYMENT MODEL
 class Payment(models.Model):
     bill = models.ForeignKey(Bill, related_name='payments', on_delete=models.CASCADE)
-    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount = PaiseField()
     date = models.DateField(default=timezone.now)
     note = models.CharField(max_length=200, blank=True, null=True)
 
+    # Offline POS sync (bills/sync.py): id shared by all copies + central version last synced
+    sync_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    sync_version = models.BigIntegerField(default=0, editable=False)
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        ChangeLog.record(self, update_fields=kwargs.get('update_fields'))
         self.update_bill_paid_total()
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
+        ChangeLog.record(self, ChangeLog.DELETE)
         self.update_bill_paid_total()
 
+    class Meta:
+        indexes = [models.Index(fields=['date'])]
+
     def update_bill_paid_total(self):
-        total_paid = sum((p.amount or 0) for p in self.bill.payments.all())
-        self.bill.paid_amount = max(total_paid, 0)
-        self.bill.save(update_fields=['paid_amount'])
+        self.bill.paid_amount = self.bill.payments_paid()
+        self.bill.save(update_fields=['paid_amount'], ledger_date=self.date)
         self.bill._refresh_paid_flag()
         if self.bill.customer:
             self.bill.customer.refresh_totals()
@@ -162,22 +350,28 @@ class Payment(models.Model):
 # 💼 BILL RETURN MODEL
 class BillReturn(models.Model):
     bill = models.ForeignKey(Bill, related_name='returns', on_delete=models.CASCADE)
-    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount = PaiseField()
     note = models.TextField(blank=True, null=True)
     date = models.DateTimeField(default=timezone.now)
 
+    # Offline POS sync (bills/sync.py): id shared by all copies + central version last synced
+    sync_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    sync_version = models.BigIntegerField(default=0, editable=False)
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        ChangeLog.record(self, update_fields=kwargs.get('update_fields'))
         total_return = sum(r.amount for r in self.bill.returns.all())
         self.bill.returned_amount = max(total_return, 0)
-        self.bill.save(update_fields=['returned_amount'])
+        self.bill.save(update_fields=['returned_amount'], ledger_date=self.date)
         self.bill.update_total()
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
+        ChangeLog.record(self, ChangeLog.DELETE)
         total_return = sum(r.amount for r in self.bill.returns.all())
         self.bill.returned_amount = max(total_return, 0)
-        self.bill.save(update_fields=['returned_amount'])
+        self.bill.save(update_fields=['returned_amount'], ledger_date=self.date)
         self.bill.update_total()
 
 class BillingSettings(models.Model):
@@ -189,3 +383,500 @@ class BillingSettings(models.Model):
     def __str__(self):
         return f"Billing Settings ({self.financial_year_start} → {self.financial_year_end})"
 
+    @staticmethod
+    def parse(value):
+        return datetime.strptime(value, "%d-%m-%Y").date()
+
+    @staticmethod
+    def format(value):
+        return value.strftime("%d-%m-%Y")
+
+    @property
+    def fy_start(self):
+        return self.parse(self.financial_year_start)
+
+    @property
+    def fy_end(self):
+        return self.parse(self.financial_year_end)
+
+
+
+# ⚙️ BACKGROUND JOB MODEL (run by `manage.py run_worker`)
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, null=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    progress = models.PositiveSmallIntegerField(default=0)   # 0-100
+    progress_note = models.CharField(max_length=200, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.CharField(max_length=255, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job #{self.pk} {self.kind} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+
+# 📒 LEDGER JOURNAL (append-only)
+# debit  = change in the bill's net total (Customer.total_amount)
+# credit = change in the bill's paid amount (Customer.paid_amount)
+class LedgerEntry(models.Model):
+    BILL = 'bill'
+    PAYMENT = 'payment'
+    RETURN = 'return'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (BILL, 'Bill posted'),
+        (PAYMENT, 'Payment'),
+        (RETURN, 'Return'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+    BILL_FIELDS = ('customer_id', 'total_amount', 'returned_amount', 'paid_amount')
+
+    customer = models.ForeignKey(Customer, null=True, blank=True, on_delete=models.SET_NULL, related_name='ledger_entries')
+    bill = models.ForeignKey(Bill, null=True, blank=True, on_delete=models.SET_NULL, related_name='ledger_entries')
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    date = models.DateField()   # business date the entry counts on
+    debit = PaiseField(default=Decimal('0.00'))
+    credit = PaiseField(default=Decimal('0.00'))
+    note = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['customer', 'date']),
+            models.Index(fields=['customer', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Ledger entries are append-only; post an adjustment instead.")
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def _amounts(values):
+        total = values['total_amount'] or ZERO
+        return max(total - (values['returned_amount'] or ZERO), ZERO), values['paid_amount'] or ZERO
+
+    @staticmethod
+    def business_date(value):
+        """Date a payment / return counts on; DateTimeFields and timezone.now defaults give datetimes."""
+        if value is None:
+            return timezone.localdate()
+        if isinstance(value, datetime):
+            return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+        return value
+
+    @classmethod
+    def record_bill_change(cls, bill, old, update_fields=None, on=None):
+        """Journal the difference between ``old`` column values and what ``bill`` just wrote."""
+        entries = cls.bill_change_entries(bill, old, update_fields, on)
+        if entries:
+            cls.objects.bulk_create(entries)
+
+    @classmethod
+    def bill_change_entries(cls, bill, old, update_fields=None, on=None):
+        """
+        Entries for one bill write. Payments and returns count on ``on`` (the
+        payment's or return's own date, today if not given).
+        """
+        new = {f: getattr(bill, f) for f in cls.BILL_FIELDS}
+        if old is not None and update_fields is not None:
+            # Columns outside update_fields were not written; the instance may be stale there
+            written = {('customer_id' if f == 'customer' else f) for f in update_fields}
+            new = {f: (new[f] if f in written else old[f]) for f in cls.BILL_FIELDS}
+        new_net, new_paid = cls._amounts(new)
+        today = timezone.localdate()
+        on = cls.business_date(on)
+        entries = []
+
+        if old is not None and old['customer_id'] != bill.customer_id:
+            # Bill moved between customers: take it off one ledger, put it on the other
+            old_net, old_paid = cls._amounts(old)
+            if old_net or old_paid:
+                entries.append(cls(customer_id=old['customer_id'], bill=bill, kind=cls.ADJUSTMENT, date=today,
+                                   debit=-old_net, credit=-old_paid, note=f"Bill #{bill.bill_no} moved out"))
+            if new_net or new_paid:
+                entries.append(cls(customer_id=bill.customer_id, bill=bill, kind=cls.ADJUSTMENT, date=today,
+                                   debit=new_net, credit=new_paid, note=f"Bill #{bill.bill_no} moved in"))
+        else:
+            old_net, old_paid = cls._amounts(old) if old else (ZERO, ZERO)
+            old_total = (old['total_amount'] or ZERO) if old else ZERO
+            if new_net != old_net:
+                if old and old['returned_amount'] != new['returned_amount'] and old['total_amount'] == new['total_amount']:
+                    kind, date = cls.RETURN, on
+                elif old_total == 0:
+                    kind, date = cls.BILL, bill.date
+                else:
+                    kind, date = cls.ADJUSTMENT, bill.date
+                entries.append(cls(customer_id=bill.customer_id, bill=bill, kind=kind, date=date,
+                                   debit=new_net - old_net, note=f"Bill #{bill.bill_no}"))
+            if new_paid != old_paid:
+                entries.append(cls(customer_id=bill.customer_id, bill=bill, kind=cls.PAYMENT, date=on,
+                                   credit=new_paid - old_paid, note=f"Bill #{bill.bill_no}"))
+        return entries
+
+    @classmethod
+    def reverse_bill(cls, bill):
+        """Take a bill that is about to be deleted off its customer's ledger."""
+        current = Bill.objects.filter(pk=bill.pk).values(*cls.BILL_FIELDS).first()
+        if current is None:
+            return
+        net, paid = cls._amounts(current)
+        if net or paid:
+            cls.objects.create(customer_id=current['customer_id'], bill=bill, kind=cls.ADJUSTMENT,
+                               date=timezone.localdate(), debit=-net, credit=-paid,
+                               note=f"Bill #{bill.bill_no} deleted")
+
+
+# 📸 PERIODIC BALANCE SNAPSHOT
+# Covers entries with date <= as_of AND id <= last_entry_id
+class LedgerSnapshot(models.Model):
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='ledger_snapshots')
+    as_of = models.DateField()
+    last_entry_id = models.BigIntegerField()
+    debit_total = PaiseField(default=Decimal('0.00'))
+    credit_total = PaiseField(default=Decimal('0.00'))
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-as_of', '-last_entry_id']
+        indexes = [models.Index(fields=['customer', 'as_of'])]
+
+
+# 🗄️ ARCHIVE (closed financial years, moved out by `manage.py close_year`)
+# Same columns and ids as the live tables; reports read them only when the
+# requested date range reaches back before the current financial year.
+class ArchivedBill(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    financial_year = models.CharField(max_length=9)   # e.g. 2025-26
+    customer = models.ForeignKey(Customer, null=True, blank=True, on_delete=models.SET_NULL, related_name='archived_bills')
+    customer_name = models.CharField(max_length=255, blank=True, null=True)
+    phone = models.CharField(max_length=20, blank=True, null=True)
+    date = models.DateField()
+    bill_no = models.IntegerField()
+    packing_qty = models.IntegerField(blank=True, null=True)
+    packing_rate = PaiseField(blank=True, null=True)
+    packing_reason = models.CharField(max_length=255, blank=True, null=True)
+    extra_reason = models.CharField(max_length=255, blank=True, null=True)
+    extra_amount = PaiseField(default=0)
+    carried_forward = models.BooleanField(default=False)
+    place_of_supply = models.CharField(max_length=2, blank=True, default='')
+    taxable_amount = PaiseField(default=0)
+    cgst_amount = PaiseField(default=0)
+    sgst_amount = PaiseField(default=0)
+    igst_amount = PaiseField(default=0)
+    total_amount = PaiseField(default=0)
+    paid_amount = PaiseField(default=0)
+    returned_amount = PaiseField(default=0)
+    is_paid = models.BooleanField(default=False)
+    paid_date = models.DateTimeField(null=True, blank=True)
+    paid_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+
+    class Meta:
+        ordering = ['-date', '-bill_no']
+        indexes = [models.Index(fields=['date'])]
+
+
+class ArchivedBillItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    bill = models.ForeignKey(ArchivedBill, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    description = models.TextField(blank=True)
+    quantity = models.PositiveIntegerField(default=1)
+    rate = PaiseField(default=Decimal('0.00'))
+    total = PaiseField(default=Decimal('0.00'))
+    hsn_code = models.CharField(max_length=8, blank=True, default='')
+    gst_rate = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('0.00'))
+    cgst = PaiseField(default=Decimal('0.00'))
+    sgst = PaiseField(default=Decimal('0.00'))
+    igst = PaiseField(default=Decimal('0.00'))
+
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    bill = models.ForeignKey(ArchivedBill, related_name='payments', on_delete=models.CASCADE)
+    amount = PaiseField()
+    date = models.DateField()
+    note = models.CharField(max_length=200, blank=True, null=True)
+
+
+class ArchivedBillReturn(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    bill = models.ForeignKey(ArchivedBill, related_name='returns', on_delete=models.CASCADE)
+    amount = PaiseField()
+    note = models.TextField(blank=True, null=True)
+    date = models.DateTimeField()
+
+
+# 🧬 CUSTOMER MERGE PROPOSAL (manage.py dedupe_customers, reviewed at /customers/dedupe/)
+# merge:  fold the ``sources`` customers into ``target``
+# relink: attach bills with no customer whose customer_name is in ``names`` to ``target``
+class MergeProposal(models.Model):
+    MERGE = 'merge'
+    RELINK = 'relink'
+    KIND_CHOICES = [(MERGE, 'Merge customers'), (RELINK, 'Relink bills')]
+
+    PENDING = 'pending'
+    APPLIED = 'applied'
+    REJECTED = 'rejected'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (APPLIED, 'Applied'), (REJECTED, 'Rejected')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    target = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='merge_proposals')
+    sources = models.JSONField(default=list, blank=True)   # customer ids
+    names = models.JSONField(default=list, blank=True)     # exact customer_name values of orphan bills
+    bills = models.PositiveIntegerField(default=0)         # bills that would move
+    score = models.FloatField()                            # name similarity, 0-1
+    reason = models.CharField(max_length=200)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    decided_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    decided_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-score', 'id']
+        indexes = [models.Index(fields=['status', 'score'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} → {self.target_id} ({self.score:.2f})"
+
+
+# 🏦 BANK / UPI STATEMENT RECONCILIATION (bills/reconcile.py, reviewed at /bank/)
+class BankStatement(models.Model):
+    file_name = models.CharField(max_length=255)
+    lines = models.PositiveIntegerField(default=0)       # credit lines imported
+    duplicates = models.PositiveIntegerField(default=0)  # lines already imported from an earlier file
+    matched = models.PositiveIntegerField(default=0)
+    posted = models.PositiveIntegerField(default=0)
+    imported_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.file_name} ({self.lines} lines)"
+
+
+# One credit of a statement. ``allocations`` = [[bill_id, paise], ...]: one
+# bill (one-to-one) or several oldest-first (one-to-many).
+class BankLine(models.Model):
+    UNMATCHED = 'unmatched'
+    PROPOSED = 'proposed'
+    POSTED = 'posted'
+    IGNORED = 'ignored'
+    STATUS_CHOICES = [(UNMATCHED, 'Unmatched'), (PROPOSED, 'Proposed'), (POSTED, 'Posted'), (IGNORED, 'Ignored')]
+
+    statement = models.ForeignKey(BankStatement, on_delete=models.CASCADE, related_name='bank_lines')
+    line_no = models.PositiveIntegerField()
+    date = models.DateField()
+    amount = PaiseField()
+    narration = models.CharField(max_length=300, blank=True, default='')
+    reference = models.CharField(max_length=100, blank=True, default='')   # UTR / cheque / UPI ref
+    digest = models.CharField(max_length=40, unique=True)                   # sha1 of date, amount, reference, narration
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UNMATCHED)
+    customer = models.ForeignKey(Customer, null=True, blank=True, on_delete=models.SET_NULL, related_name='bank_lines')
+    allocations = models.JSONField(default=list, blank=True)
+    score = models.FloatField(default=0)
+    reason = models.CharField(max_length=200, blank=True, default='')
+
+    class Meta:
+        ordering = ['statement', 'line_no']
+        indexes = [models.Index(fields=['statement', 'status'])]
+
+    def __str__(self):
+        return f"{self.date} ₹{self.amount} {self.reference or self.narration[:30]}"
+
+
+# ⏱️ REQUEST PROFILE (staff requests with ?_profile=1, see bills/profiling.py)
+class RequestProfile(models.Model):
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    interval_ms = models.FloatField()
+    samples = models.PositiveIntegerField(default=0)
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    summary = models.JSONField(default=dict)       # sample counts per category + top frames
+    folded = models.TextField(blank=True)          # collapsed stacks ("a;b;c 12" per line)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    @classmethod
+    def prune(cls, keep):
+        cutoff = cls.objects.order_by('-id').values_list('id', flat=True)[keep:keep + 1].first()
+        if cutoff is not None:
+            cls.objects.filter(id__lte=cutoff).delete()
+
+
+# 🔄 CHANGE FEED (offline POS sync, see bills/sync.py)
+# One row per write to a synced model; the id is the change sequence. On the
+# central server the newest id of a row is that row's version. Only kept
+# while sync is configured (SYNC_TOKEN or SYNC_TERMINAL_ID): a single-counter
+# install writes no feed, and sync.seed_feed() catches up when it is enabled.
+_changelog_paused = contextvars.ContextVar('changelog_paused', default=False)
+
+
+class ChangeLog(models.Model):
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    # Columns every copy derives for itself; writes touching only these are not changes
+    LOCAL_FIELDS = {
+        'customer': {'total_amount', 'paid_amount', 'remaining_amount', 'ledger_version', 'sync_version'},
+    }
+
+    model = models.CharField(max_length=20)          # model_name: customer, bill, billitem, payment, billreturn
+    sync_id = models.UUIDField()
+    op = models.CharField(max_length=6, default=UPSERT)
+    base_version = models.BigIntegerField(default=0)  # terminal: central version the change was made on
+    origin = models.CharField(max_length=30, blank=True, default='')   # terminal id ('' = central server)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['sync_id', 'id'])]
+
+    @classmethod
+    @contextmanager
+    def paused(cls):
+        """Writes inside are not changes of this copy (rows being pulled from the server)."""
+        token = _changelog_paused.set(True)
+        try:
+            yield
+        finally:
+            _changelog_paused.reset(token)
+
+    @staticmethod
+    def enabled():
+        return bool(settings.SYNC_TOKEN or settings.SYNC_TERMINAL_ID)
+
+    @classmethod
+    def record(cls, instance, op=UPSERT, update_fields=None):
+        name = instance._meta.model_name
+        if update_fields is not None and set(update_fields) <= cls.LOCAL_FIELDS.get(name, {'sync_version'}):
+            return
+        cls.record_many(type(instance), [instance.sync_id], op, base_versions=[instance.sync_version])
+
+    @classmethod
+    def record_many(cls, model, sync_ids, op=UPSERT, origin=None, base_versions=None):
+        if _changelog_paused.get() or not sync_ids or not cls.enabled():
+            return []
+        origin = settings.SYNC_TERMINAL_ID if origin is None else origin
+        base_versions = base_versions or [0] * len(sync_ids)
+        return cls.objects.bulk_create([
+            cls(model=model._meta.model_name, sync_id=sid, op=op, origin=origin, base_version=base)
+            for sid, base in zip(sync_ids, base_versions)
+        ])
+
+
+# 🔢 BILL NUMBER BLOCKS
+# The central server hands each POS terminal a range of bill numbers; the
+# terminal keeps its copy and numbers offline bills from it.
+class BillNumberBlock(models.Model):
+    terminal = models.CharField(max_length=30)
+    start = models.IntegerField()
+    end = models.IntegerField()
+    next_no = models.IntegerField()   # terminal side: next number to hand out
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['start']
+
+    def __str__(self):
+        return f"{self.terminal}: {self.start}–{self.end}"
+
+    @classmethod
+    def highest(cls):
+        return cls.objects.aggregate(n=models.Max('end'))['n'] or 0
+
+    @classmethod
+    def remaining(cls, terminal):
+        blocks = cls.objects.filter(terminal=terminal, next_no__lte=models.F('end'))
+        return sum(b.end - b.next_no + 1 for b in blocks)
+
+    @classmethod
+    def take(cls, terminal, consume=True):
+        with transaction.atomic():
+            block = (cls.objects.select_for_update()
+                     .filter(terminal=terminal, next_no__lte=models.F('end')).first())
+            if block is None:
+                raise ValueError("No reserved bill numbers left on this terminal; run `manage.py sync_terminal`.")
+            number = block.next_no
+            if consume:
+                block.next_no += 1
+                block.save(update_fields=['next_no'])
+        return number
+
+    @classmethod
+    def reserve(cls, terminal, size):
+        """Central server: the next ``size`` numbers after every bill and block so far."""
+        with transaction.atomic():
+            last = Bill.objects.aggregate(n=models.Max('bill_no'))['n'] or 0
+            start = max(last, cls.highest()) + 1
+            return cls.objects.create(terminal=terminal, start=start, end=start + size - 1, next_no=start)
+
+
+# 🔁 SYNC STATE (terminal side, one row per central server)
+class SyncState(models.Model):
+    server = models.CharField(max_length=200, unique=True)
+    pull_cursor = models.BigIntegerField(default=0)   # server ChangeLog id applied up to
+    push_cursor = models.BigIntegerField(default=0)   # local ChangeLog id sent up to
+    last_sync = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.server
+
+
+# ⚠️ SYNC CONFLICT: a terminal change the server did not apply (kept for review)
+class SyncConflict(models.Model):
+    terminal = models.CharField(max_length=30)
+    model = models.CharField(max_length=20)
+    sync_id = models.UUIDField()
+    op = models.CharField(max_length=6)
+    reason = models.CharField(max_length=100)
+    base_version = models.BigIntegerField(default=0)
+    server_version = models.BigIntegerField(default=0)
+    payload = models.JSONField(null=True, blank=True)
+    resolved = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.terminal} {self.model} {self.sync_id}: {self.reason}"
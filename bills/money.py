@@ -0,0 +1,63 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django import forms
+from django.core import exceptions
+from django.db import models
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+# ---------------------------------------
+# Money as integer paise
+#
+# Amount columns hold whole paise (BIGINT). SUM() and arithmetic in SQL,
+# the arrays analytics hands to NumPy and the verify_ledger recompute are
+# therefore plain integer arithmetic. Model attributes, lookups and ORM
+# aggregates still give and take Decimal rupees. Raw-row paths (fetch_raw)
+# see the integers and call rupees() only for output.
+# ---------------------------------------
+def to_paise(value):
+    """Rupees (Decimal, int, float or numeric string) -> whole paise, rounded half up."""
+    return int((Decimal(str(value)) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def rupees(paise):
+    """Whole paise -> Decimal rupees with two places."""
+    if isinstance(paise, int):
+        return Decimal(paise).scaleb(-2)    # already exactly two places
+    return Decimal(str(paise)).scaleb(-2).quantize(CENT)
+
+
+def parse_rupees(value, default=ZERO):
+    """An amount typed into a form or posted as JSON, rounded to the paisa; ``default`` if it is not one."""
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        return default
+    if not amount.is_finite():
+        return default
+    return amount.quantize(CENT, ROUND_HALF_UP)
+
+
+class PaiseField(models.BigIntegerField):
+    description = "Amount in rupees, stored as integer paise"
+    default_error_messages = {'invalid': "“%(value)s” value must be an amount in rupees."}
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else rupees(value)
+
+    def to_python(self, value):
+        if value is None:
+            return None
+        amount = parse_rupees(value, default=None)
+        if amount is None:
+            raise exceptions.ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+        return amount
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        return None if value is None else to_paise(value)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{'form_class': forms.DecimalField, 'decimal_places': 2, **kwargs})
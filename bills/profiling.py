@@ -0,0 +1,328 @@
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import AsyncToSync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+
+CATEGORIES = ('sql', 'orm', 'template', 'view', 'other')
+
+_STDLIB = sysconfig.get_paths()['stdlib']
+_ASYNC_TO_SYNC = AsyncToSync.__call__.__code__
+_IDLE_FILES = {'threading.py', 'queue.py', 'selectors.py'}
+_labels = {}
+
+_recent = deque()                 # start times of profiled requests in the last minute
+_recent_lock = threading.Lock()
+_running = threading.Semaphore(1)  # one profiled request at a time per process
+
+
+# ---------------------------------------
+# Stack sampling
+#
+# A sampler thread reads the request thread's stack every PROFILER_INTERVAL
+# seconds (sys._current_frames). Async views run on an event loop in a
+# thread started by async_to_sync; while the request thread waits on that
+# loop, the loop thread's stack is sampled instead, below the request's.
+# ---------------------------------------
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        for root in (str(settings.BASE_DIR), _STDLIB, *sys.path[::-1]):
+            if root and path.startswith(root):
+                path = os.path.relpath(path, root)
+                break
+        label = f"{code.co_qualname} ({path}:{code.co_firstlineno})".replace(';', ',')
+        _labels[code] = label
+    return label
+
+
+def _frames(frame):
+    """Frames outermost first."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _idle(frames):
+    return not frames or os.path.basename(frames[-1].f_code.co_filename) in _IDLE_FILES
+
+
+def category(frames):
+    """Innermost match wins: SQL execution, other ORM, templates, project code."""
+    for frame in reversed(frames):
+        path = frame.f_code.co_filename.replace('\\', '/')
+        if '/django/db/backends/' in path or '/sqlite3/' in path:
+            return 'sql'
+        if '/django/db/' in path:
+            return 'orm'
+        if '/django/template/' in path:
+            return 'template'
+        if path.startswith(str(settings.BASE_DIR)) and '/site-packages/' not in path:
+            return 'view'
+    return 'other'
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval, max_samples, root_code):
+        super().__init__(daemon=True, name='request-profiler')
+        self.thread_id, self.interval, self.max_samples = thread_id, interval, max_samples
+        self.root_code = root_code
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval) and self.samples < self.max_samples:
+            current = sys._current_frames()
+            frame = current.get(self.thread_id)
+            if frame is None:
+                continue
+            frames = self._trim(_frames(frame))
+            if _idle(frames):
+                frames = self._follow(frames, current) or frames
+            self.stacks[tuple(_label(f.f_code) for f in frames)] += 1
+            self.categories[category(frames)] += 1
+            self.samples += 1
+
+    def _trim(self, frames):
+        """Drop the server and middleware frames above the profiled call."""
+        for n, frame in enumerate(frames):
+            if frame.f_code is self.root_code:
+                return frames[n + 1:]
+        return frames
+
+    @staticmethod
+    def _follow(frames, current):
+        """The busy stack of the event-loop thread an async_to_sync call is waiting on."""
+        for n, frame in enumerate(frames):
+            if frame.f_code is _ASYNC_TO_SYNC:
+                executor = frame.f_locals.get('loop_executor')
+                for thread in list(getattr(executor, '_threads', ())):
+                    loop = current.get(thread.ident)
+                    if loop is None:
+                        continue
+                    inner = [f for f in _frames(loop) if not f.f_code.co_filename.startswith(_STDLIB)]
+                    if inner and not _idle(_frames(loop)):
+                        return frames[:n + 1] + inner
+        return None
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+# ---------------------------------------
+# Exact SQL time (execute_wrapper on every connection of the request thread)
+# ---------------------------------------
+class QueryTimer:
+    def __init__(self):
+        self.count, self.seconds = 0, 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - began
+
+
+# ---------------------------------------
+# Summary + collapsed stacks
+# ---------------------------------------
+def collapsed(stacks):
+    """Brendan Gregg's folded format: 'outer;inner;leaf count' per line."""
+    return "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common())
+
+
+def summarize(stacks, categories, top=20):
+    self_counts, total_counts = Counter(), Counter()
+    for stack, count in stacks.items():
+        if stack:
+            self_counts[stack[-1]] += count
+        for label in set(stack):
+            total_counts[label] += count
+    return {
+        'categories': {name: categories.get(name, 0) for name in CATEGORIES},
+        'top_self': self_counts.most_common(top),
+        'top_total': total_counts.most_common(top),
+    }
+
+
+def flame_boxes(folded, min_share=0.005):
+    """
+    Boxes of an icicle graph for ``folded`` text: dicts with depth, left and
+    width (percent of all samples) and the frame label. Narrow boxes are left out.
+    """
+    tree = {}
+    total = 0
+    for line in folded.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if not stack:
+            continue
+        count = int(count)
+        total += count
+        node = tree
+        for label in stack.split(';'):
+            entry = node.setdefault(label, [0, {}])
+            entry[0] += count
+            node = entry[1]
+
+    boxes = []
+
+    def walk(node, depth, left):
+        for label, (count, children) in sorted(node.items(), key=lambda item: -item[1][0]):
+            if count / total >= min_share:
+                boxes.append({'depth': depth, 'left': round(100 * left / total, 3),
+                              'width': round(100 * count / total, 3), 'label': label, 'samples': count})
+                walk(children, depth + 1, left)
+            left += count
+
+    if total:
+        walk(tree, 0, 0)
+    return boxes
+
+
+# ---------------------------------------
+# Middleware
+# ---------------------------------------
+def _allowed():
+    """PROFILER_MAX_PER_MINUTE per process, one at a time."""
+    now = time.monotonic()
+    with _recent_lock:
+        while _recent and now - _recent[0] > 60:
+            _recent.popleft()
+        if len(_recent) >= settings.PROFILER_MAX_PER_MINUTE:
+            return False
+        if not _running.acquire(blocking=False):
+            return False
+        _recent.append(now)
+        return True
+
+
+def _asked(request):
+    return request.GET.get(PROFILE_PARAM) == '1' or request.headers.get(PROFILE_HEADER) == '1'
+
+
+def wants_profile(request, user=None):
+    user = user if user is not None else getattr(request, 'user', None)
+    return _asked(request) and settings.PROFILER_ENABLED and user is not None and user.is_staff
+
+
+class ProfilerMiddleware:
+    """
+    Staff requests with ?_profile=1 (or an ``X-Profile: 1`` header) run under
+    the stack sampler; the profile is saved as a RequestProfile and its id
+    returned in the X-Profile-Id header. Over the rate limit the request runs
+    normally with ``X-Profile: skipped``.
+
+    Works sync and async, so async views under ASGI are not pushed through
+    thread adapters for everyone else. In async mode the event-loop thread is
+    sampled; ORM calls made through sync_to_async show as loop idle time.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not wants_profile(request):
+            return self.get_response(request)
+        if not _allowed():
+            response = self.get_response(request)
+            response[PROFILE_HEADER] = 'skipped (rate limit)'
+            return response
+        try:
+            return self.profile(request)
+        finally:
+            _running.release()
+
+    async def __acall__(self, request):
+        # Only an explicit request pays for loading the user outside the view
+        if not (_asked(request) and wants_profile(request, await request.auser())):
+            return await self.get_response(request)
+        if not _allowed():
+            response = await self.get_response(request)
+            response[PROFILE_HEADER] = 'skipped (rate limit)'
+            return response
+        try:
+            return await self.aprofile(request)
+        finally:
+            _running.release()
+
+    @staticmethod
+    def _sampler(root_code):
+        interval = max(settings.PROFILER_INTERVAL, 0.001)
+        return Sampler(threading.get_ident(), interval, int(settings.PROFILER_MAX_SECONDS / interval), root_code)
+
+    @staticmethod
+    def _timed_queries():
+        """A QueryTimer on this thread's connections; closing the stack removes it."""
+        timer, stack = QueryTimer(), ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+        return timer, stack
+
+    def profile(self, request):
+        sampler = self._sampler(self.profile.__code__)
+        timer, stack = self._timed_queries()
+        began = time.perf_counter()
+        with stack:
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+        return self.save(request, request.user, response, sampler, timer, time.perf_counter() - began)
+
+    async def aprofile(self, request):
+        sampler = self._sampler(self.aprofile.__code__)
+        # Connections are per thread: time the queries where sync_to_async runs them
+        timer, stack = await sync_to_async(self._timed_queries)()
+        began = time.perf_counter()
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+            await sync_to_async(stack.close)()
+        duration = time.perf_counter() - began
+        return await sync_to_async(self.save)(request, await request.auser(), response, sampler, timer, duration)
+
+    @staticmethod
+    def save(request, user, response, sampler, timer, duration):
+        from .models import RequestProfile
+
+        profile = RequestProfile.objects.create(
+            method=request.method, path=request.get_full_path()[:500], user=user,
+            status=response.status_code, duration_ms=round(duration * 1000, 1),
+            interval_ms=round(sampler.interval * 1000, 2), samples=sampler.samples,
+            sql_count=timer.count, sql_ms=round(timer.seconds * 1000, 1),
+            summary=summarize(sampler.stacks, sampler.categories), folded=collapsed(sampler.stacks),
+        )
+        RequestProfile.prune(settings.PROFILER_KEEP)
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
@@ -0,0 +1,37 @@
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import render_to_string
+
+
+class TemplateQueryError(AssertionError):
+    """A template hit the database while rendering (an unprefetched relation)."""
+
+
+# ---------------------------------------
+# Template query guard
+#
+# Row partials are rendered from data the view already loaded. With
+# TEMPLATE_QUERY_GUARD on (DEBUG, tests) any query issued while such a
+# template renders raises instead of quietly becoming an N+1.
+# ---------------------------------------
+@contextmanager
+def no_queries(label):
+    if not settings.TEMPLATE_QUERY_GUARD:
+        yield
+        return
+
+    def blocker(execute, sql, params, many, context):
+        raise TemplateQueryError(f"{label} ran a query while rendering: {sql[:200]}")
+
+    with ExitStack() as stack:
+        for conn in connections.all(initialized_only=True):
+            stack.enter_context(conn.execute_wrapper(blocker))
+        yield
+
+
+def render_prefetched(template_name, context):
+    """render_to_string() for templates that must not trigger lazy queries."""
+    with no_queries(template_name):
+        return render_to_string(template_name, context)
@@ -0,0 +1,129 @@
+import os
+import textwrap
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import get_or_build, make_key
+from .money import ZERO
+
+# ESC/POS commands understood by practically every thermal receipt printer
+ESC, GS = b'\x1b', b'\x1d'
+INIT = ESC + b'@'
+ALIGN = {'left': ESC + b'a\x00', 'center': ESC + b'a\x01', 'right': ESC + b'a\x02'}
+BOLD_ON, BOLD_OFF = ESC + b'E\x01', ESC + b'E\x00'
+DOUBLE, NORMAL = GS + b'!\x11', GS + b'!\x00'   # double width + height
+CUT = GS + b'V\x42\x03'                          # feed 3 lines, partial cut
+
+TITLES = ('ESTIMATE', 'CUSTOMER COPY')
+
+
+# ---------------------------------------
+# Receipt bytes from the stored bill
+#
+# The amounts come straight from the bill's columns (Bill.update_total keeps
+# them) and its item rows; nothing is laid out by HTML/CSS. The bytes are
+# cached under the customer's ledger_version, which every bill, item,
+# payment and return write bumps, so a reprint costs one cache read.
+# ---------------------------------------
+def _money(value):
+    return f"{value or ZERO:.2f}"
+
+
+def _row(left, right, width):
+    left = left[:max(width - len(right) - 1, 0)]
+    return left + ' ' * (width - len(left) - len(right)) + right
+
+
+def _lines(bill, items, width):
+    """(style, text) pairs of one copy; style is a set of 'bold', 'double', 'center', 'title'."""
+    rule = '-' * width
+    out = [({'center', 'bold', 'title'}, ''),
+           (set(), _row(bill.customer_name or '', f"No: {bill.bill_no}", width)),
+           (set(), _row(bill.phone or '', f"Date: {bill.date:%d-%m-%Y}", width)),
+           (set(), rule)]
+    for description, quantity, rate, total in items:
+        for part in textwrap.wrap(description or '-', width) or ['-']:
+            out.append((set(), part))
+        out.append((set(), _row(f"  {quantity} x {_money(rate)}", _money(total), width)))
+    out.append((set(), rule))
+
+    totals = [('Subtotal', bill.taxable_amount)]
+    totals += [(label, amount) for label, amount in (
+        ('CGST', bill.cgst_amount), ('SGST', bill.sgst_amount), ('IGST', bill.igst_amount),
+    ) if amount]
+    if bill.packing_qty and bill.packing_rate:
+        totals.append((f"{bill.packing_reason or 'Packing'} ({bill.packing_qty} x {_money(bill.packing_rate)})",
+                       bill.packing_qty * bill.packing_rate))
+    if bill.extra_amount:
+        totals.append((bill.extra_reason or 'Extra Charges', bill.extra_amount))
+    out += [(set(), _row(label, _money(amount), width)) for label, amount in totals]
+    out.append(({'bold', 'double'}, _row('TOTAL', _money(bill.total_amount), width // 2)))
+    if bill.returned_amount:
+        out.append((set(), _row('Returned', _money(bill.returned_amount), width)))
+    if bill.paid_amount:
+        out.append((set(), _row('Paid', _money(bill.paid_amount), width)))
+    out.append(({'bold'}, _row('Balance', _money(bill.remaining), width)))
+    return out
+
+
+def build_receipt(bill, items, columns=None, copies=None, encoding=None):
+    """ESC/POS bytes for ``bill``; ``items`` = (description, quantity, rate, total) rows."""
+    columns = columns or settings.RECEIPT_COLUMNS
+    copies = copies or settings.RECEIPT_COPIES
+    encoding = encoding or settings.RECEIPT_ENCODING
+    lines = _lines(bill, items, columns)
+
+    out = bytearray(INIT)
+    for n in range(copies):
+        title = TITLES[min(n, len(TITLES) - 1)]
+        for style, text in lines:
+            out += ALIGN['center' if 'center' in style else 'left']
+            out += BOLD_ON if 'bold' in style else b''
+            out += DOUBLE if 'double' in style else b''
+            out += (title if 'title' in style else text).encode(encoding, 'replace') + b'\n'
+            out += NORMAL if 'double' in style else b''
+            out += BOLD_OFF if 'bold' in style else b''
+        out += CUT
+    return bytes(out)
+
+
+def receipt_items(bill):
+    return list(bill.items.order_by('id').values_list('description', 'quantity', 'rate', 'total'))
+
+
+def receipt_bytes(bill):
+    """(bytes, cached) for ``bill``; bills without a customer have no version and are built every time."""
+    build = lambda: build_receipt(bill, receipt_items(bill))
+    if not bill.customer_id:
+        return build(), False
+    key = make_key('receipt', bill.id, bill.customer.ledger_version,
+                   settings.RECEIPT_COLUMNS, settings.RECEIPT_COPIES, settings.RECEIPT_ENCODING)
+    return get_or_build('receipt', key, build)
+
+
+# ---------------------------------------
+# Output: device, file or spool directory
+# ---------------------------------------
+def send(data, printer=None):
+    """
+    Write ``data`` to ``printer`` (default RECEIPT_PRINTER). A directory is a
+    spool: each receipt becomes its own file, renamed into place when complete
+    so a print daemon never picks up half of one. Anything else (a device such
+    as /dev/usb/lp0, or a plain file) is opened for append. Returns the path.
+    """
+    target = printer or settings.RECEIPT_PRINTER
+    if not target:
+        raise ValueError("No receipt printer configured (RECEIPT_PRINTER).")
+    target = Path(target)
+    if target.is_dir():
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.bin"
+        partial = target / f".{name}.part"
+        partial.write_bytes(data)
+        os.replace(partial, target / name)
+        return target / name
+    with open(target, 'ab') as fh:
+        fh.write(data)
+    return target
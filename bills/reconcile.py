@@ -0,0 +1,320 @@
+import codecs
+import csv
+import hashlib
+import re
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .dedupe import normalize_phone
+from .integrity import refresh_customer_totals, update_rows
+from .models import BankLine, BankStatement, Bill, ChangeLog, Customer, LedgerEntry, Payment
+from .money import ZERO, parse_rupees, rupees, to_paise
+from .reports import fetch_raw, paise
+
+BATCH = 2000
+
+# Header spellings seen in bank / UPI exports (lower case, dots and extra spaces removed)
+HEADERS = {
+    'date': ('date', 'txn date', 'transaction date', 'value date', 'tran date', 'posting date'),
+    'credit': ('credit', 'credit amount', 'deposit', 'deposits', 'deposit amt', 'cr amount', 'amount'),
+    'type': ('type', 'cr/dr', 'dr/cr', 'transaction type'),
+    'narration': ('narration', 'description', 'particulars', 'remarks', 'details', 'transaction details'),
+    'reference': ('reference', 'ref no', 'chq/ref no', 'chq / ref no', 'utr', 'utr no', 'transaction id',
+                  'upi ref no', 'reference no'),
+}
+DATE_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d', '%d/%m/%y', '%d-%m-%y', '%d-%b-%Y', '%d %b %Y', '%d-%b-%y')
+
+PHONE_RE = re.compile(r'(?<!\d)(?:91)?([6-9]\d{9})(?!\d)')
+BILL_NO_RE = re.compile(r'\b(?:bill|inv|invoice)\s*(?:no)?\s*[.#:/-]*\s*(\d{1,9})\b', re.IGNORECASE)
+
+
+# ---------------------------------------
+# Import: stream the file, keep the credits
+#
+# Rows are read one at a time (csv over the upload's lines) and written in
+# batches of BATCH. Each line is keyed by a digest of its content, so an
+# overlapping or repeated export does not import the same credit twice.
+# ---------------------------------------
+def _header(row):
+    names = [' '.join(cell.lower().replace('.', ' ').split()) for cell in row]
+    found = {key: next((names.index(a) for a in aliases if a in names), None) for key, aliases in HEADERS.items()}
+    return found if found['date'] is not None and found['credit'] is not None else None
+
+
+def _parse_date(text, formats):
+    """``formats`` is reordered so the one that matched is tried first on the next row."""
+    text = text.strip()
+    for n, fmt in enumerate(formats):
+        try:
+            parsed = datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+        if n:
+            formats.insert(0, formats.pop(n))
+        return parsed
+    return None
+
+
+def read_credits(lines):
+    """(line_no, date, paise, narration, reference) for every credit row of a CSV export."""
+    columns, formats = None, list(DATE_FORMATS)
+    for line_no, row in enumerate(csv.reader(lines), start=1):
+        if columns is None:
+            columns = _header(row)     # bank exports put account details above the table
+            continue
+
+        def cell(key):
+            n = columns[key]
+            return row[n].strip() if n is not None and n < len(row) else ''
+
+        if columns['type'] is not None and not cell('type').lower().startswith('c'):
+            continue
+        amount = parse_rupees(cell('credit').replace(',', ''), default=None)
+        day = _parse_date(cell('date'), formats)
+        if amount is None or amount <= 0 or day is None:
+            continue
+        yield line_no, day, to_paise(amount), cell('narration')[:300], cell('reference')[:100]
+
+
+def import_statement(lines, file_name, user=None):
+    """Import the credits of ``lines`` (an iterable of text or bytes lines) into a new BankStatement."""
+    lines = iter(lines)
+    first = next(lines, '')
+    if isinstance(first, bytes):
+        lines = codecs.iterdecode(_chain(first, lines), 'utf-8-sig')
+    else:
+        lines = _chain(first.lstrip('\ufeff'), lines)
+
+    statement = BankStatement.objects.create(file_name=file_name[:255],
+                                             imported_by=user if user is not None and user.is_authenticated else None)
+    seen = Counter()
+    batch = []
+
+    def flush():
+        existing = set(BankLine.objects.filter(digest__in=[l.digest for l in batch]).values_list('digest', flat=True))
+        fresh = [l for l in batch if l.digest not in existing]
+        BankLine.objects.bulk_create(fresh, batch_size=500)
+        statement.lines += len(fresh)
+        statement.duplicates += len(batch) - len(fresh)
+        batch.clear()
+
+    for line_no, day, amount, narration, reference in read_credits(lines):
+        key = f"{day}|{amount}|{reference}|{narration}"
+        seen[key] += 1   # two identical credits on one day are still two
+        batch.append(BankLine(statement=statement, line_no=line_no, date=day, amount=rupees(amount),
+                              narration=narration, reference=reference,
+                              digest=hashlib.sha1(f"{key}|{seen[key]}".encode()).hexdigest()))
+        if len(batch) >= BATCH:
+            flush()
+    if batch:
+        flush()
+    statement.save(update_fields=['lines', 'duplicates'])
+    return statement
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+# ---------------------------------------
+# Matching: hash indexes over the open bills
+#
+#   bill no in the narration  -> that bill (one-to-one, part payment)
+#   phone in the narration    -> the customer's open bills, oldest first:
+#                                one bill of exactly this amount, else the
+#                                oldest bills the amount pays off (one-to-many)
+#   amount alone              -> the one open bill of exactly this amount
+#                                dated within BANK_MATCH_WINDOW_DAYS before
+#
+# Explicit references are matched first over the whole statement, so an
+# amount-only guess never takes a bill another line names.
+# ---------------------------------------
+class OpenBill:
+    __slots__ = ('id', 'customer_id', 'bill_no', 'date', 'due')
+
+    def __init__(self, id, customer_id, bill_no, day, due):
+        self.id, self.customer_id, self.bill_no, self.due = id, customer_id, bill_no, due
+        self.date = day if isinstance(day, date) else date.fromisoformat(str(day)[:10])
+
+
+class Index:
+    def __init__(self):
+        due = Greatest(paise('total_amount') - paise('returned_amount'), Value(0)) - paise('paid_amount')
+        rows = fetch_raw(Bill.objects.filter(is_paid=False).annotate(due=due).filter(due__gt=0)
+                         .order_by('date', 'id').values_list('id', 'customer_id', 'bill_no', 'date', 'due', 'phone'))
+        self.by_amount = defaultdict(list)     # due paise -> bills, oldest first
+        self.by_customer = defaultdict(list)   # customer id -> bills, oldest first
+        self.by_no = defaultdict(list)         # bill no -> bills
+        self.by_phone = {}                     # normalised phone -> customer id
+        for bill_id, customer_id, bill_no, day, due, phone in rows:
+            bill = OpenBill(bill_id, customer_id, bill_no, day, due)
+            self.by_amount[due].append(bill)
+            self.by_no[bill_no].append(bill)
+            if customer_id:
+                self.by_customer[customer_id].append(bill)
+                if normalize_phone(phone):
+                    self.by_phone.setdefault(normalize_phone(phone), customer_id)
+        for customer_id, phone in Customer.objects.exclude(phone='').exclude(phone__isnull=True).values_list('id', 'phone'):
+            if normalize_phone(phone):
+                self.by_phone[normalize_phone(phone)] = customer_id   # the customer's own number wins
+        self.bills = len(rows)
+
+    def customer_bills(self, customer_id):
+        return [b for b in self.by_customer.get(customer_id, ()) if b.due > 0]
+
+
+def _by_reference(index, line, amount):
+    """(customer_id, [(bill, paise)], score, reason) from bill numbers or a phone in the line, or None."""
+    text = f"{line.narration} {line.reference}"
+    numbers = [int(n) for n in BILL_NO_RE.findall(text)]
+    named = [b for n in numbers for b in index.by_no.get(n, ()) if b.due > 0]
+    if named:
+        if len(named) == 1 and named[0].due == amount:
+            return named[0].customer_id, [(named[0], amount)], 1.0, f"bill #{named[0].bill_no}"
+        if len(named) > 1 and sum(b.due for b in named) == amount:
+            return named[0].customer_id, [(b, b.due) for b in named], 0.95, f"bills #{', #'.join(str(n) for n in numbers)}"
+        if len(named) == 1 and amount < named[0].due:
+            return named[0].customer_id, [(named[0], amount)], 0.8, f"bill #{named[0].bill_no}, part payment"
+
+    for phone in PHONE_RE.findall(text):
+        customer_id = index.by_phone.get(phone)
+        if customer_id is None:
+            continue
+        bills = index.customer_bills(customer_id)
+        exact = [b for b in bills if b.due == amount and b.date <= line.date]
+        if exact:
+            return customer_id, [(exact[-1], amount)], 0.95, f"phone {phone}, amount"
+        allocations, left = [], amount
+        for bill in bills:
+            if left <= 0:
+                break
+            take = min(left, bill.due)
+            allocations.append((bill, take))
+            left -= take
+        if not allocations:
+            return customer_id, [], 0.3, f"phone {phone}, nothing due"
+        if left == 0 and allocations[-1][1] == allocations[-1][0].due:
+            return customer_id, allocations, 0.9, f"phone {phone}, {len(allocations)} oldest bill(s)"
+        note = f", ₹{rupees(left)} unallocated" if left > 0 else ", last one part paid"
+        return customer_id, allocations, 0.6, f"phone {phone}, oldest first{note}"
+    return None
+
+
+def _by_amount(index, line, amount, window):
+    candidates = [b for b in index.by_amount.get(amount, ())
+                  if b.due == amount and line.date - window <= b.date <= line.date]
+    if not candidates:
+        return None
+    if len({b.customer_id for b in candidates}) > 1:
+        return None, [], 0.0, f"{len(candidates)} open bills of this amount"
+    return candidates[0].customer_id, [(candidates[0], amount)], 0.7 if len(candidates) == 1 else 0.6, "amount and date"
+
+
+def match_statement(statement, log=lambda msg: None):
+    """Propose allocations for every line of ``statement`` not yet posted or ignored; returns counts."""
+    index = Index()
+    window = timedelta(days=settings.BANK_MATCH_WINDOW_DAYS)
+    lines = list(statement.bank_lines.filter(status__in=[BankLine.UNMATCHED, BankLine.PROPOSED])
+                 .order_by('date', 'line_no').values_list('id', 'date', 'amount', 'narration', 'reference', named=True))
+    log(f"{len(lines)} line(s) against {index.bills} open bill(s)")
+
+    results = {}
+    for finder in (_by_reference, lambda idx, line, amount: _by_amount(idx, line, amount, window)):
+        for line in lines:
+            if line.id in results and results[line.id][1]:
+                continue
+            found = finder(index, line, to_paise(line.amount))
+            if found is None:
+                continue
+            for bill, take in found[1]:
+                bill.due -= take
+            results[line.id] = found
+
+    rows = []
+    for line in lines:
+        customer_id, allocations, score, reason = results.get(line.id, (None, [], 0.0, ''))
+        status = BankLine.PROPOSED if allocations else BankLine.UNMATCHED
+        rows.append((status, customer_id, [[bill.id, take] for bill, take in allocations], score, reason[:200], line.id))
+    with transaction.atomic():
+        update_rows(BankLine, ('status', 'customer', 'allocations', 'score', 'reason'), rows)
+        statement.matched = statement.bank_lines.filter(status=BankLine.PROPOSED).count()
+        statement.save(update_fields=['matched'])
+    log(f"{statement.matched} line(s) matched")
+    return {'lines': len(lines), 'matched': statement.matched}
+
+
+# ---------------------------------------
+# Posting accepted lines as payments
+#
+# Like bulk.mark_paid: the bills are read once, payments and journal rows
+# are bulk-inserted, bill columns written with one executemany, and each
+# customer's totals recomputed once. An allocation is capped at what the
+# bill still owes now, in case it was paid by hand since the match.
+# ---------------------------------------
+def post_lines(lines, log=lambda msg: None):
+    lines = [l for l in lines if l.status == BankLine.PROPOSED and l.allocations]
+    bill_ids = {bill_id for line in lines for bill_id, _ in line.allocations}
+    now = timezone.now()
+
+    with transaction.atomic():
+        bills = {}
+        fields = ('id', 'bill_no', 'sync_id', 'is_paid', 'paid_date', *LedgerEntry.BILL_FIELDS)
+        ids = sorted(bill_ids)
+        for start in range(0, len(ids), 900):
+            for row in Bill.objects.select_for_update().filter(id__in=ids[start:start + 900]).values(*fields):
+                net, paid = LedgerEntry._amounts(row)
+                row['net'], row['paid'] = to_paise(net), to_paise(paid)
+                bills[row['id']] = row
+
+        payments, entries, posted, stale = [], [], [], []
+        for line in lines:
+            made = len(payments)
+            reference = f"Bank {line.date:%d-%m-%Y} {line.reference or line.narration}"[:200]
+            for bill_id, take in line.allocations:
+                row = bills.get(bill_id)
+                take = min(take, row['net'] - row['paid']) if row else 0
+                if take <= 0:
+                    continue
+                row['paid'] += take
+                payments.append(Payment(bill_id=bill_id, amount=rupees(take), date=line.date, note=reference))
+                entries.append(LedgerEntry(customer_id=row['customer_id'], bill_id=bill_id, kind=LedgerEntry.PAYMENT,
+                                           date=line.date, credit=rupees(take), note=f"Bill #{row['bill_no']} (bank)"))
+            (posted if len(payments) > made else stale).append(line.id)
+
+        Payment.objects.bulk_create(payments, batch_size=1000)
+        LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+        touched = [row for row in bills.values() if to_paise(row['paid_amount'] or 0) != row['paid']]
+        update_rows(Bill, ('paid_amount', 'is_paid', 'paid_date'), [
+            (rupees(row['paid']), row['paid'] >= row['net'] > 0,
+             row['paid_date'] or now if row['paid'] >= row['net'] > 0 else None, row['id'])
+            for row in touched
+        ])
+        ChangeLog.record_many(Payment, [p.sync_id for p in payments])
+        ChangeLog.record_many(Bill, [row['sync_id'] for row in touched])
+
+        customers = sorted({row['customer_id'] for row in touched if row['customer_id']})
+        for start in range(0, len(customers), 900):
+            refresh_customer_totals(customers[start:start + 900])
+            Customer.bump_ledger_version(*customers[start:start + 900])
+        for start in range(0, len(posted), 900):
+            BankLine.objects.filter(id__in=posted[start:start + 900]).update(status=BankLine.POSTED)
+        for start in range(0, len(stale), 900):
+            BankLine.objects.filter(id__in=stale[start:start + 900]).update(
+                status=BankLine.UNMATCHED, allocations=[], reason="bills paid since the match")
+        for statement_id in {line.statement_id for line in lines}:
+            BankStatement.objects.filter(id=statement_id).update(
+                posted=BankLine.objects.filter(statement_id=statement_id, status=BankLine.POSTED).count(),
+                matched=BankLine.objects.filter(statement_id=statement_id, status=BankLine.PROPOSED).count(),
+            )
+
+    report = {'lines': len(posted), 'payments': len(payments), 'amount': str(sum((p.amount for p in payments), ZERO)),
+              'bills': len(touched), 'customers': len(customers), 'stale': len(stale)}
+    log(f"Posted {report['payments']} payment(s) from {report['lines']} line(s)")
+    return report
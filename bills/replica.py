@@ -0,0 +1,214 @@
+import contextvars
+import os
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+
+SESSION_KEY = 'replica_writes'      # {customer name (lowercase): epoch seconds of the last write}
+
+_read_alias = contextvars.ContextVar('replica_read_alias', default=None)
+_written = contextvars.ContextVar('replica_written', default=None)
+_freshness = (float('-inf'), None)  # (monotonic time checked, value)
+
+
+def replica_configured():
+    return settings.REPLICA_ALIAS in settings.DATABASES
+
+
+# ---------------------------------------
+# Router
+#
+# Reads go to the replica only inside a view wrapped with
+# @reads_from_replica (and only when it is fresh enough for this session);
+# every other read and all writes use the primary.
+# ---------------------------------------
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, never migrated on its own
+        return False if db == settings.REPLICA_ALIAS else None
+
+
+# ---------------------------------------
+# Replication lag
+# ---------------------------------------
+def _read_freshness():
+    """Epoch seconds up to which the replica has the primary's writes (None = unusable)."""
+    conn = connections[settings.REPLICA_ALIAS]
+    if conn.vendor == 'sqlite':
+        # refresh_replica stamps the file with the time its copy started
+        path = conn.settings_dict['NAME']
+        return os.path.getmtime(path) if os.path.exists(path) else None
+    if conn.vendor == 'postgresql':
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT extract(epoch FROM CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+                "THEN now() ELSE pg_last_xact_replay_timestamp() END)"
+            )
+            value = cursor.fetchone()[0]
+        return float(value) if value is not None else None
+    # Other engines: assume a fixed lag
+    return time.time() - settings.REPLICA_ASSUMED_LAG
+
+
+def replica_freshness():
+    global _freshness
+    now = time.monotonic()
+    if now - _freshness[0] >= settings.REPLICA_FRESHNESS_TTL:
+        try:
+            value = _read_freshness()
+        except Exception:
+            value = None
+        _freshness = (now, value)
+    return _freshness[1]
+
+
+def refresh_sqlite_replica():
+    """Copy the primary over the SQLite replica file; returns seconds taken."""
+    from .backup import database_path, online_copy
+
+    replica = settings.DATABASES[settings.REPLICA_ALIAS]
+    if 'sqlite3' not in replica['ENGINE']:
+        raise ImproperlyConfigured("The replica is not a SQLite snapshot; the database server keeps it in sync.")
+
+    target = str(replica['NAME'])
+    part = target + '.part'
+    started = time.time()
+    online_copy(str(database_path()), part)
+    # The snapshot holds every write committed before the copy started
+    os.utime(part, (started, started))
+    os.replace(part, target)
+    return time.time() - started
+
+
+def choose_alias(request, scope=''):
+    """
+    The replica alias, or None (primary) when there is no usable replica or
+    this session wrote a matching customer after the replica's freshness
+    point. ``scope`` is the customer-name filter of the report ('' = all).
+    """
+    if not replica_configured():
+        return None
+    fresh = replica_freshness()
+    if fresh is None or time.time() - fresh > settings.REPLICA_MAX_STALENESS:
+        return None
+    scope = (scope or '').lower()
+    session = getattr(request, 'session', None)
+    for name, written_at in (session.get(SESSION_KEY, {}) if session is not None else {}).items():
+        if written_at >= fresh and scope in name:
+            return None
+    return settings.REPLICA_ALIAS
+
+
+def reads_from_replica(scope=None):
+    """
+    View decorator: run the view's reads on the replica when it is usable.
+    ``scope(request)`` returns the customer-name filter the report covers.
+    Put it below @login_required so the user is loaded from the primary.
+    """
+    def decorate(view):
+        def pick(request):
+            return choose_alias(request, scope(request) if scope else '')
+
+        def finish(response, alias):
+            response['X-Read-Alias'] = alias or 'default'
+            return response
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                alias = await sync_to_async(pick)(request)
+                token = _read_alias.set(alias)
+                try:
+                    return finish(await view(request, *args, **kwargs), alias)
+                finally:
+                    _read_alias.reset(token)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                alias = pick(request)
+                token = _read_alias.set(alias)
+                try:
+                    return finish(view(request, *args, **kwargs), alias)
+                finally:
+                    _read_alias.reset(token)
+        return wrapper
+    return decorate
+
+
+# ---------------------------------------
+# Recent writes per session
+# ---------------------------------------
+def note_writes(*customer_ids):
+    """Called on customer/ledger writes; remembered for the current request only."""
+    written = _written.get()
+    if written is not None:
+        written.update(cid for cid in customer_ids if cid)
+
+
+class RecentWritesMiddleware:
+    """
+    Store the names of customers written by a request in its session.
+
+    Sync and async: sync_to_async copies the context, so writes made by ORM
+    calls inside an async view land in the same set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        written = set()
+        token = _written.set(written)
+        try:
+            response = self.get_response(request)
+        finally:
+            _written.reset(token)
+        if written and hasattr(request, 'session'):
+            self.remember(request.session, written)
+        return response
+
+    async def __acall__(self, request):
+        written = set()
+        token = _written.set(written)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _written.reset(token)
+        if written and hasattr(request, 'session'):
+            await sync_to_async(self.remember)(request.session, written)
+        return response
+
+    @staticmethod
+    def remember(session, customer_ids):
+        from .models import Customer
+
+        now = time.time()
+        recent = {
+            name: at for name, at in session.get(SESSION_KEY, {}).items()
+            if now - at < settings.REPLICA_MAX_STALENESS
+        }
+        for name in Customer.objects.using('default').filter(id__in=customer_ids).values_list('name', flat=True):
+            recent[name.lower()] = now
+        session[SESSION_KEY] = recent
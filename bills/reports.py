@@ -0,0 +1,411 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import connections
+from django.db.models import BigIntegerField, Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Abs, Cast, Coalesce, Greatest, Round, TruncMonth
+
+from .models import (
+    ArchivedBill, ArchivedBillReturn, ArchivedPayment, Bill, BillItem, BillReturn, Customer, Payment,
+)
+from .money import ZERO, PaiseField
+
+MONEY = PaiseField()
+
+
+# ---------------------------------------
+# Query helpers shared by views and jobs
+# ---------------------------------------
+def bill_sum(model, **filters):
+    """Per-bill SUM(amount) of a child table as a correlated subquery."""
+    rows = (model.objects.filter(bill=OuterRef('pk'), **filters)
+            .order_by().values('bill').annotate(s=Sum('amount')).values('s'))
+    return Coalesce(Subquery(rows, output_field=MONEY), Value(0), output_field=MONEY)
+
+
+class paise(F):
+    """
+    A column as integer paise: money columns as stored, other decimals (GST
+    rates) multiplied out and rounded by the database.
+    """
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None, summarize=False, for_save=False):
+        column = super().resolve_expression(query, allow_joins, reuse, summarize, for_save)
+        if isinstance(column.output_field, PaiseField):
+            value = ExpressionWrapper(column, output_field=BigIntegerField())
+        else:
+            value = Cast(Round(column * 100), BigIntegerField())
+        return value.resolve_expression(query, allow_joins, reuse, summarize, for_save)
+
+
+def fetch_raw(qs):
+    """Raw rows of a values_list() query, skipping Django's per-value converters."""
+    sql, params = qs.query.sql_with_params()
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def ledger_models(archived=False):
+    """(bill, payment, return) models for the live tables or the closed-year archive."""
+    if archived:
+        return ArchivedBill, ArchivedPayment, ArchivedBillReturn
+    return Bill, Payment, BillReturn
+
+
+def without_carried(qs, date_from=''):
+    """
+    Drop the opening-balance bills whose archived bills the range already
+    covers: one dated D stands in for the bills before D, so it is only kept
+    when the range starts on or after D.
+    """
+    if not date_from:
+        return qs.exclude(carried_forward=True)
+    return qs.exclude(carried_forward=True, date__gt=date_from)
+
+
+def statement_queryset(customer_name='', date_from='', date_to='', archived=False):
+    bill_model, payment_model, _ = ledger_models(archived)
+    qs = bill_model.objects.all()
+
+    if customer_name:
+        qs = qs.filter(customer_name__icontains=customer_name)
+
+    qs = without_carried(qs, date_from)
+
+    if date_from:
+        qs = qs.filter(date__gte=date_from)
+
+    if date_to:
+        qs = qs.filter(date__lte=date_to)
+
+    # Returns are booked as negative payments here
+    return qs.annotate(
+        positive_paid=bill_sum(payment_model, amount__gt=0),
+        returns_total=Abs(bill_sum(payment_model, amount__lt=0)),
+    ).order_by('-date', '-bill_no')
+
+
+def monthly_queryset(customer_name='', start_date='', end_date='', archived=False):
+    bill_model, payment_model, return_model = ledger_models(archived)
+    if not (customer_name or (start_date and end_date)):
+        return bill_model.objects.none()
+
+    qs = bill_model.objects.all()
+
+    if customer_name:
+        qs = qs.filter(customer_name__icontains=customer_name)
+
+    qs = without_carried(qs, start_date if end_date else '')
+
+    if start_date and end_date:
+        qs = qs.filter(date__range=[start_date, end_date])
+
+    # Returns + positive paid per bill in the same query (no per-bill round trips)
+    return qs.annotate(
+        returns_total=bill_sum(return_model),
+        positive_paid=bill_sum(payment_model, amount__gt=0),
+    ).order_by('date')
+
+
+# ---------------------------------------
+# Report rows
+#
+# Statements can cover years of bills, so they are read with values_list()
+# into tuples instead of Bill instances: no __dict__, no model state, and
+# the derived columns are filled in once here for the HTML, CSV and cache.
+# ---------------------------------------
+class StatementRow(NamedTuple):
+    id: int
+    date: datetime.date
+    customer_name: str
+    bill_no: int
+    total_amount: Decimal
+    positive_paid: Decimal
+    returns_total: Decimal
+    remaining_amount: Decimal
+
+    COLUMNS = ('id', 'date', 'customer_name', 'bill_no', 'total_amount', 'positive_paid', 'returns_total')
+
+    @classmethod
+    def build(cls, id, date, customer_name, bill_no, total, paid, returns):
+        total = total or ZERO
+        return cls(id, date, customer_name, bill_no, total, paid, returns, max(total - paid - returns, ZERO))
+
+
+class LedgerLine(NamedTuple):
+    """A payment or return line under a bill on the customer page."""
+    date: datetime.date
+    amount: Decimal
+    note: str
+
+
+class CustomerBillRow(NamedTuple):
+    id: int
+    date: datetime.date
+    bill_no: int
+    total_amount: Decimal
+    positive_paid: Decimal
+    returns_total: Decimal
+    remaining_amount: Decimal
+    payment_list: list
+    return_list: list
+
+
+def statement_rows(qs):
+    """values_list() of a statement/monthly queryset, one StatementRow per bill."""
+    values = qs.values_list(*StatementRow.COLUMNS).iterator(chunk_size=2000)
+    return (StatementRow.build(*row) for row in values)
+
+
+async def astatement_rows(qs):
+    return [StatementRow.build(*values) async for values in qs.values_list(*StatementRow.COLUMNS)]
+
+
+def statement_totals(rows):
+    total = sum((r.total_amount for r in rows), ZERO)
+    paid = sum((r.positive_paid for r in rows), ZERO)
+    returns = sum((r.returns_total for r in rows), ZERO)
+    return {
+        'total_amount': total,
+        'total_paid': paid,
+        'total_returns': returns,
+        'total_remaining': max(total - paid - returns, ZERO),
+    }
+
+
+async def acustomer_bill_rows(customer):
+    """Bills of one customer, newest first, each with its payment and return lines."""
+    payments, returns = defaultdict(list), defaultdict(list)
+    async for bill_id, *line in (Payment.objects.filter(bill__customer=customer).order_by('date', 'id')
+                                 .values_list('bill_id', 'date', 'amount', 'note')):
+        payments[bill_id].append(LedgerLine(*line))
+    async for bill_id, *line in (BillReturn.objects.filter(bill__customer=customer).order_by('date', 'id')
+                                 .values_list('bill_id', 'date', 'amount', 'note')):
+        returns[bill_id].append(LedgerLine(*line))
+
+    bills = (
+        Bill.objects.filter(customer=customer)
+        .annotate(
+            positive_paid=bill_sum(Payment, amount__gt=0),
+            returns_total=Abs(bill_sum(Payment, amount__lt=0)),
+        )
+        .order_by('-date', '-bill_no')
+        .values_list('id', 'date', 'bill_no', 'total_amount', 'positive_paid', 'returns_total')
+    )
+    rows = []
+    async for bill_id, date, bill_no, total, paid, returned in bills:
+        total = total or ZERO
+        rows.append(CustomerBillRow(bill_id, date, bill_no, total, paid, returned,
+                                    max(total - paid - returned, ZERO),
+                                    payments.get(bill_id, []), returns.get(bill_id, [])))
+    return rows
+
+
+# ---------------------------------------
+# Invoice numbers (print page + PDF export)
+# ---------------------------------------
+def invoice_context(bill, items):
+    items_total = sum((item.total or Decimal('0.00')) for item in items)
+    packing_qty = int(bill.packing_qty or 0)
+    packing_rate = bill.packing_rate or ZERO
+    packing_total = packing_qty * packing_rate
+    extra_amount = bill.extra_amount or ZERO
+
+    # Stored at write time by BillItem.save / Bill.update_total
+    cgst = sum((item.cgst for item in items), Decimal('0.00'))
+    sgst = sum((item.sgst for item in items), Decimal('0.00'))
+    igst = sum((item.igst for item in items), Decimal('0.00'))
+    final_total = items_total + cgst + sgst + igst + packing_total + extra_amount
+
+    hsn_summary = {}
+    for item in items:
+        if item.gst_rate:
+            row = hsn_summary.setdefault((item.hsn_code, item.gst_rate), {
+                'hsn': item.hsn_code or '-', 'rate': item.gst_rate,
+                'taxable': Decimal('0.00'), 'cgst': Decimal('0.00'), 'sgst': Decimal('0.00'), 'igst': Decimal('0.00'),
+            })
+            row['taxable'] += item.total
+            row['cgst'] += item.cgst
+            row['sgst'] += item.sgst
+            row['igst'] += item.igst
+
+    return {
+        'bill': bill,
+        'items': items,
+        'items_total': items_total,
+
+        'packing_qty': packing_qty,
+        'packing_rate': packing_rate,
+        'packing_total': packing_total,
+        'packing_reason': bill.packing_reason or "Packing",
+
+        'extra_reason': bill.extra_reason or "",
+        'extra_amount': extra_amount,
+
+        'cgst': cgst,
+        'sgst': sgst,
+        'igst': igst,
+        'hsn_summary': list(hsn_summary.values()),
+
+        'final_total': final_total,
+    }
+
+
+# ---------------------------------------
+# Item-level sales (bill items linked to the product master)
+# ---------------------------------------
+def product_sales(date_from='', date_to='', limit=50):
+    qs = BillItem.objects.filter(product__isnull=False)
+    if date_from:
+        qs = qs.filter(bill__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(bill__date__lte=date_to)
+    return list(
+        qs.order_by().values('product_id', 'product__code', 'product__name')
+        .annotate(quantity=Sum('quantity'), amount=Sum('total'))
+        .order_by('-amount')[:limit]
+    )
+
+
+# ---------------------------------------
+# Bill register / day book
+#
+# Pages are keyset pages: "the next N bills after (date, bill_no, id)" in
+# Bill.Meta.ordering order (id breaks ties between equal bill numbers), an
+# index seek that costs the same on page 1 and page 10,000, where OFFSET
+# would step over every earlier row. Day and month subtotals are grouped
+# queries over just the dates on the page.
+# ---------------------------------------
+REGISTER_ORDER = ('-date', '-bill_no', '-id')
+
+
+class RegisterRow(NamedTuple):
+    id: int
+    date: datetime.date
+    bill_no: int
+    customer_id: int
+    customer_name: str
+    total_amount: Decimal
+    returned_amount: Decimal
+    paid_amount: Decimal
+    is_paid: bool
+
+    COLUMNS = ('id', 'date', 'bill_no', 'customer_id', 'customer_name',
+               'total_amount', 'returned_amount', 'paid_amount', 'is_paid')
+
+    @property
+    def remaining(self):
+        return max((self.total_amount or ZERO) - (self.returned_amount or ZERO) - (self.paid_amount or ZERO), ZERO)
+
+    @property
+    def cursor(self):
+        return f"{self.date:%Y-%m-%d}.{self.bill_no}.{self.id}"
+
+
+class RegisterPage(NamedTuple):
+    rows: list
+    newer: str   # cursor for the previous (newer) page, '' on the first
+    older: str   # cursor for the next (older) page, '' on the last
+
+
+def parse_cursor(value):
+    try:
+        day, bill_no, bill_id = value.split('.')
+        return datetime.date.fromisoformat(day), int(bill_no), int(bill_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def register_queryset(date_from=None, date_to=None, status='', customer='', min_amount=None, max_amount=None):
+    qs = Bill.objects.all()
+    if date_from:
+        qs = qs.filter(date__gte=date_from)
+    if date_to:
+        qs = qs.filter(date__lte=date_to)
+    if status in ('paid', 'unpaid'):
+        qs = qs.filter(is_paid=status == 'paid')
+    if customer:
+        # An exact customer uses the FK index; anything else searches the names on the bills
+        ids = list(Customer.objects.filter(name__iexact=customer).values_list('id', flat=True))
+        qs = qs.filter(customer_id__in=ids) if ids else qs.filter(customer_name__icontains=customer)
+    if min_amount is not None:
+        qs = qs.filter(total_amount__gte=min_amount)
+    if max_amount is not None:
+        qs = qs.filter(total_amount__lte=max_amount)
+    return qs
+
+
+def register_older(qs, cursor):
+    """Bills after ``cursor`` in register order (older), newest first."""
+    day, bill_no, bill_id = cursor
+    # date__lte repeats the first column on its own so the planner seeks the index to it
+    return (qs.filter(date__lte=day)
+            .filter(Q(date__lt=day) | Q(date=day, bill_no__lt=bill_no) | Q(date=day, bill_no=bill_no, id__lt=bill_id))
+            .order_by(*REGISTER_ORDER))
+
+
+def register_newer(qs, cursor):
+    """Bills before ``cursor`` in register order (newer), oldest first."""
+    day, bill_no, bill_id = cursor
+    return (qs.filter(date__gte=day)
+            .filter(Q(date__gt=day) | Q(date=day, bill_no__gt=bill_no) | Q(date=day, bill_no=bill_no, id__gt=bill_id))
+            .order_by('date', 'bill_no', 'id'))
+
+
+def register_page(qs, after=None, before=None, size=50):
+    """One page of ``qs`` after (older than) or before (newer than) a parsed cursor."""
+    if before:
+        page = register_newer(qs, before)
+    elif after:
+        page = register_older(qs, after)
+    else:
+        page = qs.order_by(*REGISTER_ORDER)
+    rows = [RegisterRow(*values) for values in page.values_list(*RegisterRow.COLUMNS)[:size + 1]]
+    more = len(rows) > size
+    rows = rows[:size]
+    if before:
+        rows.reverse()
+    newer = bool(after) or (bool(before) and more)
+    older = bool(before) or more
+    return RegisterPage(rows, rows[0].cursor if rows and newer else '', rows[-1].cursor if rows and older else '')
+
+
+def _register_sums():
+    return {
+        'count': Count('id'),
+        'total': Sum('total_amount'),
+        'returned': Sum('returned_amount'),
+        'paid': Sum('paid_amount'),
+        'remaining': Sum(Greatest(F('total_amount') - F('returned_amount') - F('paid_amount'), Value(0),
+                                  output_field=MONEY)),
+    }
+
+
+def register_groups(qs, rows):
+    """
+    The page's rows nested as [(month, month sums, [(day, day sums, rows)])].
+    Sums cover every bill of ``qs`` on that day / in that month, including
+    the ones on neighbouring pages.
+    """
+    if not rows:
+        return []
+    first, last = rows[-1].date, rows[0].date
+    month_end = (last.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+    days = {row.pop('date'): row for row in qs.filter(date__range=(first, last)).order_by()
+            .values('date').annotate(**_register_sums())}
+    months = {row.pop('month'): row for row in qs.filter(date__range=(first.replace(day=1), month_end)).order_by()
+              .annotate(month=TruncMonth('date')).values('month').annotate(**_register_sums())}
+
+    groups = []
+    for row in rows:
+        month = row.date.replace(day=1)
+        if not groups or groups[-1][0] != month:
+            groups.append((month, months.get(month), []))
+        day_groups = groups[-1][2]
+        if not day_groups or day_groups[-1][0] != row.date:
+            day_groups.append((row.date, days.get(row.date), []))
+        day_groups[-1][2].append(row)
+    return groups
@@ -0,0 +1,477 @@
+import gzip
+import hmac
+import json
+import time
+import urllib.error
+import urllib.request
+from functools import cache, wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .integrity import refresh_customer_totals, update_rows
+from .models import (
+    Bill, BillItem, BillNumberBlock, BillReturn, ChangeLog, Customer, LedgerEntry, Payment, Product,
+    SyncConflict, SyncState,
+)
+
+# Parents first; the foreign key to the parent is named after the parent model
+MODELS = {'customer': Customer, 'bill': Bill, 'billitem': BillItem, 'payment': Payment, 'billreturn': BillReturn}
+PARENT = {'bill': 'customer', 'billitem': 'bill', 'payment': 'bill', 'billreturn': 'bill'}
+NOT_SYNCED = {'id', 'sync_id', 'sync_version', 'paid_by'}
+
+
+class SyncError(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    """A malformed request body; the endpoint answers 400 with the message."""
+
+
+# ---------------------------------------
+# Offline POS sync
+#
+# Every write to a synced row appends a ChangeLog entry; its id is the change
+# sequence. The central server serves its log as a feed (pull) and applies
+# terminals' changes (push). A row's version is the id of its newest log
+# entry on the server; terminals keep the version they last saw in
+# sync_version and send it with each change, and the server refuses a change
+# made on an older version than its own (a conflict, kept in SyncConflict).
+# Each copy keeps its own ledger journal and customer totals, so applied
+# rows are journalled and totalled locally rather than replayed.
+#
+# A sync run is push, then pull: pushed changes are either applied or
+# recorded as conflicts, so the pull can take the server's rows as they are.
+# After close_year on the server, set terminals up again from a fresh copy.
+# ---------------------------------------
+@cache
+def _columns(key):
+    skip = NOT_SYNCED | ChangeLog.LOCAL_FIELDS.get(key, set()) | {PARENT.get(key), 'product'}
+    return [f for f in MODELS[key]._meta.concrete_fields if f.name not in skip]
+
+
+def _write_columns(key):
+    names = [f.attname for f in _columns(key)]
+    if key in PARENT:
+        names.append(f'{PARENT[key]}_id')
+    if key == 'billitem':
+        names.append('product_id')
+    return names
+
+
+def _rows(key, sync_ids):
+    """{sync id: (payload, sync_version)} of the rows that still exist."""
+    names = [f.attname for f in _columns(key)]
+    related = []
+    if key in PARENT:
+        related.append(f'{PARENT[key]}__sync_id')
+    if key == 'billitem':
+        related.append('product__code')
+
+    found = {}
+    for row in MODELS[key].objects.filter(sync_id__in=sync_ids).values('sync_id', 'sync_version', *names, *related):
+        data = {name: row[name] for name in names}
+        if key in PARENT:
+            parent = row[f'{PARENT[key]}__sync_id']
+            data['parent'] = str(parent) if parent else None
+        if key == 'billitem':
+            data['product'] = row['product__code']
+        found[str(row['sync_id'])] = (data, row['sync_version'])
+    return found
+
+
+def _changes(latest, server):
+    """
+    Payloads for {(model, sync id): (log id, op, base version)}. The version
+    sent is the log id on the server, the version last seen on a terminal.
+    """
+    changes = []
+    for key in MODELS:
+        ids = [sid for model, sid in latest if model == key]
+        if not ids:
+            continue
+        rows = _rows(key, ids)
+        for sid in ids:
+            entry_id, op, base = latest[(key, sid)]
+            if sid in rows:
+                data, seen = rows[sid]
+                changes.append({'model': key, 'sync_id': sid, 'op': ChangeLog.UPSERT,
+                                'version': entry_id if server else seen, 'data': data})
+            else:
+                changes.append({'model': key, 'sync_id': sid, 'op': ChangeLog.DELETE,
+                                'version': entry_id if server else base})
+    return changes
+
+
+def _latest(entries, skip_origin=''):
+    latest = {}
+    for entry_id, model, sync_id, op, base, origin in entries:
+        if skip_origin and origin == skip_origin:
+            continue
+        latest[(model, str(sync_id))] = (entry_id, op, base)
+    return latest
+
+
+def _log_page(entries, limit):
+    entries = list(entries.order_by('id').values_list('id', 'model', 'sync_id', 'op', 'base_version', 'origin')[:limit])
+    return entries, (entries[-1][0] if entries else None)
+
+
+def seed_feed():
+    """
+    Central server: append one entry for every synced row that has none, i.e.
+    rows written while sync was off. Returns the number of entries added.
+    """
+    added = 0
+    with transaction.atomic():
+        for key, model in MODELS.items():
+            logged = ChangeLog.objects.filter(model=key).values('sync_id')
+            ids = list(model.objects.exclude(sync_id__in=logged).order_by('id').values_list('sync_id', flat=True))
+            added += len(ChangeLog.record_many(model, ids, origin=''))
+    return added
+
+
+def changes_since(cursor, limit, terminal=''):
+    """Central server: one page of the feed after ``cursor`` (the terminal's own changes left out)."""
+    if not cursor:   # a new terminal's first page: make sure the feed covers every row
+        seed_feed()
+    entries, last = _log_page(ChangeLog.objects.filter(id__gt=cursor), limit)
+    return {
+        'changes': _changes(_latest(entries, skip_origin=terminal), server=True),
+        'cursor': last or cursor,
+        'more': len(entries) == limit,
+    }
+
+
+def local_changes(cursor, limit):
+    """Terminal: (changes made here after ``cursor``, new cursor)."""
+    entries, last = _log_page(ChangeLog.objects.filter(id__gt=cursor, origin=settings.SYNC_TERMINAL_ID), limit)
+    return _changes(_latest(entries), server=False), last or cursor
+
+
+# ---------------------------------------
+# Applying changes
+# ---------------------------------------
+def _decode(key, data, parents, products):
+    values = {f.attname: f.to_python(data.get(f.attname)) for f in _columns(key)}
+    if key in PARENT:
+        values[f'{PARENT[key]}_id'] = parents.get(data.get('parent'))
+    if key == 'billitem':
+        values['product_id'] = products.get(data.get('product'))
+    return values
+
+
+def _lookups(key, batch):
+    parents, products = {}, {}
+    if key in PARENT:
+        wanted = {c['data'].get('parent') for c in batch if c.get('data')} - {None}
+        parents = {str(sid): pk for sid, pk in
+                   MODELS[PARENT[key]].objects.filter(sync_id__in=wanted).values_list('sync_id', 'id')}
+    if key == 'billitem':
+        codes = {c['data'].get('product') for c in batch if c.get('data')} - {None}
+        products = dict(Product.objects.filter(code__in=codes).values_list('code', 'id'))
+    return parents, products
+
+
+def _server_versions(sync_ids):
+    return {str(sid): v for sid, v in
+            ChangeLog.objects.filter(sync_id__in=sync_ids).values('sync_id')
+            .annotate(v=Max('id')).values_list('sync_id', 'v')}
+
+
+def _apply(changes, terminal=None):
+    """
+    Write ``changes`` parents first. With ``terminal`` this is the server
+    applying that terminal's push: changes must be based on the current
+    version, and applied ones are logged for the other terminals. Without it
+    this is a terminal applying a pull: newer versions replace local rows.
+    Returns (accepted [[model, sync id, version]], conflicts [dict]).
+    """
+    accepted, conflicts, journal = [], [], []
+    bill_ids, customer_ids = set(), set()
+
+    for key, model in MODELS.items():
+        batch = [c for c in changes if c.get('model') == key]
+        if not batch:
+            continue
+        names = _write_columns(key)
+        ids = [c['sync_id'] for c in batch]
+        existing = {str(r['sync_id']): r for r in
+                    model.objects.filter(sync_id__in=ids).values('id', 'sync_id', 'sync_version', *names)}
+        current = _server_versions(ids) if terminal else {}
+        parents, products = _lookups(key, batch)
+        taken = set()
+        if key == 'customer':
+            wanted = {c['data'].get('name') for c in batch if c.get('data')}
+            taken = set(Customer.objects.filter(name__in=wanted).exclude(sync_id__in=ids).values_list('name', flat=True))
+
+        inserts, updates, deletes, logged = [], [], [], {ChangeLog.UPSERT: [], ChangeLog.DELETE: []}
+
+        def conflict(change, reason):
+            conflicts.append({'model': key, 'sync_id': change['sync_id'], 'op': change['op'], 'reason': reason,
+                              'base_version': change['version'], 'server_version': current.get(change['sync_id'], 0),
+                              'payload': change.get('data')})
+
+        for change in batch:
+            sid, version, row = change['sync_id'], change['version'], existing.get(change['sync_id'])
+
+            if change['op'] == ChangeLog.DELETE:
+                if row is None:
+                    if terminal:
+                        accepted.append([key, sid, current.get(sid, 0)])
+                elif terminal and version != current.get(sid, 0):
+                    conflict(change, "changed on the server")
+                else:
+                    deletes.append(row)
+                    logged[ChangeLog.DELETE].append(sid)
+                continue
+
+            values = _decode(key, change['data'], parents, products)
+            if key != 'bill' and key in PARENT and values[f'{PARENT[key]}_id'] is None:
+                conflict(change, f"{PARENT[key]} missing")
+                continue
+            if key == 'customer' and values['name'] in taken:
+                conflict(change, "another customer has this name")
+                continue
+
+            if not terminal:
+                if row is None:
+                    inserts.append(model(sync_id=sid, sync_version=version, **values))
+                elif version > row['sync_version']:
+                    updates.append((row, values, version))
+                continue
+
+            if row is None:
+                if version and current.get(sid):
+                    conflict(change, "deleted on the server")
+                else:
+                    inserts.append(model(sync_id=sid, **values))
+                    logged[ChangeLog.UPSERT].append(sid)
+            elif all(row[name] == values[name] for name in names):
+                accepted.append([key, sid, current.get(sid, 0)])   # a retried push
+            elif version == current.get(sid, 0):
+                updates.append((row, values, version))
+                logged[ChangeLog.UPSERT].append(sid)
+            else:
+                conflict(change, "changed on the server")
+
+        if deletes:
+            if key == 'bill':
+                today = timezone.localdate()
+                for row in deletes:
+                    net, paid = LedgerEntry._amounts(row)
+                    if net or paid:
+                        journal.append(LedgerEntry(customer_id=row['customer_id'], bill_id=row['id'],
+                                                   kind=LedgerEntry.ADJUSTMENT, date=today, debit=-net, credit=-paid,
+                                                   note=f"Bill #{row['bill_no']} deleted (sync)"))
+                    customer_ids.add(row['customer_id'])
+            elif key in PARENT:
+                bill_ids.update(row['bill_id'] for row in deletes)
+            model.objects.filter(id__in=[row['id'] for row in deletes]).delete()
+
+        if inserts:
+            model.objects.bulk_create(inserts, batch_size=500)
+        if updates:
+            columns = names + ([] if terminal else ['sync_version'])
+            update_rows(model, columns, [
+                tuple(values[name] for name in names) + (() if terminal else (version,)) + (row['sync_id'],)
+                for row, values, version in updates
+            ], key='sync_id')
+
+        if key == 'bill':
+            for bill in inserts:
+                journal.extend(LedgerEntry.bill_change_entries(bill, None))
+                customer_ids.add(bill.customer_id)
+            for row, values, _ in updates:
+                bill = Bill(id=row['id'], **values)
+                journal.extend(LedgerEntry.bill_change_entries(bill, {f: row[f] for f in LedgerEntry.BILL_FIELDS}))
+                customer_ids.update((row['customer_id'], bill.customer_id))
+        elif key in PARENT:
+            bill_ids.update(obj.bill_id for obj in inserts)
+            bill_ids.update(values['bill_id'] for _, values, _ in updates)
+
+        if terminal:
+            for op, sids in logged.items():
+                for entry in ChangeLog.record_many(model, sids, op, origin=terminal):
+                    accepted.append([key, str(entry.sync_id), entry.id])
+
+    LedgerEntry.objects.bulk_create(journal, batch_size=1000)
+    customer_ids.update(Bill.objects.filter(id__in=bill_ids).values_list('customer_id', flat=True))
+    customer_ids.discard(None)
+    refresh_customer_totals(customer_ids)
+    Customer.bump_ledger_version(*customer_ids)
+    return accepted, conflicts
+
+
+def _keep_conflicts(terminal, conflicts):
+    SyncConflict.objects.bulk_create([SyncConflict(terminal=terminal, **c) for c in conflicts])
+
+
+def apply_push(terminal, changes):
+    """Central server: apply one batch of a terminal's changes."""
+    with transaction.atomic():
+        accepted, conflicts = _apply(changes, terminal)
+        _keep_conflicts(terminal, conflicts)
+    return {'accepted': accepted, 'conflicts': conflicts}
+
+
+# ---------------------------------------
+# Transport: gzip'd JSON over HTTP POST, shared token
+# ---------------------------------------
+def int_field(body, name, default, low=0, high=None):
+    """Whole number ``name`` from a request body, clamped to [low, high]; BadRequest if it is not one."""
+    value = body.get(name) or default
+    if isinstance(value, bool):
+        raise BadRequest(f"'{name}' must be a whole number.")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"'{name}' must be a whole number.")
+    return max(low, value if high is None else min(value, high))
+
+
+def endpoint(view):
+    """
+    Central-server view taking and returning gzip'd JSON. Called as
+    ``view(request, terminal, body)``; the token is SYNC_TOKEN. A view
+    raises BadRequest for a body it cannot use.
+    """
+    @csrf_exempt
+    @require_POST
+    @wraps(view)
+    def wrapper(request):
+        if not settings.SYNC_TOKEN or settings.SYNC_TERMINAL_ID:
+            raise Http404("Sync is not enabled on this server.")
+        sent = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(sent, f'Token {settings.SYNC_TOKEN}'.encode()):
+            return JsonResponse({'error': 'bad sync token'}, status=403)
+        try:
+            raw = request.body
+            if request.headers.get('Content-Encoding') == 'gzip':
+                raw = gzip.decompress(raw)
+            body = json.loads(raw)
+            terminal = str(body['terminal'])[:30]
+        except (OSError, ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest("Expected a gzip'd JSON body with a terminal id.")
+        if not terminal:
+            return HttpResponseBadRequest("Expected a gzip'd JSON body with a terminal id.")
+
+        try:
+            result = view(request, terminal, body)
+        except BadRequest as exc:
+            return HttpResponseBadRequest(str(exc))
+        response = HttpResponse(gzip.compress(json.dumps(result, cls=DjangoJSONEncoder).encode(), 6),
+                                content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+        return response
+    return wrapper
+
+
+class Client:
+    def __init__(self, server, token=None):
+        self.server = server.rstrip('/')
+        self.token = settings.SYNC_TOKEN if token is None else token
+        self.sent = self.received = 0
+
+    def post(self, path, body):
+        data = gzip.compress(json.dumps(body, cls=DjangoJSONEncoder).encode(), 6)
+        request = urllib.request.Request(self.server + path, data=data, headers={
+            'Content-Type': 'application/json', 'Content-Encoding': 'gzip',
+            'Authorization': f'Token {self.token}',
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=settings.SYNC_TIMEOUT) as response:
+                raw = response.read()
+                gzipped = response.headers.get('Content-Encoding') == 'gzip'
+        except urllib.error.HTTPError as exc:
+            raise SyncError(f"{self.server}{path}: HTTP {exc.code} {exc.read()[:200].decode(errors='replace')}")
+        except (urllib.error.URLError, OSError) as exc:
+            raise SyncError(f"{self.server}{path}: {getattr(exc, 'reason', exc)}")
+        self.sent += len(data)
+        self.received += len(raw)
+        return json.loads(gzip.decompress(raw) if gzipped else raw)
+
+
+# ---------------------------------------
+# Terminal side
+# ---------------------------------------
+def _confirm(result):
+    """Store the server versions of the pushed rows it applied."""
+    by_model = {}
+    for key, sid, version in result['accepted']:
+        by_model.setdefault(key, []).append((version, sid))
+    for key, rows in by_model.items():
+        update_rows(MODELS[key], ['sync_version'], rows, key='sync_id')
+
+
+def reserve_numbers(client, size):
+    block = client.post('/sync/reserve/', {'terminal': settings.SYNC_TERMINAL_ID, 'size': size})
+    return BillNumberBlock.objects.create(terminal=settings.SYNC_TERMINAL_ID, start=block['start'],
+                                          end=block['end'], next_no=block['start'])
+
+
+def run_sync(server=None, batch=None, log=None):
+    """
+    One sync run of this terminal: top up reserved bill numbers, push local
+    changes, pull the server's. Returns a report dict.
+    """
+    log = log or (lambda msg: None)
+    terminal = settings.SYNC_TERMINAL_ID
+    server = (server or settings.SYNC_SERVER_URL).rstrip('/')
+    if not terminal:
+        raise SyncError("BILLING_TERMINAL_ID is not set; only POS terminals sync.")
+    if not server:
+        raise SyncError("No server: pass --server or set BILLING_SYNC_URL.")
+    batch = batch or settings.SYNC_BATCH
+    client = Client(server)
+    state, _ = SyncState.objects.get_or_create(server=server)
+    report = {'reserved': None, 'pushed': 0, 'accepted': 0, 'pulled': 0, 'conflicts': 0}
+    began = time.perf_counter()
+
+    if BillNumberBlock.remaining(terminal) < settings.SYNC_BLOCK_LOW_WATER:
+        block = reserve_numbers(client, settings.SYNC_BLOCK_SIZE)
+        report['reserved'] = [block.start, block.end]
+        log(f"reserved bill numbers {block.start}–{block.end}")
+
+    while True:
+        changes, cursor = local_changes(state.push_cursor, batch)
+        if cursor == state.push_cursor:
+            break
+        result = client.post('/sync/push/', {'terminal': terminal, 'changes': changes}) if changes else None
+        with transaction.atomic(), ChangeLog.paused():
+            if result:
+                _confirm(result)
+                _keep_conflicts(terminal, result['conflicts'])
+                report['accepted'] += len(result['accepted'])
+                report['conflicts'] += len(result['conflicts'])
+            state.push_cursor = cursor
+            state.save(update_fields=['push_cursor'])
+        report['pushed'] += len(changes)
+        log(f"pushed {report['pushed']} row(s)")
+
+    while True:
+        page = client.post('/sync/pull/', {'terminal': terminal, 'cursor': state.pull_cursor, 'limit': batch})
+        with transaction.atomic(), ChangeLog.paused():
+            _, conflicts = _apply(page['changes'])
+            _keep_conflicts(terminal, conflicts)
+            state.pull_cursor = page['cursor']
+            state.save(update_fields=['pull_cursor'])
+        report['pulled'] += len(page['changes'])
+        report['conflicts'] += len(conflicts)
+        if page['changes']:
+            log(f"pulled {report['pulled']} row(s)")
+        if not page['more']:
+            break
+
+    state.last_sync = timezone.now()
+    state.save(update_fields=['last_sync'])
+    report.update(seconds=round(time.perf_counter() - began, 3), bytes_sent=client.sent,
+                  bytes_received=client.received)
+    return report
@@ -1,3 +1,1139 @@
-from django.test import TestCase
+import gzip
+import json
+import re
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Min, Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    admin, analytics, archive, backup, bulk, catalog, dedupe, gst, jobs, maintenance, receipt, reconcile, replica,
+    reports,
+)
+from .integrity import check_bills
+from .ledger import balance_on, replay_bills, replay_customers
+from .models import (
+    ArchivedBill, BankLine, Bill, BillingSettings, BillItem, BillNumberBlock, BillReturn, ChangeLog, Customer, Job,
+    LedgerEntry, MergeProposal, Payment, Product, RequestProfile, SyncConflict,
+)
+from .money import to_paise
+from .profiling import ProfilerMiddleware
+from .query_guard import TemplateQueryError, render_prefetched
+from .replica import RecentWritesMiddleware
+
+
+# ---------------------------------------
+# Fixtures shared by the test cases below
+# ---------------------------------------
+def make_bill(customer=None, rate='100', quantity=1, paid=None, returned=None, description='item', **fields):
+    """
+    A bill (numbered automatically unless ``bill_no`` is given) with one item
+    line of ``quantity`` × ``rate``, then an optional payment and a 'damaged'
+    return, reloaded with its stored totals.
+    """
+    fields.setdefault('bill_no', 0)
+    bill = Bill.objects.create(customer=customer, **fields)
+    BillItem.objects.create(bill=bill, description=description, quantity=quantity, rate=Decimal(rate))
+    if paid:
+        Payment.objects.create(bill=bill, amount=Decimal(paid))
+    if returned:
+        BillReturn.objects.create(bill=bill, amount=Decimal(returned), note='damaged')
+    bill.refresh_from_db()
+    return bill
+
+
+def make_customer(name, *bills, **fields):
+    """A customer with one make_bill(**kwargs) per dict in ``bills``, reloaded with its totals."""
+    customer = Customer.objects.create(name=name, **fields)
+    for kwargs in bills:
+        make_bill(customer, **kwargs)
+    customer.refresh_from_db()
+    return customer
+
+
+@override_settings(TEMPLATE_QUERY_GUARD=True)
+class CustomerDetailQueriesTest(TestCase):
+    def setUp(self):
+        caches['ledger'].clear()
+        user = User.objects.create_user('clerk', password='pw')
+        self.client.force_login(user)
+
+    BILL = {'quantity': 2, 'rate': '50', 'paid': '30', 'returned': '10'}
+
+    def count_queries(self, customer):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/customer/{customer.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Ledger-Cache'], 'miss')
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_bills(self):
+        small, _ = self.count_queries(make_customer('Small', *[self.BILL] * 2))
+        large, response = self.count_queries(make_customer('Large', *[self.BILL] * 40))
+        self.assertGreater(small, 0)
+        self.assertEqual(small, large)
+        self.assertContains(response, 'damaged', count=40)
+
+    def test_guard_rejects_lazy_relation(self):
+        customer = make_customer('Lazy', self.BILL)
+        bill = Bill.objects.get(customer=customer)
+        bill.payment_list = bill.payments.all()        # unevaluated queryset
+        bill.return_list = []
+        with self.assertRaises(TemplateQueryError):
+            render_prefetched('customer_detail_bills.html', {'bills': [bill]})
+
+
+class BulkBillActionsTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('clerk', password='pw')
+        self.client.force_login(user)
+
+    BILL = {'quantity': 2, 'rate': '50', 'paid': '30'}
+
+    def post(self, customer, action):
+        ids = list(Bill.objects.filter(customer=customer).values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(f'/customer/{customer.id}/bills/bulk/', {'action': action, 'bills': ids})
+        self.assertEqual(response.status_code, 302)
+        return len(ctx.captured_queries)
+
+    def assertJournalBalances(self):
+        self.assertEqual(list(replay_customers()), [])
+        self.assertEqual(list(replay_bills()), [])
+
+    def test_mark_paid_query_count_does_not_grow(self):
+        small = self.post(make_customer('Small', *[self.BILL] * 2), 'paid')
+        large = self.post(make_customer('Large', *[self.BILL] * 30), 'paid')
+        self.assertEqual(small, large)
+
+        customer = Customer.objects.get(name='Large')
+        self.assertEqual(customer.remaining_amount, 0)
+        self.assertEqual(customer.paid_amount, Decimal('3000'))
+        self.assertFalse(Bill.objects.filter(customer=customer, is_paid=False).exists())
+        self.assertEqual(Payment.objects.filter(bill__customer=customer).count(), 60)
+        self.assertJournalBalances()
+
+    def test_delete_query_count_does_not_grow(self):
+        small = self.post(make_customer('Small', *[self.BILL] * 2), 'delete')
+        large = self.post(make_customer('Large', *[self.BILL] * 30), 'delete')
+        self.assertEqual(small, large)
+
+        customer = Customer.objects.get(name='Large')
+        self.assertFalse(Bill.objects.filter(customer=customer).exists())
+        self.assertEqual((customer.total_amount, customer.paid_amount), (0, 0))
+        self.assertJournalBalances()
+
+    def test_only_own_bills_are_touched(self):
+        mine = make_customer('Mine', self.BILL)
+        other = make_customer('Other', self.BILL)
+        bill = Bill.objects.get(customer=other)
+        self.client.post(f'/customer/{mine.id}/bills/bulk/', {'action': 'delete', 'bills': [bill.id]})
+        self.assertTrue(Bill.objects.filter(id=bill.id).exists())
+
+
+@override_settings(SYNC_TOKEN='secret', SYNC_TERMINAL_ID='')
+class SyncEndpointsTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('clerk', password='pw')
+        self.client.force_login(user)
+        self.customer = Customer.objects.create(name='Ravi', phone='98000')
+        self.bill = Bill.objects.create(customer=self.customer, bill_no=0)
+
+    def post(self, path, body):
+        return self.client.post(path, json.dumps(body), content_type='application/json',
+                                headers={'Authorization': 'Token secret'})
+
+    def pull(self, cursor=0):
+        response = self.post('/sync/pull/', {'terminal': 'counter-2', 'cursor': cursor, 'limit': 500})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(gzip.decompress(response.content))
+
+    def ops(self, page, model):
+        return {c['sync_id']: c['op'] for c in page['changes'] if c['model'] == model}
+
+    def save_items(self, *items):
+        response = self.client.post(f'/add-items/{self.bill.id}/', json.dumps({'items': [
+            {'description': name, 'quantity': 1, 'rate': rate} for name, rate in items
+        ]}), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        return [str(sid) for sid in BillItem.objects.filter(bill=self.bill).values_list('sync_id', flat=True)]
+
+    def test_item_edit_logs_deletes(self):
+        old = self.save_items(('Rice', '40'), ('Dal', '90'))
+        cursor = self.pull()['cursor']
+        new = self.save_items(('Sugar', '45'))
+
+        page = self.pull(cursor)
+        items = self.ops(page, 'billitem')
+        self.assertEqual({sid: items.get(sid) for sid in old}, dict.fromkeys(old, ChangeLog.DELETE))
+        self.assertEqual(items[new[0]], ChangeLog.UPSERT)
+        self.assertEqual(ChangeLog.objects.filter(model='billitem', op=ChangeLog.DELETE).count(), 2)
+
+    def test_pull_after_edit_and_delete(self):
+        payment = Payment.objects.create(bill=self.bill, amount=Decimal('30'))
+        cursor = self.pull()['cursor']
+        self.customer.phone = '98111'
+        self.customer.save()
+        payment.delete()
+
+        page = self.pull(cursor)
+        customer = next(c for c in page['changes'] if c['model'] == 'customer')
+        self.assertEqual(customer['data']['phone'], '98111')
+        self.assertEqual(self.ops(page, 'payment'), {str(payment.sync_id): ChangeLog.DELETE})
+        self.assertEqual(self.pull(page['cursor'])['changes'], [])
+
+    def test_push_conflict_keeps_server_row(self):
+        page = self.pull()
+        seen = next(c for c in page['changes'] if c['model'] == 'customer')
+        self.customer.phone = '98111'   # edited on the server after the terminal's pull
+        self.customer.save()
+
+        change = dict(seen, data=dict(seen['data'], phone='98222'))
+        response = self.post('/sync/push/', {'terminal': 'counter-2', 'changes': [change]})
+        result = json.loads(gzip.decompress(response.content))
+        self.assertEqual(result['accepted'], [])
+        self.assertEqual(result['conflicts'][0]['reason'], 'changed on the server')
+        conflict = SyncConflict.objects.get()
+        self.assertEqual((conflict.terminal, conflict.sync_id), ('counter-2', self.customer.sync_id))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.phone, '98111')
+
+        current = next(c for c in self.pull(page['cursor'])['changes'] if c['model'] == 'customer')
+        change = dict(current, data=dict(current['data'], phone='98222'))
+        result = json.loads(gzip.decompress(self.post('/sync/push/', {'terminal': 'counter-2', 'changes': [change]}).content))
+        self.assertEqual(len(result['accepted']), 1)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.phone, '98222')
+
+    def test_reserve_blocks(self):
+        Bill.objects.create(customer=self.customer, bill_no=40)
+        blocks = []
+        for _ in range(2):
+            response = self.post('/sync/reserve/', {'terminal': 'counter-2', 'size': 10})
+            blocks.append(json.loads(gzip.decompress(response.content)))
+        self.assertEqual(blocks, [{'start': 41, 'end': 50}, {'start': 51, 'end': 60}])
+        self.assertEqual(Bill.next_number(), 61)
+
+    def test_malformed_body_is_rejected(self):
+        for path, body in (('/sync/pull/', {'cursor': 'abc'}), ('/sync/pull/', {'limit': [1]}),
+                           ('/sync/reserve/', {'size': '10 bills'}), ('/sync/push/', {'changes': {'a': 1}}),
+                           ('/sync/push/', {'changes': [{'model': 'bill', 'op': 'upsert'}]})):
+            response = self.post(path, dict(body, terminal='counter-2'))
+            self.assertEqual(response.status_code, 400, (path, body))
+        self.assertFalse(BillNumberBlock.objects.exists())
+
+    def test_no_feed_while_sync_is_off(self):
+        ChangeLog.objects.all().delete()
+        with self.settings(SYNC_TOKEN=''):
+            bill = Bill.objects.create(customer=self.customer, bill_no=0)
+            BillItem.objects.create(bill=bill, description='Rice', quantity=1, rate=Decimal('40'))
+        self.assertFalse(ChangeLog.objects.exists())
+
+        page = self.pull()   # a terminal's first pull seeds the feed with the unlogged rows
+        self.assertIn(str(bill.sync_id), self.ops(page, 'bill'))
+        self.assertEqual(len(self.ops(page, 'billitem')), 1)
+
+
+class JobLockTest(TestCase):
+    def running_job(self, worker, hours_ago):
+        return Job.objects.create(kind='rebuild_ledger', status=Job.RUNNING, locked_by=worker,
+                                  locked_at=timezone.now() - timedelta(hours=hours_ago))
+
+    def test_heartbeat_keeps_long_job_running(self):
+        alive = self.running_job('host:1', 2)
+        dead = self.running_job('host:2', 2)
+        self.assertEqual(jobs.heartbeat('host:1', [alive.id]), 1)
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((alive.status, alive.locked_by), (Job.RUNNING, 'host:1'))
+        self.assertEqual((dead.status, dead.locked_by), (Job.QUEUED, None))
+
+    def test_progress_renews_lock(self):
+        job = self.running_job('host:1', 2)
+        jobs.JobContext(job).progress(40, 'halfway')
+        self.assertEqual(jobs.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (Job.RUNNING, 40))
+
+    def test_stale_job_out_of_attempts_fails(self):
+        retry = self.running_job('host:1', 2)
+        crashing = self.running_job('host:2', 2)
+        Job.objects.filter(id=retry.id).update(attempts=2)
+        Job.objects.filter(id=crashing.id).update(attempts=3)
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        retry.refresh_from_db()
+        crashing.refresh_from_db()
+        self.assertEqual(retry.status, Job.QUEUED)
+        self.assertEqual((crashing.status, crashing.locked_by), (Job.FAILED, None))
+        self.assertIsNotNone(crashing.finished_at)
+
+
+class JournalDatesTest(TestCase):
+    def setUp(self):
+        self.customer = make_customer('Meena')
+        self.bill = make_bill(self.customer, date=date(2026, 1, 5), description='Cloth')
+
+    def entry_dates(self, kind):
+        return list(LedgerEntry.objects.filter(bill=self.bill, kind=kind).values_list('date', flat=True))
+
+    def test_back_dated_payment_and_return(self):
+        Payment.objects.create(bill=self.bill, amount=Decimal('40'), date=date(2026, 1, 10))
+        returned = timezone.make_aware(datetime(2026, 1, 20, 11, 0))
+        BillReturn.objects.create(bill=self.bill, amount=Decimal('10'), date=returned)
+
+        self.assertEqual(self.entry_dates(LedgerEntry.PAYMENT), [date(2026, 1, 10)])
+        self.assertEqual(self.entry_dates(LedgerEntry.RETURN), [date(2026, 1, 20)])
+        self.assertEqual(balance_on(self.customer, date(2026, 1, 9)).balance, Decimal('100'))
+        self.assertEqual(balance_on(self.customer, date(2026, 1, 15)).balance, Decimal('60'))
+        self.assertEqual(balance_on(self.customer, date(2026, 1, 31)).balance, Decimal('50'))
+
+    def test_bulk_mark_paid_on_date(self):
+        bulk.mark_paid(self.customer, [self.bill.id], on=date(2026, 2, 1))
+        self.assertEqual(self.entry_dates(LedgerEntry.PAYMENT), [date(2026, 2, 1)])
+        self.assertEqual(Payment.objects.get(bill=self.bill).date, date(2026, 2, 1))
+        self.assertEqual(balance_on(self.customer, date(2026, 1, 31)).balance, Decimal('100'))
+        self.assertEqual(balance_on(self.customer, date(2026, 2, 1)).balance, Decimal('0'))
+
+
+class PaiseMoneyTest(TestCase):
+    def test_field_converts_both_ways(self):
+        field = Payment._meta.get_field('amount')
+        for amount, paise in (('10.005', 1001), ('1.015', 102), ('-1.015', -102), ('0.29', 29), ('-250.5', -25050)):
+            self.assertEqual(field.get_prep_value(Decimal(amount)), paise, amount)
+            self.assertEqual(field.get_prep_value(amount), paise, amount)
+        self.assertEqual(field.from_db_value(-25050, None, connection), Decimal('-250.50'))
+        self.assertEqual(str(field.from_db_value(1001, None, connection)), '10.01')
+        self.assertIsNone(field.from_db_value(None, None, connection))
+        self.assertIsNone(field.get_prep_value(None))
+
+    def test_round_trip_and_aggregates(self):
+        bill = Bill.objects.create(customer=Customer.objects.create(name='Asha'), bill_no=0)
+        Payment.objects.create(bill=bill, amount=Decimal('12.345'))
+        Payment.objects.create(bill=bill, amount=Decimal('-2.005'))
+        amounts = sorted(Payment.objects.values_list('amount', flat=True))
+        self.assertEqual(amounts, [Decimal('-2.01'), Decimal('12.35')])
+
+        totals = Payment.objects.aggregate(total=Sum('amount'), low=Min('amount'))
+        self.assertIsInstance(totals['total'], Decimal)
+        self.assertEqual(str(totals['total']), '10.34')
+        self.assertEqual(totals['low'], Decimal('-2.01'))
+        paid = Bill.objects.annotate(p=Sum('payments__amount')).get(id=bill.id).p
+        self.assertEqual((type(paid), paid), (Decimal, Decimal('10.34')))
+
+
+class PaiseMigrationTest(TransactionTestCase):
+    """0036 rewrites the rupee columns as paise (and back) in SQL."""
+    before = [('bills', '0035_request_profiles')]
+    after = [('bills', '0036_paise_money')]
+    amounts = ['10.005', '1.015', '-1.015', '2.675', '0.29', '-250.50', '99999999.99']
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(target)
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def debits(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT debit FROM bills_ledgerentry ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_rupees_to_paise_and_back(self):
+        self.migrate(self.before)
+        with connection.cursor() as cursor:
+            for amount in self.amounts:
+                cursor.execute("INSERT INTO bills_ledgerentry (kind, date, debit, credit, note, created_at) "
+                               "VALUES ('adjustment', '2026-01-01', %s, 0, '', '2026-01-01 00:00')", [amount])
+
+        self.migrate(self.after)
+        self.assertEqual(self.debits(), [to_paise(amount) for amount in self.amounts])
+
+        self.migrate(self.before)
+        expected = [Decimal(amount).quantize(Decimal('0.01'), ROUND_HALF_UP) for amount in self.amounts]
+        self.assertEqual([Decimal(str(value)).quantize(Decimal('0.01')) for value in self.debits()], expected)
+
+
+class LedgerCacheInvalidationTest(TestCase):
+    """Every bill, item, payment and return write moves the customer's cached reports to a new version."""
+
+    def setUp(self):
+        caches['ledger'].clear()
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        self.customer = make_customer('Gopal')
+        self.bill = make_bill(self.customer, quantity=2, rate='50', description='Oil')
+        self.item = self.bill.items.get()
+
+    def views(self):
+        statement = self.client.get('/customer-statement/', {'customer_name': 'Gopal'})
+        detail = self.client.get(f'/customer/{self.customer.id}/')
+        _, receipt_cached = receipt.receipt_bytes(Bill.objects.select_related('customer').get(id=self.bill.id))
+        return {
+            'statement': (statement['X-Ledger-Cache'], statement.content),
+            'detail': (detail['X-Ledger-Cache'], detail.content),
+            'receipt': ('hit' if receipt_cached else 'miss', None),
+        }
+
+    def assertWriteRebuilds(self, write):
+        self.views()
+        cached = self.views()
+        self.assertEqual({name: state for name, (state, _) in cached.items()}, dict.fromkeys(cached, 'hit'))
+        write()
+        fresh = self.views()
+        self.assertEqual({name: state for name, (state, _) in fresh.items()}, dict.fromkeys(fresh, 'miss'))
+        self.assertNotEqual(fresh['statement'][1], cached['statement'][1])
+        self.assertNotEqual(fresh['detail'][1], cached['detail'][1])
+
+    def test_payment_invalidates(self):
+        self.assertWriteRebuilds(lambda: Payment.objects.create(bill=self.bill, amount=Decimal('35')))
+
+    def test_return_invalidates(self):
+        self.assertWriteRebuilds(lambda: BillReturn.objects.create(bill=self.bill, amount=Decimal('20'), note='leak'))
+
+    def test_item_edit_invalidates(self):
+        def edit():
+            self.item.quantity = 5
+            self.item.save()
+        self.assertWriteRebuilds(edit)
+
+
+class DedupeApplyTest(TestCase):
+    def test_merge_moves_bills_payments_and_journal(self):
+        target = make_customer('Ramesh Kumar', {'rate': '100', 'paid': '40'})
+        source = make_customer('Shri Ramesh Kumaar', {'rate': '250', 'paid': '250'}, {'rate': '80'}, phone='98765')
+        moving = set(Bill.objects.filter(customer=source).values_list('id', flat=True))
+        versions = target.ledger_version
+        proposal = MergeProposal.objects.create(kind=MergeProposal.MERGE, target=target, sources=[source.id],
+                                                bills=2, score=0.9, reason='test')
+
+        report = dedupe.apply([proposal])
+        self.assertEqual((report['merged'], report['bills']), (1, 2))
+        self.assertFalse(Customer.objects.filter(id=source.id).exists())
+        target.refresh_from_db()
+        self.assertEqual(set(Bill.objects.filter(id__in=moving).values_list('customer_id', flat=True)), {target.id})
+        self.assertEqual(set(Bill.objects.filter(id__in=moving).values_list('customer_name', flat=True)), {target.name})
+        self.assertEqual(Payment.objects.filter(bill__customer=target).count(), 2)
+        self.assertEqual((target.total_amount, target.paid_amount), (Decimal('430'), Decimal('290')))
+        self.assertEqual(target.phone, '98765')   # blank detail filled from the source
+        self.assertGreater(target.ledger_version, versions)
+
+        moved_in = LedgerEntry.objects.filter(customer=target, bill_id__in=moving, kind=LedgerEntry.ADJUSTMENT)
+        self.assertEqual(moved_in.count(), 2)
+        self.assertEqual(balance_on(target, timezone.localdate()).balance, Decimal('140'))
+        self.assertEqual(list(replay_customers()), [])
+        self.assertEqual(list(replay_bills()), [])
+        proposal.refresh_from_db()
+        self.assertEqual(proposal.status, MergeProposal.APPLIED)
+
+    def test_relink_attaches_orphan_bills(self):
+        target = make_customer('Lakshmi Stores')
+        orphan = make_bill(customer_name='Laxmi Stores', rate='60')
+        proposal = MergeProposal.objects.create(kind=MergeProposal.RELINK, target=target, names=['Laxmi Stores'],
+                                                bills=1, score=0.9, reason='test')
+
+        dedupe.apply([proposal])
+        orphan.refresh_from_db()
+        target.refresh_from_db()
+        self.assertEqual((orphan.customer_id, orphan.customer_name), (target.id, 'Lakshmi Stores'))
+        self.assertEqual(target.total_amount, Decimal('60'))
+        self.assertEqual(list(replay_customers()), [])
+
+
+class BankReconcileTest(TestCase):
+    CSV = (
+        "Account No: 001234,,,\n"
+        "Txn Date,Narration,Ref No,Credit\n"
+        "05/03/2026,UPI/RAMESH/bill no 101,UTR001,500.00\n"
+        "05/03/2026,NEFT SUNITA TRADERS,UTR002,777.00\n"
+        "06/03/2026,UPI-9876543210-PAYMENT,UTR003,\"500.00\"\n"
+    )
+
+    def setUp(self):
+        self.ramesh = make_customer('Ramesh', phone='98765 43210')
+        self.sunita = make_customer('Sunita')
+        self.bills = {}
+        for customer, bill_no, day, total in ((self.ramesh, 101, 1, '500'), (self.ramesh, 102, 2, '300'),
+                                              (self.ramesh, 103, 3, '200'), (self.sunita, 201, 2, '777')):
+            bill = make_bill(customer, total, bill_no=bill_no, date=date(2026, 3, day), description='goods')
+            self.bills[bill_no] = bill.id
+
+    def allocations(self, statement):
+        lines = statement.bank_lines.order_by('line_no')
+        return [(line.status, [[bill_id, paise] for bill_id, paise in line.allocations]) for line in lines]
+
+    def test_match_post_and_reimport(self):
+        statement = reconcile.import_statement(self.CSV.splitlines(), 'march.csv')
+        self.assertEqual((statement.lines, statement.duplicates), (3, 0))
+
+        reconcile.match_statement(statement)
+        b = self.bills
+        self.assertEqual(self.allocations(statement), [
+            (BankLine.PROPOSED, [[b[101], 50000]]),                      # bill number in the narration
+            (BankLine.PROPOSED, [[b[201], 77700]]),                      # amount and date only
+            (BankLine.PROPOSED, [[b[102], 30000], [b[103], 20000]]),     # phone: oldest open bills, split
+        ])
+        scores = list(statement.bank_lines.order_by('line_no').values_list('score', flat=True))
+        self.assertEqual(scores, [1.0, 0.7, 0.9])
+
+        report = reconcile.post_lines(statement.bank_lines.all())
+        self.assertEqual((report['lines'], report['payments'], report['amount']), (3, 4, '1777.00'))
+        self.assertFalse(Bill.objects.filter(is_paid=False).exists())
+        self.assertEqual(set(Payment.objects.values_list('date', flat=True)), {date(2026, 3, 5), date(2026, 3, 6)})
+        self.assertEqual(LedgerEntry.objects.filter(kind=LedgerEntry.PAYMENT, date=date(2026, 3, 6)).count(), 2)
+        self.assertEqual(list(replay_customers()), [])
+        self.assertEqual(list(replay_bills()), [])
+
+        again = reconcile.import_statement(self.CSV.encode().splitlines(keepends=True), 'march-again.csv')
+        self.assertEqual((again.lines, again.duplicates), (0, 3))
+        self.assertEqual(BankLine.objects.count(), 3)
+        self.assertEqual(Payment.objects.count(), 4)
+
+
+class BillRegisterTest(TestCase):
+    # (date, bill_no): repeated dates and a repeated bill_no on one date straddle the 3-row pages
+    BILLS = [('2026-03-02', 9), ('2026-03-02', 8), ('2026-03-02', 8), ('2026-03-01', 7), ('2026-03-01', 7),
+             ('2026-03-01', 7), ('2026-03-01', 6), ('2026-02-28', 5), ('2026-02-28', 5), ('2026-02-27', 4),
+             ('2026-02-27', 3), ('2026-02-10', 2), ('2026-01-31', 1)]
+
+    def setUp(self):
+        Bill.objects.bulk_create([
+            Bill(customer_name=f'Customer {n}', bill_no=bill_no, date=date.fromisoformat(day),
+                 total_amount=Decimal(100 + n), paid_amount=Decimal(n % 3 * 10), is_paid=False)
+            for n, (day, bill_no) in enumerate(self.BILLS)
+        ])
+        self.qs = reports.register_queryset()
+        self.ordered = list(self.qs.order_by(*reports.REGISTER_ORDER).values_list('id', flat=True))
+
+    def walk_forward(self, size=3):
+        pages, page = [], reports.register_page(self.qs, size=size)
+        while True:
+            pages.append(page)
+            if not page.older:
+                return pages
+            page = reports.register_page(self.qs, after=reports.parse_cursor(page.older), size=size)
+
+    def test_pages_cover_ties_in_order(self):
+        pages = self.walk_forward()
+        self.assertEqual([row.id for page in pages for row in page.rows], self.ordered)
+        self.assertEqual([len(page.rows) for page in pages], [3, 3, 3, 3, 1])
+        self.assertEqual((pages[0].newer, pages[-1].older), ('', ''))
+
+    def test_back_cursor_returns_the_same_pages(self):
+        pages = self.walk_forward()
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = reports.register_page(self.qs, before=reports.parse_cursor(page.newer), size=3)
+            self.assertEqual([row.id for row in page.rows], [row.id for row in expected.rows])
+        self.assertEqual(page.newer, '')
+
+    def test_subtotals_include_neighbouring_pages(self):
+        page = self.walk_forward()[2]   # the last of four 2026-03-01 bills, then two 2026-02-28 ones
+        self.assertEqual([row.date for row in page.rows], [date(2026, 3, 1)] + [date(2026, 2, 28)] * 2)
+        groups = reports.register_groups(self.qs, page.rows)
+
+        def sums(prefix):
+            bills = Bill.objects.filter(date__startswith=prefix)
+            return bills.count(), sum(b.total_amount for b in bills), sum(b.remaining for b in bills)
+
+        def picked(row):
+            return row['count'], row['total'], row['remaining']
+
+        self.assertEqual([(month, picked(month_sums)) for month, month_sums, _ in groups],
+                         [(date(2026, 3, 1), sums('2026-03')), (date(2026, 2, 1), sums('2026-02'))])
+        days = [day for _, _, month_days in groups for day in month_days]
+        self.assertEqual([(day, len(rows), picked(day_sums)) for day, day_sums, rows in days], [
+            (date(2026, 3, 1), 1, sums('2026-03-01')),
+            (date(2026, 2, 28), 2, sums('2026-02-28')),
+        ])
+        self.assertEqual(picked(groups[0][1])[0], 7)   # the whole month, not the page's one March bill
+
+
+class VerifyLedgerTest(TestCase):
+    def setUp(self):
+        self.customer = make_customer('Ravi')
+        self.bill = make_bill(self.customer, quantity=2, rate='50', paid='40', description='Rice')
+        self.report = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'drift.csv'
+
+    def verify(self, **opts):
+        call_command('verify_ledger', workers=1, csv=str(self.report), stdout=StringIO(), **opts)
+
+    def test_fix_repairs_corrupted_paid_amount(self):
+        Bill.objects.filter(id=self.bill.id).update(paid_amount=Decimal('100'), is_paid=True)
+        with self.assertRaisesMessage(CommandError, '--fix'):
+            self.verify()
+        self.assertIn(str(self.bill.id), self.report.read_text())
+
+        self.verify(fix=True)
+        self.bill.refresh_from_db()
+        self.customer.refresh_from_db()
+        self.assertEqual((self.bill.paid_amount, self.bill.is_paid), (Decimal('40'), False))
+        self.assertEqual((self.customer.total_amount, self.customer.paid_amount, self.customer.remaining_amount),
+                         (Decimal('100'), Decimal('40'), Decimal('60')))
+        adjustment = LedgerEntry.objects.get(bill=self.bill, kind=LedgerEntry.ADJUSTMENT)
+        self.assertEqual(adjustment.credit, Decimal('-60'))
+        self.assertEqual(check_bills()[0], [])
+        self.verify()   # clean now: no CommandError
+
+    def test_model_and_checker_agree_on_paid(self):
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        self.client.post(f'/bill/{self.bill.id}/return/', {'amount': '10', 'note': 'torn'})
+        Payment.objects.create(bill=self.bill, amount=Decimal('5'))
+        self.bill.refresh_from_db()
+        self.assertEqual((self.bill.returned_amount, self.bill.paid_amount), (Decimal('10'), Decimal('45')))
+        self.assertEqual(check_bills()[0], [])
+
+    def test_report_defaults_to_stdout(self):
+        Bill.objects.filter(id=self.bill.id).update(paid_amount=Decimal('1'))
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('verify_ledger', workers=1, stdout=out)
+        self.assertIn(str(self.bill.id), out.getvalue())
+
+
+class BackupChainTest(SimpleTestCase):
+    def setUp(self):
+        folder = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.source, self.snapshots, self.target = folder / 'live.sqlite3', folder / 'backups', folder / 'restored.sqlite3'
+        self.enterContext(mock.patch('bills.backup.database_path', return_value=self.source))
+        with closing(sqlite3.connect(self.source)) as db, db:
+            db.execute("CREATE TABLE bill (id INTEGER PRIMARY KEY, note TEXT)")
+            db.executemany("INSERT INTO bill (note) VALUES (?)", [(f"bill {n} " * 20,) for n in range(2000)])
+
+    def dump(self, path):
+        with closing(sqlite3.connect(path)) as db:
+            return list(db.iterdump())
+
+    def test_full_and_deltas_restore_to_the_source(self):
+        full = backup.run_backup(self.snapshots, full=True, compression='gzip')
+        with closing(sqlite3.connect(self.source)) as db, db:
+            db.execute("UPDATE bill SET note = 'edited' WHERE id % 500 = 0")
+            db.execute("DELETE FROM bill WHERE id > 1800")
+        first = backup.run_backup(self.snapshots, compression='gzip')
+        with closing(sqlite3.connect(self.source)) as db, db:
+            db.executemany("INSERT INTO bill (note) VALUES (?)", [(f"new {n} " * 30,) for n in range(1500)])
+        second = backup.run_backup(self.snapshots, compression='gzip')
+
+        self.assertEqual([full['kind'], first['kind'], second['kind']], ['full', 'delta', 'delta'])
+        self.assertTrue(all(r['verified'] for r in (full, first, second)))
+        self.assertLess(first['changed_pages'], first['pages'])
+        self.assertEqual(len(backup.chains(self.snapshots)), 1)
+
+        backup.restore(self.snapshots / second['file'], self.target)
+        self.assertEqual(backup.integrity_check(self.target), 'ok')
+        self.assertEqual(self.dump(self.target), self.dump(self.source))
+
+
+class BillAdminTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('owner', password='pw'))
+        self.customer = make_customer('Ravi')
+        self.bills = [make_bill(self.customer, rate, bill_no=n) for n, rate in ((21, '100'), (22, '40'))]
+        make_bill(make_customer('Rani'), '70', bill_no=23)
+
+    def test_search_uses_bill_no_and_name_prefix(self):
+        def found(q):
+            response = self.client.get('/admin/bills/bill/', {'q': q})
+            return sorted(bill.bill_no for bill in response.context['cl'].result_list)
+        self.assertEqual((found('22'), found('Ran'), found('ravi'), found('avi')), ([22], [23], [21, 22], []))
+
+    def test_unfiltered_count_uses_the_planner_estimate(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("DELETE FROM sqlite_stat1 WHERE tbl = 'bills_bill'")
+            cursor.execute("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES ('bills_bill', NULL, '250000')")
+        bills = Bill.objects.order_by('id')
+        self.assertEqual(admin.EstimatedCountPaginator(bills, 50).count, 250000)
+        self.assertEqual(admin.EstimatedCountPaginator(bills.filter(customer=self.customer), 50).count, 2)
+
+    def test_mark_paid_action(self):
+        response = self.client.post('/admin/bills/bill/', {
+            'action': 'mark_paid', '_selected_action': [bill.id for bill in self.bills],
+        }, follow=True)
+        self.assertContains(response, 'Marked 2 bill(s) paid (₹140.00); 0 already paid.')
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.paid_amount, self.customer.remaining_amount), (Decimal('140'), Decimal('0')))
+
+
+class ReportRowsTest(TestCase):
+    def setUp(self):
+        self.customer = make_customer('Lata')
+        self.bill = make_bill(self.customer, date=date(2026, 3, 2), description='Oil')
+        Payment.objects.create(bill=self.bill, amount=Decimal('40'), date=date(2026, 3, 3), note='cash')
+        Payment.objects.create(bill=self.bill, amount=Decimal('-10'), date=date(2026, 3, 4))
+        Bill.objects.create(customer=self.customer, customer_name='Lata', bill_no=0, date=date(2026, 3, 1))
+
+    def test_statement_rows(self):
+        rows = list(reports.statement_rows(reports.statement_queryset('Lata')))
+        self.assertEqual(rows[0], reports.StatementRow(self.bill.id, date(2026, 3, 2), 'Lata', self.bill.bill_no,
+                                                       Decimal('100'), Decimal('40'), Decimal('10'), Decimal('50')))
+        self.assertEqual(rows[1][4:], (Decimal('0'),) * 4)   # no items, payments or returns
+        self.assertEqual(reports.statement_totals(rows), {
+            'total_amount': Decimal('100'), 'total_paid': Decimal('40'),
+            'total_returns': Decimal('10'), 'total_remaining': Decimal('50'),
+        })
+
+    def test_customer_bill_rows(self):
+        rows = async_to_sync(reports.acustomer_bill_rows)(self.customer)
+        self.assertEqual([row.id for row in rows], [self.bill.id, self.bill.id + 1])
+        self.assertEqual(rows[0].remaining_amount, Decimal('50'))
+        self.assertEqual(rows[0].payment_list, [
+            reports.LedgerLine(date(2026, 3, 3), Decimal('40'), 'cash'),
+            reports.LedgerLine(date(2026, 3, 4), Decimal('-10'), None),
+        ])
+        self.assertEqual((rows[1].payment_list, rows[1].return_list), ([], []))
+
+
+class AsyncStatementViewTest(TestCase):
+    def setUp(self):
+        caches['ledger'].clear()
+        self.user = User.objects.create_user('clerk', password='pw')
+        customer = make_customer('Lata')
+        bill = make_bill(customer, '80', date=date(2026, 3, 2), bill_no=11, paid='30')
+        Payment.objects.create(bill=bill, amount=Decimal('-10'), note='Return: damaged')   # as return_bill records it
+        make_bill(customer, '25', date=date(2026, 3, 9), bill_no=12)
+        make_bill(make_customer('Mohan'), '60', date=date(2026, 3, 5), bill_no=13)
+
+    async def rows(self, **params):
+        response = await self.async_client.get('/customer-statement/', {'customer_name': 'Lata', **params})
+        cells = [re.findall(r'<td[^>]*>(?:<b>)?(.*?)(?:</b>)?</td>', tr)
+                 for tr in re.findall(r'<tr>(.*?)</tr>', response.content.decode(), re.S)]
+        return response['X-Ledger-Cache'], [row for row in cells if len(row) == 7]
+
+    async def test_rows_newest_first_then_cached_until_a_payment(self):
+        await self.async_client.aforce_login(self.user)
+        self.assertEqual(await self.rows(), ('miss', [
+            ['09 Mar 2026', 'Lata', '12', '₹0.00', '₹0.00', '₹25.00', '₹25.00'],
+            ['02 Mar 2026', 'Lata', '11', '₹10.00', '₹30.00', '₹80.00', '₹40.00'],
+        ]))
+        self.assertEqual((await self.rows())[0], 'hit')
+        _, rows = await self.rows(**{'from': '2026-03-05'})
+        self.assertEqual([row[2] for row in rows], ['12'])
+
+        bill = await Bill.objects.aget(bill_no=12)
+        await sync_to_async(Payment.objects.create)(bill=bill, amount=Decimal('25'), date=date(2026, 3, 10))
+        cache, rows = await self.rows()
+        self.assertEqual((cache, rows[0][-1]), ('miss', '₹0.00'))
+
+
+@override_settings(SYNC_TOKEN='secret', SYNC_TERMINAL_ID='')
+class CloseYearTest(TestCase):
+    def setUp(self):
+        caches['ledger'].clear()
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        BillingSettings.objects.create(financial_year_start='01-04-2025', financial_year_end='31-03-2026',
+                                       lock_date='31-03-2025', system_date='01-04-2026')
+        self.customer = make_customer('Hari')
+        old = make_bill(self.customer, date=date(2026, 3, 10))
+        Payment.objects.create(bill=old, amount=Decimal('30'), date=date(2026, 3, 12))
+        make_bill(self.customer, '50', date=date(2026, 4, 5))
+        self.walk_in = make_bill(customer_name='Sita', rate='40', date=date(2026, 3, 15))
+        self.archived_ids = [old.sync_id, self.walk_in.sync_id]
+
+    def remaining(self, **params):
+        response = self.client.get('/customer-monthly-statement/', {'customer_name': 'Hari', **params})
+        footer = re.search(r'<tfoot>.*?</tfoot>', response.content.decode(), re.S).group()
+        return Decimal(re.findall(r'₹([\d.]+)', footer)[-1])
+
+    def test_statement_due_is_unchanged_by_close(self):
+        ranges = [{}, {'start_date': '2026-03-01', 'end_date': '2026-04-30'},
+                  {'start_date': '2026-04-01', 'end_date': '2026-04-30'}]
+        self.assertEqual([self.remaining(**r) for r in ranges[:2]], [Decimal('120')] * 2)
+        archive.close_year(log=lambda msg: None)
+
+        opening = Bill.objects.get(customer=self.customer, carried_forward=True)
+        self.assertEqual((opening.date, opening.total_amount), (date(2026, 4, 1), Decimal('70')))
+        self.assertEqual([self.remaining(**r) for r in ranges], [Decimal('120')] * 3)
+        rows = reports.statement_rows(reports.statement_queryset('Hari'))
+        self.assertNotIn(opening.id, [row.id for row in rows])
+
+    def test_walk_in_due_carried_and_archived_bills_deleted_from_feed(self):
+        notes = []
+        archive.close_year(log=notes.append)
+        carried = Bill.objects.get(customer__isnull=True, carried_forward=True)
+        self.assertEqual((carried.customer_name, carried.total_amount), ('Sita', Decimal('40')))
+        self.assertTrue(any('Sita' in note for note in notes))
+        deleted = ChangeLog.objects.filter(model='bill', op=ChangeLog.DELETE).values_list('sync_id', flat=True)
+        self.assertCountEqual(deleted, self.archived_ids)
+
+
+class ProfilerMiddlewareTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('owner', password='pw', is_staff=True)
+        Bill.objects.create(customer=Customer.objects.create(name='Usha'), bill_no=0)
+
+    def test_async_capable_without_adapters(self):
+        async def view(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(ProfilerMiddleware(view)))
+        self.assertFalse(iscoroutinefunction(ProfilerMiddleware(lambda request: HttpResponse())))
+        with override_settings(PROFILER_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+            ProfilerMiddleware(view)
+
+    async def test_async_view_is_profiled_for_staff(self):
+        await self.async_client.aforce_login(self.staff)
+        plain = await self.async_client.get('/customer-statement/', {'customer_name': 'Usha'})
+        self.assertNotIn('X-Profile-Id', plain)
+        profiled = await self.async_client.get('/customer-statement/', {'customer_name': 'Usha', '_profile': '1'})
+        self.assertEqual(profiled.status_code, 200)
+        profile = await RequestProfile.objects.aget(id=profiled['X-Profile-Id'])
+        self.assertEqual((profile.path.split('?')[0], profile.user_id), ('/customer-statement/', self.staff.id))
+        self.assertGreater(profile.sql_count, 0)
+
+    def test_sync_view_is_profiled_for_staff(self):
+        self.client.force_login(self.staff)
+        customer = Customer.objects.get(name='Usha')
+        response = self.client.get(f'/customer/{customer.id}/', {'_profile': '1'})
+        profile = RequestProfile.objects.get(id=response['X-Profile-Id'])
+        self.assertEqual((profile.status, profile.user_id), (200, self.staff.id))
+        self.assertGreater(profile.sql_count, 0)
+
+
+@override_settings(REPLICA_ALIAS='default')   # any alias in DATABASES switches the middleware on
+class RecentWritesMiddlewareTest(TestCase):
+    async def test_async_view_writes_reach_the_session(self):
+        customer = await Customer.objects.acreate(name='Kamal')
+
+        async def view(request):
+            await sync_to_async(Customer.bump_ledger_version)(customer.id)
+            return HttpResponse()
+
+        middleware = RecentWritesMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.session = {}
+        await middleware(request)
+        self.assertEqual(list(request.session[replica.SESSION_KEY]), ['kamal'])
+
+    def test_sync_view_writes_reach_the_session(self):
+        customer = Customer.objects.create(name='Kamal')
+        middleware = RecentWritesMiddleware(lambda request: Customer.bump_ledger_version(customer.id) or HttpResponse())
+        request = RequestFactory().get('/')
+        request.session = {}
+        middleware(request)
+        self.assertEqual(list(request.session[replica.SESSION_KEY]), ['kamal'])
+
+
+@override_settings(GST_STATE_CODE='08', GST_B2CL_LIMIT=1000)
+class GstTest(TestCase):
+    def bill(self, state, gstin='', *lines):
+        customer = make_customer(f'{state}-{gstin or "walk-in"}-{Customer.objects.count()}',
+                                 state_code=state, gstin=gstin)
+        bill = Bill.objects.create(customer=customer, bill_no=0, date=date(2026, 5, 10))
+        for hsn, quantity, rate, gst_rate in lines:
+            BillItem.objects.create(bill=bill, description=hsn, hsn_code=hsn, quantity=quantity,
+                                    rate=Decimal(rate), gst_rate=Decimal(gst_rate))
+        bill.refresh_from_db()
+        return bill
+
+    def test_split_tax(self):
+        self.assertEqual(gst.split_tax(Decimal('100'), 18, False), (Decimal('9'), Decimal('9'), Decimal('0')))
+        self.assertEqual(gst.split_tax(Decimal('100'), 18, True), (Decimal('0'), Decimal('0'), Decimal('18')))
+        # Each half rounds on its own: 0.2625 -> 0.26 twice, against 0.525 -> 0.53 as IGST
+        self.assertEqual(gst.split_tax(Decimal('10.50'), 5, False), (Decimal('0.26'), Decimal('0.26'), Decimal('0')))
+        self.assertEqual(gst.split_tax(Decimal('10.50'), 5, True)[2], Decimal('0.53'))
+        self.assertEqual(gst.split_tax(Decimal('10.50'), 0, True), (Decimal('0'),) * 3)
+
+    def test_bill_taxes_follow_place_of_supply(self):
+        home = self.bill('08', '', ('1006', 2, '50', '5'))
+        away = self.bill('27', '', ('1006', 2, '50', '5'))
+        self.assertEqual((home.cgst_amount, home.sgst_amount, home.igst_amount, home.total_amount),
+                         (Decimal('2.5'), Decimal('2.5'), Decimal('0'), Decimal('105')))
+        self.assertEqual((away.cgst_amount, away.igst_amount, away.total_amount),
+                         (Decimal('0'), Decimal('5'), Decimal('105')))
+
+    def test_gstr1_sections_and_totals(self):
+        self.bill('08', '08ABCDE1234F1Z5', ('5208', 10, '100', '18'))      # registered: B2B
+        self.bill('27', '', ('6109', 20, '100', '12'))                     # inter-state over the limit: B2CL
+        self.bill('08', '', ('1006', 1, '100', '5'), ('1006', 2, '100', '5'), ('2106', 1, '50', '18'))
+        self.bill('08', '', ('1006', 1, '10.50', '5'))
+        report = gst.gstr1(date(2026, 5, 1), date(2026, 5, 31))
+
+        self.assertEqual([(r['taxable'], r['cgst'], r['igst']) for r in report['b2b']], [(1000.0, 90.0, 0.0)])
+        self.assertEqual([(r['invoice_value'], r['igst']) for r in report['b2cl']], [(2240.0, 240.0)])
+        self.assertEqual(sorted((r['rate'], r['taxable'], r['cgst'], r['sgst']) for r in report['b2cs']),
+                         [(5.0, 310.5, 7.76, 7.76), (18.0, 50.0, 4.5, 4.5)])
+        self.assertEqual({r['hsn']: r['quantity'] for r in report['hsn']},
+                         {'5208': 10, '6109': 20, '1006': 4, '2106': 1})
+
+        sections = report['b2b'] + report['b2cl'] + report['b2cs']
+        for column in gst.MONEY_COLUMNS:
+            stored = BillItem.objects.aggregate(s=Sum({'taxable': 'total'}.get(column, column)))['s']
+            self.assertAlmostEqual(sum(r[column] for r in sections), float(stored), places=2)
+            self.assertAlmostEqual(sum(r[column] for r in report['hsn']), float(stored), places=2)
+
+
+class AddItemsValidationTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        self.bill = make_bill(make_customer('Nisha'), '40', description='Rice')
+
+    def post(self, **line):
+        item = {'description': 'Tea', 'quantity': 1, 'rate': 10, **line}
+        return self.client.post(f'/add-items/{self.bill.id}/', json.dumps({'items': [item]}),
+                                content_type='application/json')
+
+    def test_bad_lines_are_rejected(self):
+        for line in ({'gst_rate': 7}, {'gst_rate': 'high'}, {'quantity': 'two'}, {'quantity': 0},
+                     {'quantity': 1.5}, {'quantity': True}, {'rate': 'abc'}):
+            response = self.post(**line)
+            self.assertEqual(response.status_code, 400, line)
+            self.assertFalse(response.json()['success'])
+        self.assertEqual(list(self.bill.items.values_list('description', flat=True)), ['Rice'])
+
+    def test_valid_line_is_saved(self):
+        response = self.post(quantity='2', gst_rate='18.00', rate='12.5')
+        self.assertTrue(response.json()['success'])
+        item = self.bill.items.get()
+        self.assertEqual((item.description, item.quantity, item.gst_rate), ('Tea', 2, Decimal('18')))
+        self.assertEqual((item.total, item.cgst, item.sgst), (Decimal('25'), Decimal('2.25'), Decimal('2.25')))
+
+
+class AnalyticsSummaryTest(TestCase):
+    def setUp(self):
+        analytics._facts = None   # ids are reused after a test's rollback, so the journal stamp can repeat
+        self.asha = make_customer('Asha')
+        first = make_bill(self.asha, date=date(2026, 1, 5), returned='10')           # Monday
+        Payment.objects.create(bill=first, amount=Decimal('60'), date=date(2026, 1, 10))   # Saturday
+        self.unpaid = make_bill(self.asha, '200', date=date(2026, 2, 2))               # Monday
+        self.bina = make_customer('Bina')
+        second = make_bill(self.bina, '50', date=date(2026, 1, 6))                     # Tuesday
+        Payment.objects.create(bill=second, amount=Decimal('50'), date=date(2026, 2, 3))   # Tuesday
+
+    def test_totals(self):
+        report = analytics.summary()
+        self.assertEqual((report['bills'], report['payments']), (3, 2))
+        self.assertEqual(report['monthly'], [
+            {'month': '2026-01', 'billed': 140.0, 'collected': 60.0, 'efficiency': 42.9},
+            {'month': '2026-02', 'billed': 200.0, 'collected': 50.0, 'efficiency': 25.0},
+        ])
+        self.assertEqual([(c['name'], c['billed'], c['paid'], c['outstanding']) for c in report['top_customers']],
+                         [('Asha', 290.0, 60.0, 230.0), ('Bina', 50.0, 50.0, 0.0)])
+        days = {d['day']: (d['bills'], d['billed'], d['collected']) for d in report['weekdays']}
+        self.assertEqual((days['Mon'], days['Tue'], days['Sat']), ((2, 290.0, 0.0), (1, 50.0, 50.0), (0, 0.0, 60.0)))
+        self.assertEqual(analytics.summary(limit=1)['top_customers'][0]['name'], 'Asha')
+
+    def test_reloads_after_a_write(self):
+        before = analytics.summary()['payments']
+        Payment.objects.create(bill=self.unpaid, amount=Decimal('20'))
+        self.assertEqual(analytics.summary()['payments'], before + 1)
+
+
+@override_settings(PRINT_RETURNS_PER_PAGE=2)
+class TwoInvoicesViewTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        self.customer = make_customer('Kiran')
+        self.bills = [make_bill(self.customer, '500', date=date(2026, 3, day)) for day in (1, 2, 3)]
+        for n in range(5):
+            BillReturn.objects.create(bill=self.bills[n % 3], amount=Decimal(n + 1), note=f'r{n}',
+                                      date=timezone.make_aware(datetime(2026, 3, 10 + n)))
+
+    def get(self, **params):
+        response = self.client.get(f'/customer/{self.customer.id}/two-invoices/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_chosen_bills_and_return_page(self):
+        ctx = self.get(bills=[self.bills[0].id, self.bills[2].id], page=2)
+        self.assertEqual([i['bill'].id for i in ctx['invoices']], [self.bills[2].id, self.bills[0].id])
+        # Newest first: r4 r3 | r2 r1 | r0
+        self.assertEqual([line['desc'] for line in ctx['rk_lines']], [
+            f'Return - Bill #{self.bills[2].bill_no} (r2)', f'Return - Bill #{self.bills[1].bill_no} (r1)',
+        ])
+        self.assertEqual(ctx['rk_total'], Decimal('15'))
+        self.assertEqual((ctx['rk_page'].number, ctx['rk_page'].paginator.num_pages), (2, 3))
+        self.assertNotIn('page', ctx['base_query'])
+        self.assertEqual(ctx['base_query'].count('bills='), 2)
+
+    def test_defaults_to_latest_bill_and_clamps_page(self):
+        ctx = self.get(page=99)
+        self.assertEqual([i['bill'].id for i in ctx['invoices']], [self.bills[2].id])
+        self.assertEqual([line['amount'] for line in ctx['rk_lines']], [Decimal('1')])
+
+
+@override_settings(SYNC_TOKEN='secret', SYNC_TERMINAL_ID='')
+class PropagateCustomerTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        self.customer = make_customer('Old Name', *[{}] * 3, phone='111')
+        ArchivedBill.objects.create(id=10_000, financial_year='2024-25', customer=self.customer,
+                                    customer_name='Old Name', phone='111', date=date(2025, 3, 1), bill_no=5)
+
+    def test_rename_queues_one_job_and_rewrites_bills(self):
+        for _ in range(2):
+            self.client.post(f'/edit-customer/{self.customer.id}/', {'name': 'New Name', 'phone': '222'})
+            self.client.post(f'/edit-customer/{self.customer.id}/', {'name': 'New Name 2', 'phone': '222'})
+        queued = Job.objects.filter(kind='propagate_customer', payload__customer_id=self.customer.id)
+        self.assertEqual(queued.count(), 1)
+
+        version = Customer.objects.get(id=self.customer.id).ledger_version
+        ChangeLog.objects.all().delete()
+        notes = []
+        report = bulk.propagate_customer(self.customer.id, chunk_size=2, progress=lambda p, note: notes.append(note))
+
+        self.assertEqual(report, {'bills': 3, 'archived': 1})
+        self.assertEqual(notes, ['2/4 bills updated', '3/4 bills updated', '4/4 bills updated'])
+        self.assertEqual(set(Bill.objects.values_list('customer_name', 'phone')), {('New Name 2', '222')})
+        self.assertEqual(ArchivedBill.objects.get().customer_name, 'New Name 2')
+        self.assertGreater(Customer.objects.get(id=self.customer.id).ledger_version, version)
+        self.assertEqual(ChangeLog.objects.filter(model='bill', op=ChangeLog.UPSERT).count(), 3)
+        self.assertEqual(bulk.propagate_customer(self.customer.id), {'bills': 0, 'archived': 0})
+
+
+@override_settings(RECEIPT_COLUMNS=32, RECEIPT_COPIES=2, RECEIPT_ENCODING='cp437')
+class ReceiptBytesTest(TestCase):
+    def setUp(self):
+        caches['ledger'].clear()
+        self.bill = make_bill(make_customer('Farida Begum Traders', phone='9988'), '50', quantity=2,
+                              description='Basmati rice 5 kg premium long grain', bill_no=7, date=date(2026, 5, 1),
+                              packing_qty=1, packing_rate=Decimal('15'))
+        self.bill.update_total()
+
+    def receipt(self):
+        return receipt.receipt_bytes(Bill.objects.select_related('customer').get(id=self.bill.id))
+
+    def text_lines(self, data):
+        plain = data
+        for command in (receipt.INIT, receipt.BOLD_ON, receipt.BOLD_OFF, receipt.DOUBLE, receipt.NORMAL,
+                        receipt.CUT, *receipt.ALIGN.values()):
+            plain = plain.replace(command, b'')
+        return plain.decode('cp437').splitlines()
+
+    def test_layout(self):
+        data, cached = self.receipt()
+        self.assertFalse(cached)
+        self.assertTrue(data.startswith(receipt.INIT))
+        self.assertEqual(data.count(receipt.CUT), 2)
+        self.assertTrue(data.endswith(receipt.CUT))
+        self.assertIn(receipt.DOUBLE + b'TOTAL', data)
+
+        lines = self.text_lines(data)
+        self.assertEqual([line for line in lines if line in receipt.TITLES], list(receipt.TITLES))
+        self.assertTrue(all(len(line) <= 32 for line in lines))
+        self.assertEqual(lines[:len(lines) // 2], [
+            'ESTIMATE',
+            'Farida Begum Traders       No: 7',
+            '9988            Date: 01-05-2026',
+            '-' * 32,
+            'Basmati rice 5 kg premium long',     # wrapped at the paper width
+            'grain',
+            '  2 x 50.00               100.00',
+            '-' * 32,
+            'Subtotal                  100.00',
+            'Packing (1 x 15.00)        15.00',
+            'TOTAL     115.00',                   # double width: half the columns
+            'Balance                   115.00',
+        ])
+
+    def test_cached_until_a_payment(self):
+        first, _ = self.receipt()
+        self.assertEqual(self.receipt(), (first, True))
+        Payment.objects.create(bill=self.bill, amount=Decimal('40'))
+        data, cached = self.receipt()
+        self.assertFalse(cached)
+        self.assertIn('Paid                       40.00', self.text_lines(data))
+
+
+@override_settings(DB_MAINTENANCE_STEP_SLEEP=0)
+class MaintenanceTest(SimpleTestCase):
+    def setUp(self):
+        self.path = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'live.sqlite3'
+        self.enterContext(mock.patch('bills.maintenance.database_path', return_value=self.path))
+
+    def seed(self, auto_vacuum):
+        with closing(sqlite3.connect(self.path)) as db:
+            db.execute(f'PRAGMA auto_vacuum = {auto_vacuum}')
+            with db:
+                db.execute("CREATE TABLE bill (id INTEGER PRIMARY KEY, note TEXT)")
+                db.execute("CREATE INDEX bill_note ON bill (note)")
+                db.executemany("INSERT INTO bill (note) VALUES (?)", [(f"bill {n} " * 20,) for n in range(3000)])
+                db.execute("DELETE FROM bill WHERE id > 1000")
+
+    def test_run_releases_free_pages_and_reports_sizes(self):
+        self.seed('INCREMENTAL')
+        notes = []
+        report = maintenance.run_maintenance(budget=60, progress=lambda p, note: notes.append(note))
+
+        steps = {name: step['result'] for name, step in report['steps'].items()}
+        self.assertEqual(steps['analyze'], 'analyzed')
+        self.assertEqual(steps['integrity'], 'ok')
+        self.assertRegex(steps['vacuum'], r'^released \d+ free pages$')   # ANALYZE's stat tables reuse a few
+        self.assertGreater(report['before']['free_pages'], 0)
+        self.assertEqual((report['free_pages'], report['auto_vacuum']), (0, 'incremental'))
+        self.assertLess(report['pages'], report['before']['pages'])
+        self.assertEqual(notes, ['analyze: done', 'vacuum: done', 'integrity: done'])
+        bill = next(t for t in report['tables'] if t['table'] == 'bill')
+        self.assertEqual(bill['rows'], 1000)
+
+    def test_spent_budget_skips_every_step(self):
+        self.seed('INCREMENTAL')
+        report = maintenance.run_maintenance(budget=0)
+        self.assertEqual({step['result'] for step in report['steps'].values()}, {'skipped: time budget used up'})
+        self.assertGreater(report['free_pages'], 0)
+
+    def test_vacuum_needs_convert_outside_incremental_mode(self):
+        self.seed('NONE')
+        report = maintenance.run_maintenance(budget=60)
+        self.assertIn('--convert', report['steps']['vacuum']['result'])
+        converted = maintenance.run_maintenance(budget=60, convert=True)
+        self.assertEqual(converted['steps']['vacuum']['result'],
+                         'converted auto_vacuum none → incremental (full VACUUM)')
+        self.assertEqual((converted['auto_vacuum'], converted['free_pages']), ('incremental', 0))
+
+    @override_settings(DB_MAINTENANCE_WINDOW=(22, 5))
+    def test_window_wraps_midnight(self):
+        at = [timezone.make_aware(datetime(2026, 5, 1, hour)) for hour in (23, 3, 12)]
+        self.assertEqual([maintenance.in_window(t) for t in at], [True, True, False])
+        self.assertEqual(maintenance.next_window(at[2]), timezone.make_aware(datetime(2026, 5, 1, 22)))
+
+
+class ProductLookupTest(TestCase):
+    def setUp(self):
+        for code, name in [('M8', 'SS Bolt M8'), ('M8W', 'Washer M8'), ('B10', 'Brass Bolt 10mm'), ('OLD', 'Old Bolt')]:
+            Product.objects.create(code=code, name=name, default_rate=Decimal('2.50'), active=code != 'OLD')
+        catalog.invalidate()
+
+    def codes(self, prefix, limit=10):
+        return [p['code'] for p in catalog.lookup(prefix, limit)]
+
+    def test_prefix_matches_code_name_and_words(self):
+        self.assertEqual(self.codes('bolt'), ['B10', 'M8'])      # inactive "Old Bolt" is not indexed
+        self.assertEqual(self.codes('ss b'), ['M8'])
+        self.assertEqual(self.codes('m8'), ['M8', 'M8W'])        # exact code first
+        self.assertEqual(self.codes('  '), [])
+        self.assertEqual(len(self.codes('m', limit=1)), 1)
+
+    def test_edit_rebuilds_the_index(self):
+        self.assertEqual(self.codes('nut'), [])
+        washer = Product.objects.get(code='M8W')
+        washer.name = 'Nut M8'
+        washer.save()
+        self.assertEqual(self.codes('nut'), ['M8W'])
+        self.assertEqual(self.codes('washer'), [])
+
+    def test_view_returns_rates_as_strings(self):
+        self.client.force_login(User.objects.create_user('clerk'))
+        data = self.client.get('/products/lookup/', {'q': 'brass'}).json()
+        self.assertEqual([(p['code'], p['default_rate'], p['unit']) for p in data['results']], [('B10', '2.50', 'pcs')])
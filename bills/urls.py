@@ -17,13 +17,17 @@ urlpatterns = [
     path('add-items/<int:bill_id>/generate/', views.add_items_generate, name='add_items_generate'),
     path('bill/<int:bill_id>/', views.bill_detail, name='bill_detail'),
     path('generate-bill/<int:bill_id>/', views.generate_bill, name='generate_bill'), # invoice print page
+    path('bill/<int:bill_id>/receipt/', views.bill_receipt, name='bill_receipt'),       # ESC/POS bytes (download)
+    path('bill/<int:bill_id>/receipt/print/', views.print_receipt, name='print_receipt'),
 
     # Customers
     path('add-customer/', views.add_customer, name='add_customer'),
     path('view-customers/', views.view_customers, name='view_customers'),
     path('customer/<int:customer_id>/', views.customer_detail, name='customer_detail'),
+    path('customer/<int:customer_id>/balance/', views.customer_balance, name='customer_balance'),
     path('edit-customer/<int:customer_id>/', views.edit_customer, name='edit_customer'),
     path('delete-customer/<int:customer_id>/', views.delete_customer, name='delete_customer'),
+    path('customers/dedupe/', views.customer_dedupe, name='customer_dedupe'),               # staff: merge duplicates
 
     # Goods Return
     path("bill/<int:bill_id>/return/", views.return_bill, name="return_bill"),
@@ -34,14 +38,52 @@ urlpatterns = [
     # Delete Bill
     path('bill/delete/<int:bill_id>/', views.delete_bill, name='delete_bill'),
 
+    # Bulk actions on selected bills
+    path('customer/<int:customer_id>/bills/bulk/', views.bulk_bill_action, name='bulk_bill_action'),
+
     # Dual Invoice layout
     path("customer/<int:customer_id>/two-invoices/", views.two_invoices_view, name="two_invoices"),
 
     # Reports
     path('customer-statement/', views.customer_statement, name='customer_statement'),
     path('customer-monthly-statement/', views.customer_monthly_statement, name='customer_monthly_statement'),
+    path('bills/register/', views.bill_register, name='bill_register'),              # all bills, day book
     path("bill/<int:bill_id>/pay/", views.pay_bill, name="pay_bill"),
     path("bill/<int:bill_id>/pay/", views.pay_bill, name="pay_bill"),
     path("bill/<int:bill_id>/return/", views.return_bill, name="return_bill"),
 
+    # Bank / UPI reconciliation (staff)
+    path('bank/', views.bank_statements, name='bank_statements'),
+    path('bank/<int:statement_id>/', views.bank_statement, name='bank_statement'),
+
+    # Background jobs
+    path('jobs/', views.jobs_list, name='jobs_list'),
+    path('jobs/new/<str:kind>/', views.enqueue_job, name='enqueue_job'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
+
+    # Request profiles (staff)
+    path('profiles/', views.profiles_view, name='profiles'),
+    path('profiles/<int:profile_id>/', views.profile_detail, name='profile_detail'),
+    path('profiles/<int:profile_id>/folded/', views.profile_download, name='profile_download'),
+
+    # Analytics
+    path('analytics/', views.analytics_dashboard, name='analytics'),
+    path('analytics/data/', views.analytics_json, name='analytics_json'),
+
+    # Offline POS sync (central server)
+    path('sync/pull/', views.sync_pull, name='sync_pull'),
+    path('sync/push/', views.sync_push, name='sync_push'),
+    path('sync/reserve/', views.sync_reserve, name='sync_reserve'),
+
+    # GST returns
+    path('gst/gstr1/', views.gstr1_export, name='gstr1_export'),
+
+    # Product master
+    path('products/lookup/', views.product_lookup, name='product_lookup'),
+    path('products/sales/', views.product_sales_view, name='product_sales'),
+
+    # Instrumentation
+    path('cache-stats/', views.cache_stats_view, name='cache_stats'),
+
 ]
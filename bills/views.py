@@ -1,8 +1,11 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponseBadRequest
-from django.db.models import Sum, Q, F
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, FileResponse, Http404
+from django.db.models import Sum, Q, F, Count, Value, Prefetch
+from django.db.models.functions import Coalesce
 from decimal import Decimal
+import csv
 import json
+import os
 from django.utils.dateparse import parse_date
 from django.db import IntegrityError, transaction
 from django.contrib.auth import authenticate, login, logout
@@ -10,7 +13,33 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.utils import timezone
-from .models import Customer, Bill, BillItem, Payment, BillReturn
+from django.urls import reverse
+from django.core.paginator import Paginator
+from django.conf import settings
+import time
+from .models import Customer, Bill, BillItem, Payment, BillReturn, ChangeLog, Job, Product, BillNumberBlock, RequestProfile, MergeProposal, BankStatement, BankLine
+from . import analytics, bulk, catalog, dedupe, gst, jobs, profiling, receipt, reconcile, sync
+from .cache import aget_or_build, astatement_stamp, make_key, stats as cache_stats
+from .archive import aneeds_archive
+from .query_guard import render_prefetched
+from .money import ZERO, parse_rupees, rupees
+from .replica import reads_from_replica
+from .reports import (
+    MONEY, statement_queryset, monthly_queryset, astatement_rows, statement_totals,
+    acustomer_bill_rows, invoice_context, product_sales,
+    parse_cursor, register_groups, register_page, register_queryset,
+)
+
+
+# ---------------------------------------
+# Async render helper
+# ---------------------------------------
+async def _arender(request, template_name, context):
+    # base.html reads request.user; resolve it here so the template never
+    # touches the DB synchronously from inside the event loop.
+    request.user = await request.auser()
+    return render(request, template_name, context)
+
 
 # ---------------------------------------
 # Create new bill
@@ -21,8 +50,11 @@ def create_bill(request):
     from datetime import datetime
 
     customers = Customer.objects.all().order_by('name')
-    last_bill = Bill.objects.order_by('-bill_no').first()
-    next_bill_no = 1 if not last_bill else last_bill.bill_no + 1
+    try:
+        next_bill_no = Bill.next_number()
+    except ValueError as exc:   # POS terminal with no reserved numbers left
+        messages.error(request, str(exc))
+        return redirect('home')
 
     # Default date = last invoice date OR today if no invoice
     last_invoice = Bill.objects.order_by('-date').first()
@@ -68,12 +100,14 @@ def create_bill(request):
                 f"उसके पहले की तारीख पर Bill नहीं बना सकते।"
             )
 
-        selected_customer = Customer.objects.filter(name=customer_name).first()
+        # Typed with other capitalisation → still the same customer (not a new orphan bill)
+        selected_customer = (Customer.objects.filter(name=customer_name).first()
+                             or Customer.objects.filter(name__iexact=customer_name).first())
         final_customer_name = selected_customer.name if selected_customer else customer_name
 
         bill = Bill.objects.create(
             customer=selected_customer,
-            bill_no=next_bill_no,
+            bill_no=Bill.next_number(consume=True),
             customer_name=final_customer_name,
             phone=phone,
             date=bill_date,
@@ -91,6 +125,28 @@ def create_bill(request):
 # ---------------------------------------
 # Add items to bill
 # ---------------------------------------
+def _item_line(item):
+    """(quantity, rate, gst_rate) of one posted line; ValueError names what is wrong with it."""
+    if not isinstance(item, dict):
+        raise ValueError("Each item must be an object.")
+    name = str(item.get("description") or "").strip() or "item"
+    quantity = item.get("quantity")
+    if isinstance(quantity, str) and quantity.strip().isdigit():
+        quantity = int(quantity)
+    elif isinstance(quantity, Decimal) and quantity == quantity.to_integral_value():
+        quantity = int(quantity)
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+        raise ValueError(f"{name}: quantity must be a whole number above 0.")
+    rate = parse_rupees(item.get("rate"), default=None)
+    if rate is None or rate < 0:
+        raise ValueError(f"{name}: rate must be an amount of 0 or more.")
+    try:
+        gst_rate = gst.parse_rate(item.get("gst_rate"))
+    except ValueError as exc:
+        raise ValueError(f"{name}: {exc}")
+    return quantity, rate, gst_rate
+
+
 @login_required
 def add_items(request, bill_id):
     bill = Bill.objects.get(id=bill_id)
@@ -102,7 +158,8 @@ def add_items(request, bill_id):
 
     # POST request (items submitted through JSON)
     if request.method == "POST" and request.headers.get("Content-Type") == "application/json":
-        data = json.loads(request.body.decode("utf-8"))
+        # Amounts as Decimal, never float
+        data = json.loads(request.body.decode("utf-8"), parse_float=Decimal)
         items = data.get("items", [])
 
         # 🚫 If no items added → delete bill + return error
@@ -113,35 +170,46 @@ def add_items(request, bill_id):
                 "message": "Bill cancelled because no items were added."
             })
 
-        packing_qty = data.get("packing_qty", 0)
-        packing_rate = data.get("packing_rate", 0)
+        try:
+            lines = [_item_line(item) for item in items]
+        except ValueError as exc:
+            return JsonResponse({"success": False, "message": str(exc)}, status=400)
+
+        packing_qty = int(data.get("packing_qty") or 0)
+        packing_rate = parse_rupees(data.get("packing_rate") or 0)
         packing_reason = data.get("packing_reason", "").strip()
         extra_reason = data.get("extra_reason", "").strip()
-        extra_amount = data.get("extra_amount", 0)
+        extra_amount = parse_rupees(data.get("extra_amount") or 0)
+
+        # Lines picked from the product master carry product_id (or a code)
+        ids = {int(i["product_id"]) for i in items if str(i.get("product_id") or "").isdigit()}
+        codes = {i["code"].strip() for i in items if (i.get("code") or "").strip()}
+        products = Product.objects.filter(Q(id__in=ids) | Q(code__in=codes)) if ids or codes else []
+        by_id = {p.id: p for p in products}
+        by_code = {p.code: p for p in by_id.values()}
 
-        # Update items list
+        # Update items list (a queryset delete skips BillItem.delete(), so log the removals here)
+        removed = list(BillItem.objects.filter(bill=bill).values_list("sync_id", flat=True))
         BillItem.objects.filter(bill=bill).delete()
-        for item in items:
+        ChangeLog.record_many(BillItem, removed, ChangeLog.DELETE)
+        for item, (quantity, rate, gst_rate) in zip(items, lines):
+            pid = str(item.get("product_id") or "")
+            product = by_id.get(int(pid)) if pid.isdigit() else by_code.get((item.get("code") or "").strip())
             BillItem.objects.create(
                 bill=bill,
-                description=item["description"],
-                quantity=item["quantity"],
-                rate=item["rate"],
-                total=item["total"],
+                product=product,
+                hsn_code=str(item.get("hsn_code") or "").strip(),
+                gst_rate=gst_rate,
+                description=str(item.get("description") or "").strip(),
+                quantity=quantity,
+                rate=rate,
             )
 
-        subtotal = sum(i["total"] for i in items)
-        packing_total = packing_qty * packing_rate
-        final_total = subtotal + packing_total + extra_amount
-
-        bill.subtotal = subtotal
         bill.packing_qty = packing_qty
         bill.packing_rate = packing_rate
-        bill.packing_amount = packing_total
         bill.packing_reason = packing_reason if packing_reason else "Packing"
         bill.extra_reason = extra_reason
         bill.extra_amount = extra_amount
-        bill.final_amount = final_total
         bill.save()
 
         return JsonResponse({"success": True, "bill_id": bill.id})
@@ -149,125 +217,117 @@ def add_items(request, bill_id):
     return JsonResponse({"success": False})
 
 @login_required
-def customer_monthly_statement(request):
+@reads_from_replica(scope=lambda request: request.GET.get('customer_name', '').strip())
+async def customer_monthly_statement(request):
     customer_name = request.GET.get('customer_name', '').strip()
     start_date = request.GET.get('start_date', '')
     end_date = request.GET.get('end_date', '')
 
-    bills = []
-    total_amount = Decimal('0')
-    total_paid = Decimal('0')
-    total_returns_all = Decimal('0')
-
-    if customer_name or (start_date and end_date):
-        bills_qs = Bill.objects.all()
-
-        if customer_name:
-            bills_qs = bills_qs.filter(customer_name__icontains=customer_name)
-
-        if start_date and end_date:
-            bills_qs = bills_qs.filter(date__range=[start_date, end_date])
-
-        bills_qs = bills_qs.order_by("date")
-
-        # Get all returns of these bills only once (fast query)
-        returns_qs = BillReturn.objects.filter(bill__in=bills_qs)
-        returns_dict = {}
-        for r in returns_qs:
-            returns_dict.setdefault(r.bill_id, []).append(r)
-
-        for bill in bills_qs:
-            try:
-                bill.update_total()
-            except:
-                pass
-
-            base_total = Decimal(str(bill.total_amount or 0))
-
-            # Return total per bill
-            bill_returns = returns_dict.get(bill.id, [])
-            returns_total = sum((Decimal(str(r.amount)) for r in bill_returns), Decimal('0'))
-
-            # Positive paid only
-            paid = bill.payments.filter(amount__gt=0).aggregate(sum=Sum('amount'))['sum'] or Decimal('0')
-
-            # Real remaining
-            remaining = base_total - paid - returns_total
-            if remaining < 0:
-                remaining = Decimal('0')
-
-            # Assign display values
-            bill.total_display = base_total
-            bill.returns_total = returns_total
-            bill.positive_paid = paid
-            bill.remaining_display = remaining
-
-            bills.append(bill)
-
-            # Summary totals
-            total_amount += base_total
-            total_paid += paid
-            total_returns_all += returns_total
-
-    # Final remaining summary (important)
-    total_remaining = total_amount - total_paid - total_returns_all
-    if total_remaining < 0:
-        total_remaining = Decimal('0')
-
-    return render(request, 'customer_monthly_statement.html', {
-        'bills': bills,
+    bills_qs = monthly_queryset(customer_name, start_date, end_date)
+    # Ranges reaching before the current financial year also read the archive
+    use_archive = bool(customer_name or (start_date and end_date)) and await aneeds_archive(start_date)
+
+    async def build_rows():
+        rows = await astatement_rows(bills_qs)
+        if use_archive:
+            rows += await astatement_rows(monthly_queryset(customer_name, start_date, end_date, archived=True))
+            rows.sort(key=lambda r: r.date)
+        return {'bills': rows, **statement_totals(rows)}
+
+    async def build_html():
+        rows = (await aget_or_build('monthly.rows', key, build_rows))[0] if key else await build_rows()
+        return render_prefetched('customer_monthly_statement_table.html', rows)
+
+    stamp = await astatement_stamp(bills_qs) if customer_name else None
+    key = make_key('monthly', customer_name.lower(), start_date, end_date, use_archive, stamp) if stamp else None
+    if key:
+        table_html, hit = await aget_or_build('monthly.html', key, build_html)
+    else:
+        table_html, hit = await build_html(), False
+
+    response = await _arender(request, 'customer_monthly_statement.html', {
+        'table_html': table_html,
         'customer_name': customer_name,
         'start_date': start_date,
         'end_date': end_date,
-        'total_amount': total_amount,
-        'total_paid': total_paid,
-        'total_returns': total_returns_all,
-        'total_remaining': total_remaining
     })
+    response['X-Ledger-Cache'] = 'hit' if hit else 'miss'
+    return response
 def index(request):
     return render(request, 'index.html')
 # ---------------------------------------
 # Customer statement with date filter
 # ---------------------------------------
 @login_required
-def customer_statement(request):
+@reads_from_replica(scope=lambda request: request.GET.get('customer_name', '').strip())
+async def customer_statement(request):
     customer_name = request.GET.get('customer_name', '').strip()
     date_from = request.GET.get('from', '').strip()
     date_to = request.GET.get('to', '').strip()
 
-    qs = Bill.objects.all()
-
-    if customer_name:
-        qs = qs.filter(customer_name__icontains=customer_name)
+    bills_qs = statement_queryset(customer_name, date_from, date_to)
+    use_archive = await aneeds_archive(date_from)
 
-    if date_from:
-        qs = qs.filter(date__gte=date_from)
+    async def build_rows():
+        rows = await astatement_rows(bills_qs)
+        if use_archive:
+            rows += await astatement_rows(statement_queryset(customer_name, date_from, date_to, archived=True))
+            rows.sort(key=lambda r: (r.date, r.bill_no), reverse=True)
+        return rows
 
-    if date_to:
-        qs = qs.filter(date__lte=date_to)
+    async def build_html():
+        bills = (await aget_or_build('statement.rows', key, build_rows))[0] if key else await build_rows()
+        return render_prefetched('customer_statement_rows.html', {'bills': bills})
 
-    qs = qs.order_by('-date', '-bill_no')
+    stamp = await astatement_stamp(bills_qs) if customer_name else None
+    key = make_key('statement', customer_name.lower(), date_from, date_to, use_archive, stamp) if stamp else None
+    if key:
+        rows_html, hit = await aget_or_build('statement.html', key, build_html)
+    else:
+        rows_html, hit = await build_html(), False
 
-    bills = []
-    for b in qs:
-        total = Decimal(str(b.total_amount or 0))
-        positive_paid = b.payments.filter(amount__gt=0).aggregate(sum=Sum("amount"))['sum'] or Decimal('0')
-        returns_total = abs(b.payments.filter(amount__lt=0).aggregate(sum=Sum("amount"))['sum'] or Decimal('0'))
-        remaining = max(total - positive_paid - returns_total, 0)
-
-        b.returns_total = returns_total
-        b.positive_paid = positive_paid
-        b.remaining_amount = remaining
-
-        bills.append(b)
-
-    return render(request, 'customer_statement.html', 
+    response = await _arender(request, 'customer_statement.html',
  {
-        'bills': bills,
+        'rows_html': rows_html,
         'search_name': customer_name,
         'date_from': date_from,
         'date_to': date_to,
     })
+    response['X-Ledger-Cache'] = 'hit' if hit else 'miss'
+    return response
+
+
+# ---------------------------------------
+# Bill Register / Day Book (keyset pages, reports.register_*)
+# ---------------------------------------
+def _register_date(value):
+    try:
+        return parse_date(value.strip())
+    except ValueError:   # well formed but impossible, e.g. 2025-02-30
+        return None
+
+
+@login_required
+@reads_from_replica()
+def bill_register(request):
+    g = request.GET
+    amount = lambda name: parse_rupees(g[name], None) if g.get(name, '').strip() else None
+    filters = {
+        'date_from': _register_date(g.get('from', '')),
+        'date_to': _register_date(g.get('to', '')),
+        'status': g.get('status', ''),
+        'customer': g.get('customer', '').strip(),
+        'min_amount': amount('min'),
+        'max_amount': amount('max'),
+    }
+    qs = register_queryset(**filters)
+    page = register_page(qs, after=parse_cursor(g.get('after')), before=parse_cursor(g.get('before')),
+                         size=settings.REGISTER_PAGE_SIZE)
+    return render(request, 'bill_register.html', {
+        'groups': register_groups(qs, page.rows),
+        'page': page,
+        'filters': filters,
+    })
 
 
 # ---------------------------------------
@@ -285,30 +345,35 @@ def bill_detail(request, bill_id):
 # View Customers
 # ---------------------------------------
 @login_required
-def view_customers(request):
+@reads_from_replica()
+async def view_customers(request):
     q = request.GET.get('q', '').strip()
     customers = Customer.objects.all()
 
     if q:
-        customers = customers.filter(name__icontains=q) | customers.filter(phone__icontains=q)
+        customers = customers.filter(Q(name__icontains=q) | Q(phone__icontains=q))
+
+    # One grouped query instead of a bills query per customer
+    customers = customers.annotate(
+        bills_count=Count('bill'),
+        bills_total=Coalesce(Sum('bill__total_amount'), Value(0), output_field=MONEY),
+        bills_paid=Coalesce(Sum('bill__paid_amount'), Value(0), output_field=MONEY),
+    )
 
     customer_data = []
-    for c in customers:
-        bills = Bill.objects.filter(customer=c)
-        total_amount = sum((b.total_amount or Decimal('0')) for b in bills)
-        total_paid = sum((b.paid_amount or Decimal('0')) for b in bills)
+    async for c in customers.aiterator():
         customer_data.append({
             "id": c.id,
             "name": c.name,
             "phone": c.phone,
             "address": c.address,
-            "total_bills": bills.count(),
-            "total_amount": total_amount,
-            "total_paid": total_paid,
-            "total_remaining": total_amount - total_paid,
+            "total_bills": c.bills_count,
+            "total_amount": c.bills_total,
+            "total_paid": c.bills_paid,
+            "total_remaining": c.bills_total - c.bills_paid,
         })
 
-    return render(request, "view_customers.html", {"customers": customer_data, "q": q})
+    return await _arender(request, "view_customers.html", {"customers": customer_data, "q": q})
 
 
 
@@ -316,42 +381,54 @@ def view_customers(request):
 # Customer Detail
 # ---------------------------------------
 @login_required
-def customer_detail(request, customer_id):
-    customer = get_object_or_404(Customer, id=customer_id)
-    bills_qs = Bill.objects.filter(customer=customer).order_by('-date', '-bill_no')
-
-    bills = []
-    total_amt = total_paid = total_return = total_rem = Decimal('0.00')
-
-    for b in bills_qs:
-        total = Decimal(str(b.total_amount or 0))
-
-        positive_paid = b.payments.filter(amount__gt=0).aggregate(sum=Sum("amount"))['sum'] or Decimal('0')
-        returns_total = abs(b.payments.filter(amount__lt=0).aggregate(sum=Sum("amount"))['sum'] or Decimal('0'))
-
-        remaining = max(total - positive_paid - returns_total, 0)
-
-
-        b.amount_display = total
-        b.paid_display = positive_paid
-        b.return_display = returns_total        # 🔥 सही variable
-        b.remaining_display = remaining
+async def customer_detail(request, customer_id):
+    customer = await aget_object_or_404(Customer, id=customer_id)
+    key = make_key('customer_detail', customer.id, customer.ledger_version)
+
+    async def build_rows():
+        bills = await acustomer_bill_rows(customer)
+        totals = statement_totals(bills)
+        return {
+            "bills": bills,
+            "total_amount": totals["total_amount"],
+            "total_paid": totals["total_paid"],
+            "total_return": totals["total_returns"],
+            # Sum of the per-bill remainders (each clamped at zero)
+            "total_remaining": sum((b.remaining_amount for b in bills), ZERO),
+        }
+
+    async def build_html():
+        rows, _ = await aget_or_build('customer_detail.rows', key, build_rows)
+        return render_prefetched("customer_detail_bills.html", rows)
+
+    bills_html, hit = await aget_or_build('customer_detail.html', key, build_html)
+
+    response = await _arender(request, "customer_detail.html", {
+        "customer": customer,
+        "bills_html": bills_html,
+    })
+    response['X-Ledger-Cache'] = 'hit' if hit else 'miss'
+    return response
 
-        bills.append(b)
-        total_amt += total
-        total_paid += positive_paid
-        total_return += returns_total
-        total_rem += remaining
+# ---------------------------------------
+# Balance on a date (journal snapshot + tail)
+# ---------------------------------------
+@login_required
+def customer_balance(request, customer_id):
+    from .ledger import balance_on
 
-    return render(request, "customer_detail.html", {
-        "customer": customer,
-        "bills": bills,
-        "total_amount": total_amt,
-        "total_paid": total_paid,
-        "total_return": total_return,     # 🔥 summary में भी भेजा
-        "total_remaining": total_rem,
+    customer = get_object_or_404(Customer, id=customer_id)
+    day = parse_date(request.GET.get('on', '')) or timezone.localdate()
+    bal = balance_on(customer, day)
+    return JsonResponse({
+        "customer": customer.id,
+        "on": day.isoformat(),
+        "billed": str(bal.billed),
+        "paid": str(bal.paid),
+        "balance": str(bal.balance),
     })
 
+
 # ---------------------------------------
 # Return Bill
 # ---------------------------------------
@@ -360,10 +437,7 @@ def customer_detail(request, customer_id):
 def return_bill(request, bill_id):
     bill = get_object_or_404(Bill, id=bill_id)
 
-    try:
-        amount = Decimal(str(request.POST.get("amount") or 0))
-    except:
-        amount = Decimal("0")
+    amount = parse_rupees(request.POST.get("amount") or 0)
 
     note = (request.POST.get("note") or "").strip() or "Return"
 
@@ -380,7 +454,7 @@ def return_bill(request, bill_id):
             date=timezone.now()
         )
 
-        # Negative payment entry
+        # Negative payment entry (Payment.save keeps paid_amount to positive payments only)
         Payment.objects.create(
             bill=bill,
             amount=-amount,
@@ -388,14 +462,6 @@ def return_bill(request, bill_id):
             date=timezone.now()
         )
 
-        # Update paid_total ONLY with positive payments
-        positive_paid = bill.payments.filter(amount__gt=0).aggregate(sum=Sum('amount'))['sum'] or Decimal('0')
-        bill.paid_amount = positive_paid
-        bill.save(update_fields=['paid_amount'])
-
-        if bill.customer:
-            bill.customer.refresh_totals()
-
     messages.success(request, f"₹{amount} returned for Bill #{bill.bill_no}")
     return redirect("customer_detail", customer_id=bill.customer.id)
 # ---------------------------------------
@@ -419,9 +485,8 @@ def delete_bill(request, bill_id):
 def mark_bill_paid(request, bill_id):
     bill = get_object_or_404(Bill, id=bill_id)
 
-    total = Decimal(str(bill.total_amount or 0))
-    paid = Decimal(str(bill.paid_amount or 0))
-    remaining = total - paid
+    total = bill.total_amount or ZERO
+    remaining = total - (bill.paid_amount or ZERO)
 
     if remaining <= 0:
         messages.info(request, f"Bill #{bill.bill_no} is already fully paid.")
@@ -444,6 +509,42 @@ def mark_bill_paid(request, bill_id):
     return redirect(f"/customer/{bill.customer.id}/")
 
 
+# ---------------------------------------
+# Bulk actions on selected bills (customer page)
+# ---------------------------------------
+@login_required
+@require_POST
+def bulk_bill_action(request, customer_id):
+    customer = get_object_or_404(Customer, id=customer_id)
+    back = redirect("customer_detail", customer_id=customer.id)
+    bill_ids = [int(i) for i in request.POST.getlist("bills") if i.isdigit()]
+    action = request.POST.get("action")
+
+    if not bill_ids:
+        messages.info(request, "Select at least one bill.")
+        return back
+
+    if action == "print":
+        query = "&".join(f"bills={i}" for i in bill_ids)
+        return redirect(f"{reverse('two_invoices', args=[customer.id])}?{query}")
+
+    if action == "paid":
+        try:
+            paid_on = parse_date(request.POST.get("date") or "")   # blank = today
+        except ValueError:
+            return HttpResponseBadRequest("Invalid date")
+        done = bulk.mark_paid(customer, bill_ids, request.user, on=paid_on)
+        messages.success(request, f"{done.bills} bill(s) marked paid (₹{done.amount}).")
+        if done.skipped:
+            messages.info(request, f"{done.skipped} bill(s) were already fully paid.")
+    elif action == "delete":
+        done = bulk.delete_bills(customer, bill_ids)
+        messages.success(request, f"{done.bills} bill(s) deleted (₹{done.amount} taken off the ledger).")
+    else:
+        return HttpResponseBadRequest("Unknown action")
+    return back
+
+
 # ---------------------------------------
 # Login / Logout
 # ---------------------------------------
@@ -481,44 +582,41 @@ def add_items_generate(request, bill_id):
 @login_required
 def generate_bill(request, bill_id):
     bill = get_object_or_404(Bill, id=bill_id)
-    items = BillItem.objects.filter(bill=bill)
-
-    items_total = sum((item.total or Decimal('0.00')) for item in items)
-    packing_qty = int(bill.packing_qty or 0)
-    packing_rate = Decimal(str(bill.packing_rate or 0))
-    packing_reason = bill.packing_reason or "Packing"
-    packing_total = packing_qty * packing_rate
+    items = list(BillItem.objects.filter(bill=bill))
+    context = invoice_context(bill, items)
+    final_total = context['final_total']
 
-    extra_reason = bill.extra_reason or ""
-    extra_amount = Decimal(str(bill.extra_amount or 0))
-
-    final_total = items_total + packing_total + extra_amount
-
-    total_paid = sum((p.amount or Decimal('0.00')) for p in bill.payments.all())
+    total_paid = sum((p.amount or ZERO for p in bill.payments.all()), ZERO)
     bill.total_amount = final_total
     bill.paid_amount = min(total_paid, final_total)
     bill.save(update_fields=['total_amount', 'paid_amount'])
 
-    remaining = max(final_total - bill.paid_amount, Decimal('0.00'))
+    context['remaining'] = max(final_total - bill.paid_amount, ZERO)
+    return render(request, 'generate_bill.html', context)
 
-    return render(request, 'generate_bill.html', {
-        'bill': bill,
-        'items': items,
-        'items_total': items_total,
 
-        # 🔥 yeh 4 values packing reason line ke liye required hain
-        'packing_qty': packing_qty,
-        'packing_rate': packing_rate,
-        'packing_total': packing_total,
-        'packing_reason': packing_reason,
+# ---------------------------------------
+# Thermal receipt (ESC/POS bytes, bills/receipt.py)
+# ---------------------------------------
+@login_required
+def bill_receipt(request, bill_id):
+    bill = get_object_or_404(Bill.objects.select_related("customer"), id=bill_id)
+    data, _ = receipt.receipt_bytes(bill)
+    response = HttpResponse(data, content_type="application/octet-stream")
+    response["Content-Disposition"] = f'attachment; filename="receipt-{bill.bill_no}.bin"'
+    return response
 
-        # 🔥 Extra charges agar future me use ho
-        'extra_reason': extra_reason,
-        'extra_amount': extra_amount,
 
-        'final_total': final_total,
-        'remaining': remaining,
-    })
+@login_required
+@require_POST
+def print_receipt(request, bill_id):
+    bill = get_object_or_404(Bill.objects.select_related("customer"), id=bill_id)
+    data, cached = receipt.receipt_bytes(bill)
+    try:
+        receipt.send(data)
+    except (OSError, ValueError) as exc:
+        return JsonResponse({"ok": False, "error": str(exc)}, status=503)
+    return JsonResponse({"ok": True, "bytes": len(data), "cached": cached})
 
 
 @login_required
@@ -527,13 +625,15 @@ def add_customer(request):
         name = request.POST.get('name', '').strip()
         phone = request.POST.get('phone', '').strip()
         address = request.POST.get('address', '').strip()
+        gstin = request.POST.get('gstin', '').strip().upper()
+        state_code = request.POST.get('state_code', '').strip() or gstin[:2]
 
         if not name:
             messages.error(request, "Customer name is required.")
             return redirect('add_customer')
 
         try:
-            Customer.objects.create(name=name, phone=phone, address=address)
+            Customer.objects.create(name=name, phone=phone, address=address, gstin=gstin, state_code=state_code)
             messages.success(request, f"Customer '{name}' added successfully!")
             return redirect('create_bill')
         except IntegrityError:
@@ -548,12 +648,20 @@ def edit_customer(request, customer_id):
     customer = get_object_or_404(Customer, id=customer_id)
 
     if request.method == 'POST':
+        before = (customer.name, customer.phone)
         customer.name = request.POST.get('name', '').strip()
         customer.phone = request.POST.get('phone', '').strip()
         customer.address = request.POST.get('address', '').strip()
+        customer.gstin = request.POST.get('gstin', '').strip().upper()
+        customer.state_code = request.POST.get('state_code', '').strip() or customer.gstin[:2]
         customer.save()
 
         messages.success(request, f"Customer '{customer.name}' updated successfully!")
+        if (customer.name, customer.phone) != before:
+            # Existing bills still show the old name/phone; rewrite them in the background
+            queued = Job.objects.filter(kind="propagate_customer", status=Job.QUEUED, payload__customer_id=customer.id)
+            if not queued.exists():
+                jobs.enqueue("propagate_customer", {"customer_id": customer.id}, user=request.user)
         return redirect('view_customers')
 
     return render(request, 'edit_customer.html', {'customer': customer})
@@ -570,51 +678,88 @@ def delete_customer(request, customer_id):
 
     return render(request, "delete_customer.html", {"customer": customer})
 
+# ---------------------------------------
+# Duplicate customers + bills without a customer (staff review, bills/dedupe.py)
+# ---------------------------------------
+@login_required
+def customer_dedupe(request):
+    if not request.user.is_staff:
+        raise Http404
+
+    if request.method == "POST":
+        action = request.POST.get("action")
+        if action == "scan":
+            job = jobs.enqueue("dedupe_scan", user=request.user)
+            messages.success(request, f"Scan queued as job #{job.id} — reload this page when it is done.")
+            return redirect("customer_dedupe")
+
+        ids = [int(x) for x in request.POST.getlist("proposal_ids") if x.isdigit()]
+        chosen = MergeProposal.objects.filter(id__in=ids, status=MergeProposal.PENDING)
+        if not ids:
+            messages.warning(request, "No proposals selected.")
+        elif action == "reject":
+            messages.success(request, f"{dedupe.reject(chosen, request.user)} proposal(s) rejected.")
+        elif action == "apply":
+            job = jobs.enqueue("dedupe_apply", {"proposal_ids": ids}, user=request.user)
+            messages.success(request, f"Applying {len(ids)} proposal(s) as job #{job.id}.")
+            return redirect("jobs_list")
+        return redirect("customer_dedupe")
+
+    proposals = list(MergeProposal.objects.filter(status=MergeProposal.PENDING).select_related("target")[:500])
+    sources = Customer.objects.in_bulk([cid for p in proposals for cid in p.sources])
+    for p in proposals:
+        p.source_customers = [sources[cid] for cid in p.sources if cid in sources]
+    return render(request, "customer_dedupe.html", {
+        "proposals": proposals,
+        "pending": MergeProposal.objects.filter(status=MergeProposal.PENDING).count(),
+    })
+
+
 @login_required
 def two_invoices_view(request, customer_id):
     """
-    Customer के दो invoice एक ही page पर show करने के लिए:
-    Left → Latest Bill details
-    Right → Return (RK) Records
+    Customer के bills side by side print करने के लिए:
+    ?bills=<id>&bills=<id> → चुने हुए bills (default: latest bill)
+    नीचे Return (RK) records, पन्नों में (?page=N)
     """
-    from decimal import Decimal
     customer = get_object_or_404(Customer, id=customer_id)
 
-    # Latest Bill (Left side)
-    bill = Bill.objects.filter(customer=customer).order_by('-date', '-id').first()
-    items = BillItem.objects.filter(bill=bill) if bill else []
-
-    items_total = sum((item.total or Decimal('0')) for item in items)
-    packing_total = (bill.packing_qty or 0) * (bill.packing_rate or 0) if bill else 0
-    extra_amount = Decimal(str(bill.extra_amount or 0)) if bill else 0
-    final_total = items_total + packing_total + extra_amount
-
-    # RK (Return) Records (Right side)
-    returns = BillReturn.objects.filter(bill__customer=customer).order_by('-date')
-    rk_lines = [{"desc": f"Return - Bill #{r.bill.bill_no} ({r.note})", "amount": r.amount} for r in returns]
-    rk_total = sum((r.amount for r in returns), Decimal('0'))
+    ids = [int(x) for x in request.GET.getlist("bills") if x.isdigit()]
+    bills_qs = (
+        Bill.objects.filter(customer=customer)
+        .prefetch_related(Prefetch("items", queryset=BillItem.objects.order_by("id")))   # one query for all bills
+        .order_by("-date", "-id")
+    )
+    bills_qs = bills_qs.filter(id__in=ids) if ids else bills_qs[:1]
+    invoices = [invoice_context(bill, list(bill.items.all())) for bill in bills_qs]
+
+    # RK (Return) Records: only the requested page is loaded, bill_no via JOIN
+    returns = BillReturn.objects.filter(bill__customer=customer).select_related("bill").order_by("-date", "-id")
+    rk_total = returns.aggregate(s=Sum("amount"))["s"] or ZERO
+    rk_page = Paginator(returns, settings.PRINT_RETURNS_PER_PAGE).get_page(request.GET.get("page"))
+    rk_lines = [{"desc": f"Return - Bill #{r.bill.bill_no} ({r.note})", "date": r.date, "amount": r.amount}
+                for r in rk_page]
+
+    query = request.GET.copy()
+    query.pop("page", None)
 
     context = {
         "customer": customer,
-        "bill": bill,
-        "items": items,
-        "items_total": items_total,
-        "packing_total": packing_total,
-        "extra_amount": extra_amount,
-        "final_total": final_total,
+        "invoices": invoices,
         "rk_lines": rk_lines,
+        "rk_page": rk_page,
         "rk_total": rk_total,
+        "base_query": query.urlencode(),
     }
     return render(request, "generate_bill_double.html", context)
+
+
 @login_required
 @require_POST
 def pay_bill(request, bill_id):
     bill = get_object_or_404(Bill, id=bill_id)
 
-    try:
-        amount = Decimal(str(request.POST.get("amount") or 0))
-    except:
-        amount = Decimal("0")
+    amount = parse_rupees(request.POST.get("amount") or 0)
 
     note = (request.POST.get("note") or "").strip()
 
@@ -646,3 +791,294 @@ def pay_bill(request, bill_id):
     messages.success(request, f"₹{amount} received successfully for Bill #{bill.bill_no}")
     return redirect("customer_detail", customer_id=bill.customer.id)
 
+
+
+# ---------------------------------------
+# Bank / UPI statement reconciliation (staff, bills/reconcile.py)
+# ---------------------------------------
+@login_required
+def bank_statements(request):
+    if not request.user.is_staff:
+        raise Http404
+
+    if request.method == "POST":
+        upload = request.FILES.get("statement")
+        if upload is None:
+            messages.error(request, "Choose the bank / UPI CSV export first.")
+            return redirect("bank_statements")
+        statement = reconcile.import_statement(upload, upload.name, user=request.user)
+        if not statement.lines:
+            messages.warning(request, f"No new credits found in {upload.name} "
+                                      f"({statement.duplicates} already imported).")
+        else:
+            job = jobs.enqueue("bank_match", {"statement_id": statement.id}, user=request.user)
+            messages.success(request, f"{statement.lines} credit(s) imported; matching as job #{job.id}.")
+        return redirect("bank_statement", statement_id=statement.id)
+
+    return render(request, "bank_statements.html", {"statements": BankStatement.objects.all()[:50]})
+
+
+@login_required
+def bank_statement(request, statement_id):
+    if not request.user.is_staff:
+        raise Http404
+    statement = get_object_or_404(BankStatement, id=statement_id)
+
+    if request.method == "POST":
+        action = request.POST.get("action")
+        ids = [int(x) for x in request.POST.getlist("line_ids") if x.isdigit()]
+        if action == "match":
+            job = jobs.enqueue("bank_match", {"statement_id": statement.id}, user=request.user)
+            messages.success(request, f"Matching again as job #{job.id}.")
+        elif action == "post_above":
+            try:
+                min_score = float(request.POST.get("min_score") or 0.9)
+            except ValueError:
+                min_score = 0.9
+            job = jobs.enqueue("bank_post", {"statement_id": statement.id, "min_score": min_score}, user=request.user)
+            messages.success(request, f"Posting every proposal scoring {min_score:.2f}+ as job #{job.id}.")
+        elif not ids:
+            messages.warning(request, "No lines selected.")
+        elif action == "post":
+            job = jobs.enqueue("bank_post", {"line_ids": ids}, user=request.user)
+            messages.success(request, f"Posting {len(ids)} line(s) as job #{job.id}.")
+        elif action == "ignore":
+            count = statement.bank_lines.filter(id__in=ids).exclude(status=BankLine.POSTED).update(
+                status=BankLine.IGNORED, allocations=[])
+            messages.success(request, f"{count} line(s) ignored.")
+        return redirect(f"{reverse('bank_statement', args=[statement.id])}?status={request.GET.get('status', '')}")
+
+    status = request.GET.get("status") or BankLine.PROPOSED
+    lines = statement.bank_lines.filter(status=status).select_related("customer").order_by("-score", "line_no")
+    page = Paginator(lines, 200).get_page(request.GET.get("page"))
+    bill_nos = dict(Bill.objects.filter(id__in={b for line in page for b, _ in line.allocations})
+                    .values_list("id", "bill_no"))
+    for line in page:
+        line.bills = [(bill_id, bill_nos.get(bill_id, "?"), rupees(take)) for bill_id, take in line.allocations]
+    counts = dict(statement.bank_lines.order_by().values_list("status").annotate(n=Count("id")))
+    return render(request, "bank_statement.html", {
+        "statement": statement,
+        "page": page,
+        "status": status,
+        "tabs": [(value, label, counts.get(value, 0)) for value, label in BankLine.STATUS_CHOICES],
+    })
+
+
+# ---------------------------------------
+# Background jobs (exports, PDFs, ledger rebuild)
+# ---------------------------------------
+def _job_json(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "note": job.progress_note,
+        "attempts": job.attempts,
+        "result": job.result,
+        "download_url": reverse("job_download", args=[job.id]) if job.result_file else None,
+        "error": job.error.strip().splitlines()[-1] if job.error else None,
+        "created_at": job.created_at.isoformat(),
+    }
+
+
+@login_required
+def jobs_list(request):
+    job_qs = Job.objects.all() if request.user.is_staff else Job.objects.filter(created_by=request.user)
+    return render(request, "jobs.html", {"jobs": job_qs[:50]})
+
+
+@login_required
+@require_POST
+def enqueue_job(request, kind):
+    if kind not in ("statement_csv", "bills_pdf", "rebuild_ledger"):
+        return HttpResponseBadRequest("Unknown job")
+    if kind == "rebuild_ledger" and not request.user.is_staff:
+        return HttpResponseBadRequest("Staff only")
+
+    if kind == "bills_pdf":
+        payload = {"bill_ids": [int(x) for x in request.POST.getlist("bill_ids") if x.isdigit()]}
+    else:
+        payload = {k: request.POST.get(k, "").strip() for k in ("customer_name", "from", "to") if request.POST.get(k)}
+
+    job = jobs.enqueue(kind, payload, user=request.user)
+    if request.headers.get("Accept") == "application/json":
+        return JsonResponse(_job_json(job), status=202)
+
+    messages.success(request, f"Job #{job.id} queued — download it here when ready.")
+    return redirect("jobs_list")
+
+
+def _visible_job(request, job_id):
+    job = get_object_or_404(Job, id=job_id)
+    if not request.user.is_staff and job.created_by_id != request.user.id:
+        raise Http404
+    return job
+
+
+@login_required
+def job_status(request, job_id):
+    return JsonResponse(_job_json(_visible_job(request, job_id)))
+
+
+@login_required
+def job_download(request, job_id):
+    job = _visible_job(request, job_id)
+    if job.status != Job.DONE or not job.result_file or not os.path.exists(job.result_file):
+        raise Http404
+    return FileResponse(open(job.result_file, "rb"), as_attachment=True,
+                        filename=os.path.basename(job.result_file).split("-", 1)[-1])
+
+
+# ---------------------------------------
+# Report cache hit/miss counters (this process)
+# ---------------------------------------
+@login_required
+def cache_stats_view(request):
+    if not request.user.is_staff:
+        raise Http404
+    return JsonResponse(cache_stats())
+
+
+# ---------------------------------------
+# Saved request profiles (staff; add ?_profile=1 to any page to record one)
+# ---------------------------------------
+@login_required
+def profiles_view(request):
+    if not request.user.is_staff:
+        raise Http404
+    profiles = RequestProfile.objects.select_related("user").defer("folded", "summary")[:100]
+    return render(request, "profiles.html", {"profiles": profiles})
+
+
+@login_required
+def profile_detail(request, profile_id):
+    if not request.user.is_staff:
+        raise Http404
+    profile = get_object_or_404(RequestProfile, id=profile_id)
+    samples = profile.samples or 1
+    categories = [
+        {"name": name, "samples": count, "share": round(100 * count / samples, 1)}
+        for name, count in profile.summary.get("categories", {}).items()
+    ]
+    return render(request, "profile_detail.html", {
+        "profile": profile,
+        "categories": categories,
+        "top_self": [(label, count, round(100 * count / samples, 1))
+                     for label, count in profile.summary.get("top_self", [])],
+        "top_total": [(label, count, round(100 * count / samples, 1))
+                      for label, count in profile.summary.get("top_total", [])],
+        "boxes": profiling.flame_boxes(profile.folded),
+    })
+
+
+@login_required
+def profile_download(request, profile_id):
+    if not request.user.is_staff:
+        raise Http404
+    profile = get_object_or_404(RequestProfile, id=profile_id)
+    response = HttpResponse(profile.folded + "\n", content_type="text/plain; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="profile-{profile.id}.folded"'
+    return response
+
+
+# ---------------------------------------
+# Product master: line-entry lookup + item sales
+# ---------------------------------------
+@login_required
+def product_lookup(request):
+    started = time.perf_counter()
+    q = request.GET.get("q", "")
+    try:
+        limit = min(int(request.GET.get("limit", 10)), 50)
+    except ValueError:
+        limit = 10
+    response = JsonResponse({"results": catalog.lookup(q, limit)})
+    response["X-Lookup-Micros"] = int((time.perf_counter() - started) * 1_000_000)
+    return response
+
+
+@login_required
+def product_sales_view(request):
+    rows = product_sales(request.GET.get("from", "").strip(), request.GET.get("to", "").strip())
+    return JsonResponse({"products": [
+        {**row, "amount": str(row["amount"] or 0)} for row in rows
+    ]})
+
+
+# ---------------------------------------
+# GSTR-1 style monthly export (?month=YYYY-MM, &format=csv&section=b2b|b2cl|b2cs|hsn)
+# ---------------------------------------
+@login_required
+def gstr1_export(request):
+    from datetime import timedelta
+
+    month = request.GET.get("month", "").strip() or timezone.localdate().strftime("%Y-%m")
+    start = parse_date(f"{month}-01")
+    if start is None:
+        return HttpResponseBadRequest("month must be YYYY-MM")
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+    report = gst.gstr1(start, end)
+
+    if request.GET.get("format") != "csv":
+        return JsonResponse(report)
+
+    section = request.GET.get("section", "b2b")
+    if section not in gst.SECTIONS:
+        return HttpResponseBadRequest("Unknown section")
+    response = HttpResponse(content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="gstr1-{month}-{section}.csv"'
+    csv.writer(response).writerows(gst.section_rows(report, section))
+    return response
+
+
+# ---------------------------------------
+# Sales analytics (bills/analytics.py)
+# ---------------------------------------
+def _analytics_limit(request):
+    try:
+        return max(1, min(int(request.GET.get("top", 10)), 100))
+    except ValueError:
+        return 10
+
+
+@login_required
+@reads_from_replica()
+def analytics_dashboard(request):
+    return render(request, "analytics.html", {"data": analytics.summary(_analytics_limit(request))})
+
+
+@login_required
+@reads_from_replica()
+def analytics_json(request):
+    return JsonResponse(analytics.summary(_analytics_limit(request)))
+
+
+# ---------------------------------------
+# Offline POS sync, central server side (bills/sync.py)
+# Terminals call these from `manage.py sync_terminal`.
+# ---------------------------------------
+@sync.endpoint
+def sync_pull(request, terminal, body):
+    limit = sync.int_field(body, "limit", settings.SYNC_BATCH, 1, 5 * settings.SYNC_BATCH)
+    return sync.changes_since(sync.int_field(body, "cursor", 0), limit, terminal)
+
+
+@sync.endpoint
+def sync_push(request, terminal, body):
+    changes = body.get("changes") or []
+    if not isinstance(changes, list) or not all(
+        isinstance(c, dict) and {"model", "sync_id", "op", "version"} <= c.keys()
+        and (c["op"] == ChangeLog.DELETE or isinstance(c.get("data"), dict))
+        for c in changes
+    ):
+        raise sync.BadRequest("'changes' must be a list of {model, sync_id, op, version, data} objects.")
+    return sync.apply_push(terminal, changes)
+
+
+@sync.endpoint
+def sync_reserve(request, terminal, body):
+    size = sync.int_field(body, "size", settings.SYNC_BLOCK_SIZE, 1, 10 * settings.SYNC_BLOCK_SIZE)
+    block = BillNumberBlock.reserve(terminal, size)
+    return {"start": block.start, "end": block.end}
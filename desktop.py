@@ -0,0 +1,163 @@
+"""
+Desktop mode: runs the Django app in-process and shows it in a pywebview window.
+
+    python desktop.py                    # open the app window
+    python desktop.py --headless         # server only (open the printed URL in a browser)
+    python desktop.py --headless --exit  # print the startup timeline and quit
+
+Packaged build:
+
+    pyinstaller --name BillingERP --add-data "templates:templates" --add-data "static:static" desktop.py
+
+When frozen, the database lives next to the executable (BILLING_DB_PATH).
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+T0 = time.perf_counter()
+TIMELINE = []
+
+
+def mark(label):
+    TIMELINE.append((label, time.perf_counter() - T0))
+
+
+def print_timeline():
+    for label, seconds in TIMELINE:
+        print(f"  {seconds * 1000:8.1f} ms  {label}", file=sys.stderr)
+
+
+# ---------------------------------------
+# Startup steps
+# ---------------------------------------
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'billing_erp.settings')
+    if getattr(sys, 'frozen', False):
+        # PyInstaller unpacks code to a temp dir; keep the data with the .exe
+        os.environ.setdefault('BILLING_DB_PATH', os.path.join(os.path.dirname(sys.executable), 'db.sqlite3'))
+
+    import django
+    django.setup()
+    mark('django.setup()')
+
+    from django.conf import settings
+    if not os.path.exists(settings.DATABASES['default']['NAME']):
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+        mark('first run: database created')
+
+
+def warm_templates():
+    """Compile every template into the cached loader so no page pays for it."""
+    from django.conf import settings
+    from django.template.loader import get_template
+
+    count = 0
+    for folder in settings.TEMPLATES[0]['DIRS']:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith('.html'):
+                    rel = os.path.relpath(os.path.join(root, name), folder).replace(os.sep, '/')
+                    try:
+                        get_template(rel)
+                        count += 1
+                    except Exception:
+                        pass
+    mark(f'templates compiled ({count}, background)')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port):
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    from django.contrib.staticfiles.handlers import StaticFilesHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class Server(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    app = StaticFilesHandler(get_wsgi_application())
+    httpd = make_server('127.0.0.1', port, app, server_class=Server, handler_class=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    mark(f'server listening on :{port}')
+    return httpd
+
+
+def first_page(url):
+    from urllib.request import urlopen
+
+    with urlopen(url + 'login/') as response:
+        response.read()
+    mark('first page served')
+
+
+def heavy_modules_note():
+    loaded = [m for m in ('numpy', 'weasyprint') if m in sys.modules]
+    mark(f"heavy modules loaded: {', '.join(loaded) or 'none (deferred to first use)'}")
+
+
+# ---------------------------------------
+# Entry point
+# ---------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Billing ERP desktop launcher')
+    parser.add_argument('--headless', action='store_true', help='Do not open a window')
+    parser.add_argument('--exit', action='store_true', help='With --headless: quit after the first page')
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    warmer = threading.Thread(target=warm_templates, daemon=True)
+    warmer.start()
+
+    port = args.port or free_port()
+    url = f'http://127.0.0.1:{port}/'
+    httpd = start_server(port)
+
+    if args.headless:
+        first_page(url)
+        heavy_modules_note()
+        print_timeline()
+        if args.exit:
+            warmer.join()
+            httpd.shutdown()
+            return
+        print(f'Serving {url} (Ctrl+C to stop)', file=sys.stderr)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            httpd.shutdown()
+        return
+
+    import webview
+    mark('pywebview imported')
+
+    window = webview.create_window('Billing ERP', url, width=1280, height=800)
+
+    def on_loaded():
+        mark('window loaded')
+        heavy_modules_note()
+        print_timeline()
+        window.events.loaded -= on_loaded
+
+    window.events.loaded += on_loaded
+    webview.start()
+    httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()